@@ -0,0 +1,67 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import config
+
+import shutil
+import tempfile
+
+# checks that tables don't keep bufferpool frames pinned between queries. every table that has been updated used to
+# keep its tail page pinned, so enough tables (or one table with a small quota) ran the bufferpool out of frames
+
+number_of_tables = 20 # more tables with a tail page than the default bufferpool has room for
+number_of_columns = 20
+number_of_records = 100
+
+def pinned_frames(db: Database) -> int:
+    return sum(1 for entry in db.bpool.entries if entry is not None and entry.pin_count > 0)
+
+path = tempfile.mkdtemp()
+db = Database()
+db.open(path)
+
+# many tables, one tail page each
+tables = []
+for t in range(number_of_tables):
+    table = db.create_table('Table' + str(t), number_of_columns, 0)
+    query = Query(table)
+    query.insert(*([t] + [0] * (number_of_columns - 1)))
+    query.update(t, *([None, 1] + [None] * (number_of_columns - 2)))
+    tables.append(table)
+for t, table in enumerate(tables):
+    record = Query(table).select(t, 0, [1] * number_of_columns)[0]
+    assert record.columns[1] == 1, f"table {t} read {record.columns[1]}"
+assert not pinned_frames(db), "frames are still pinned"
+print("many tables passed")
+
+# one table whose quota is the smallest set_table_quota accepts
+table = db.create_table('Small', number_of_columns, 0)
+db.set_table_quota('Small', max_memory=table.total_columns * config.PHYSICAL_PAGE_SIZE)
+query = Query(table)
+for key in range(number_of_records):
+    query.insert(*([key] + [key] * (number_of_columns - 1)))
+for key in range(number_of_records):
+    query.update(key, *([None, key + 1] + [None] * (number_of_columns - 2)))
+for key in range(number_of_records):
+    record = query.select(key, 0, [1] * number_of_columns)[0]
+    assert record.columns[1] == key + 1, f"key {key} read {record.columns[1]}"
+for key in range(number_of_records, 2 * number_of_records):
+    query.insert(*([key] + [key] * (number_of_columns - 1)))
+    query.delete(key)
+assert not pinned_frames(db), "frames are still pinned"
+print("minimum quota passed")
+
+db.close()
+shutil.rmtree(path)
+
+# partitions too small for two pages of a table are refused when the table is created
+path = tempfile.mkdtemp()
+db = Database()
+db.open(path, memory_budget=64 * config.PHYSICAL_PAGE_SIZE, partitions=4)
+try:
+    db.create_table('Grades', 5, 0)
+    assert False, "a table that doesn't fit the partitions was created"
+except ValueError:
+    pass
+db.close()
+shutil.rmtree(path)
+print("small partitions passed")
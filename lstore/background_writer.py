@@ -0,0 +1,55 @@
+from __future__ import annotations
+import threading
+import typing
+
+from lstore.config import config
+
+if typing.TYPE_CHECKING:
+	from lstore.bufferpool import Bufferpool, BufferpoolIndex
+
+# Writes dirty bufferpool frames to disk in the background, so that when a frame is picked for eviction it is
+# usually clean already and the query that needs the frame doesn't have to wait for a write.
+# Every `interval` seconds the writer checks what share of the frames is dirty. Below `dirty_ratio_low` it does
+# nothing; otherwise it writes up to `max_pages_per_round` unpinned dirty frames. Above `dirty_ratio_high` it
+# keeps going without sleeping until the ratio drops again.
+class BackgroundWriter(threading.Thread):
+	def __init__(self, bufferpool: Bufferpool, interval: float = config.BACKGROUND_WRITER_INTERVAL, max_pages_per_round: int = config.BACKGROUND_WRITER_MAX_PAGES, dirty_ratio_low: float = config.BACKGROUND_WRITER_DIRTY_RATIO_LOW, dirty_ratio_high: float = config.BACKGROUND_WRITER_DIRTY_RATIO_HIGH) -> None:
+		super().__init__(name="bufferpool-background-writer", daemon=True)
+		self.bufferpool = bufferpool
+		self.interval = interval
+		self.max_pages_per_round = max_pages_per_round
+		self.dirty_ratio_low = dirty_ratio_low
+		self.dirty_ratio_high = dirty_ratio_high
+		self.cursor = 0 # where the next round starts looking for dirty frames
+		self.pages_written = 0
+		self.stop_event = threading.Event()
+
+	def run(self) -> None:
+		while not self.stop_event.is_set():
+			dirty_ratio = self.bufferpool.dirty_frame_count() / len(self.bufferpool.entries)
+			written = 0
+			if dirty_ratio >= self.dirty_ratio_low:
+				written = self.write_round()
+			if dirty_ratio < self.dirty_ratio_high or written == 0:
+				self.stop_event.wait(self.interval)
+
+	# writes up to max_pages_per_round dirty frames, continuing from where the last round stopped. returns the number written
+	def write_round(self) -> int:
+		num_frames = len(self.bufferpool.entries)
+		candidates: list[BufferpoolIndex] = []
+		for _ in range(num_frames):
+			if len(candidates) >= self.max_pages_per_round or self.stop_event.is_set():
+				break
+			buff_idx = self.cursor
+			self.cursor = (self.cursor + 1) % num_frames
+			entry = self.bufferpool.entries[buff_idx]
+			if entry is None or not entry.dirty_bit or entry.pin_count > 0:
+				continue
+			candidates.append(buff_idx) # type: ignore[arg-type]
+		written = self.bufferpool.write_back(candidates) # written together, so neighbouring pages are coalesced
+		self.pages_written += written
+		return written
+
+	def stop(self) -> None:
+		self.stop_event.set()
+		self.join()
@@ -1,29 +1,45 @@
 from __future__ import annotations
 from codecs import ascii_encode
-from collections import namedtuple
+from collections import deque, namedtuple
+from contextlib import contextmanager
 from curses import raw
 from functools import reduce
-import pickle
 import stat
 import struct
+import threading
 import time
 from types import FunctionType
 import typing
 import glob
 import os
+import re
 from lstore.index import Index
 from lstore.page_directory_entry import RID, BaseMetadataPageID, BasePageID, BaseRID, BaseTailPageID, MetadataPageID, PageDirectoryEntry, PageID, TailMetadataPageID, TailPageID, TailRID
 from lstore.ColumnIndex import DataIndex, RawIndex
 from lstore.config import FullMetadata, WriteSpecifiedBaseMetadata, WriteSpecifiedTailMetadata, config
 from lstore.helper import helper
 from lstore.record_physical_page import PhysicalPage, Record
-from typing import Any, List, Literal, NamedTuple, Sequence, Tuple, Type, TypeAlias, TypeGuard, TypeVar, Generic, Annotated, cast, get_args
+from lstore.replacement_policy import ReplacementPolicy, make_replacement_policy
+from lstore.background_writer import BackgroundWriter
+from lstore.file_descriptor_cache import FileDescriptorCache
+from lstore.mapped_file_cache import MappedFileCache
+from lstore.readahead import Readahead
+from lstore.bufferpool_stats import BufferpoolStats
+from lstore.latch import RWLatch, latch_frames
+from lstore.column_vector import HAS_NUMPY, PageColumns, page_vector
+from lstore.wal import WAL_INSERT, WAL_WRITE, WriteAheadLog
+from lstore.segment_file import STORAGE_PAGE_FILES, STORAGE_SEGMENTS, SegmentLayout
+from lstore.page_directory import ADDRESSING_ARITHMETIC, ADDRESSING_DIRECTORY, ArrayPageDirectory
+from typing import Any, Iterator, List, Literal, NamedTuple, Sequence, Tuple, Type, TypeAlias, TypeGuard, TypeVar, Generic, Annotated, cast, get_args
 
 TPageType = Literal["base", "tail", "base_metadata", "tail_metadata"]
 class BufferpoolIndex(int):
 	pass
 
 TNOT_FOUND = Literal[-1]
+# (table name, page id type, page id, physical page index). the page id type is part of the key
+# because a BasePageID and a TailPageID (or a metadata page ID) can share the same integer value
+FrameKey = Tuple[str, type, int, int]
 class BufferpoolRecordSearchResult(NamedTuple):
 	found: bool 
 	data_buff_indices: List[None | TNOT_FOUND | BufferpoolIndex]
@@ -35,6 +51,11 @@ class BufferpoolPageSearchResult(NamedTuple):
 	data_buff_indices: List[None | TNOT_FOUND | BufferpoolIndex]
 	metadata_buff_indices: List[TNOT_FOUND | BufferpoolIndex]
 
+# a table's share of the bufferpool, in frames. see Bufferpool.set_table_quota
+class TableQuota(NamedTuple):
+	reserved_frames: int
+	max_frames: int | None
+
 class FilePageReadResult(NamedTuple):
 	metadata_physical_pages: list[PhysicalPage | None]
 	data_physical_pages: list[PhysicalPage | None]
@@ -55,6 +76,7 @@ class BufferpoolEntry:
 		self.physical_page_id = physical_page_id
 		self.physical_page_index = physical_page_index
 		self.table = table
+		self.page_lsn = 0 # LSN of the last logged change to the page; the log has to be flushed up to it before the page is written
 
 # NOTE: all classes that start with PB* are PseudoBuffIntValues with a specific int type
 # for example PBBaseRID is a PseudoBuffIntValue class that returns a BaseRID. 
@@ -65,9 +87,10 @@ class PsuedoBuffIntValue:
 		self.flushed = False
 		self.dirty = False
 		self.page_sub_path = page_sub_path
-		self.page_paths = [file_handler.page_path(page_sub_path)]
+		page_path, file_position = file_handler.file_location(page_sub_path, byte_position)
+		self.page_paths = [page_path]
 		self.file_handler = file_handler
-		self.byte_positions = [byte_position]
+		self.byte_positions = [file_position]
 		self._value = file_handler.read_int_value(page_sub_path, byte_position)
 	
 	def flush(self) -> None:
@@ -76,6 +99,13 @@ class PsuedoBuffIntValue:
 				self.file_handler.write_position(self.page_paths[i], self.byte_positions[i], self._value)
 		self.flushed = True
 	
+	# writes the value like flush() does, but the value stays usable. used by checkpoints
+	def checkpoint(self) -> None:
+		if self.dirty and not self.flushed:
+			self.dirty = False
+			for i in range(len(self.page_paths)):
+				self.file_handler.write_position(self.page_paths[i], self.byte_positions[i], self._value)
+
 	def value(self, increment: int=0) -> int:
 		val = self._value
 		if self.flushed:
@@ -91,8 +121,9 @@ class PsuedoBuffIntValue:
 
 	# will flush the value to memory to THIS location also. 
 	def add_flush_location(self, page_sub_path: PageID | Literal["catalog"], byte_position: int) -> None:
-		self.page_paths.append(self.file_handler.page_path(page_sub_path))
-		self.byte_positions.append(byte_position)
+		page_path, file_position = self.file_handler.file_location(page_sub_path, byte_position)
+		self.page_paths.append(page_path)
+		self.byte_positions.append(file_position)
 
 	def __del__(self) -> None: # ensure that the value was flushed, if it was dirty
 		if not self.flushed and self.dirty:
@@ -174,60 +205,40 @@ class PBTailRID(PsuedoBuffIntValue):
 			self.dirty = True
 		return TailRID(val)
 
-U = TypeVar('U')
-V = TypeVar('V')
-class PseudoBuffDictValue(Generic[U, V]):
-	def __init__(self, file_handler: FileHandler, page_sub_path: Literal["page_directory", "indices"]):
-		self.page_sub_path = page_sub_path
-		self.page_path = file_handler.page_path(page_sub_path)
-		self.file_handler = file_handler
-		self._value = file_handler.read_dict_value(page_sub_path)
-		self.flushed = False
-		self.dirty = False
-		
-	def flush(self) -> None:
-		with open(self.page_path, "w+b") as handle:
-			pickle.dump(self._value, handle)
-		handle.close()
-		self.flushed = True
-	
-	def value_get(self) -> dict[U, V]:
-		if self.flushed:
-			raise(Exception("PseudoBuffDictValues can only be flushed once; tried to get value after flush"))
-		return self._value
-	
-	def __getitem__(self, key: U) -> V:
-		if self.flushed:
-			raise(Exception("PseudoBuffDictValues can only be flushed once; tried to get value after flush"))
-		return self._value[key]
-	
-	def value_assign(self, new_key: U, new_value: V) -> dict[U, V]:
-		if self.flushed:
-			raise(Exception("PseudoBuffDictValues can only be flushed once; tried to set value after flush"))
-		self.dirty = True
-		self._value[new_key] = new_value
-		return self._value
-	
-	def __del__(self) -> None:
-		if not self.flushed and self.dirty:
-			raise(Exception("unflushed dict buffer value "))
-
 
 class FileHandler:
-	def __init__(self, table: Table) -> None: # path is the database-level path
+	def __init__(self, table: Table, migrate_storage: bool = False) -> None: # path is the database-level path
 		# NOTE: these next_*_id variables represent the *next* id to be written, not necessarily the last one. the last 
 		# written id is the next_*_id variable minus 1
 		self.table = table
 		self.table_path = os.path.join(table.db_path, self.table.name)
 		self.is_flushed = False
+		self.fd_cache = FileDescriptorCache() # every read and write of this table's page and catalog files goes through here
+		# with the "mmap" I/O backend, physical pages brought into the bufferpool are views into these mappings
+		self.mapped_files: MappedFileCache | None = MappedFileCache() if table.db_bpool.io_backend == "mmap" else None
+		self.metadata_page_ids: dict[tuple[type, int], MetadataPageID] = {} # the metadata page each base/tail page points to
+		self.insert_lock = threading.RLock()
+
+		self.segment_lock = threading.Lock() # creating segment files and claiming their slots
 
 		## FILE INITIALIZATION
-		if not os.path.isfile(self.table_file_path("catalog")): # if the catalog file exists, all other files should also exist..
+		new_table = not os.path.isfile(self.table_file_path("catalog")) # if the catalog file exists, all other files should also exist..
+		if new_table:
 			self.initialize_table_files() # catalog, index, page_directory
-			self.initialize_base_tail_page(BasePageID(1), BaseMetadataPageID(1)) # first metadata ID is 1
-			self.initialize_base_tail_page(TailPageID(1), TailMetadataPageID(1)) # first metadata ID is 1
+		# with the segment format, pages are stored in one file per page range (see segment_file.py)
+		self.segments: SegmentLayout | None = None
+		if self.read_int_value("catalog", config.byte_position.catalog.STORAGE_FORMAT) == STORAGE_SEGMENTS:
+			self.segments = SegmentLayout(self.table.num_columns)
+			for file_name in os.listdir(self.table_path):
+				if re.fullmatch(r"segment_\d+", file_name):
+					self.segments.check(os.path.join(self.table_path, file_name))
+		if new_table:
 			self.initialize_metadata_file(BaseMetadataPageID(1))
 			self.initialize_metadata_file(TailMetadataPageID(1))
+			self.initialize_base_tail_page(BasePageID(1), BaseMetadataPageID(1)) # first metadata ID is 1
+			self.initialize_base_tail_page(TailPageID(1), TailMetadataPageID(1)) # first metadata ID is 1
+		elif self.segments is None and migrate_storage:
+			self.migrate_to_segments()
 		## END FILE INIT
 		
 		self.next_base_page_id = PBBasePageID(self, "catalog", config.byte_position.catalog.LAST_BASE_PAGE_ID)
@@ -243,6 +254,7 @@ class FileHandler:
 		self.base_offset.add_flush_location(BaseMetadataPageID(self.next_base_metadata_page_id.value()), config.byte_position.metadata.OFFSET) # flush the offset in the corresponding metadata file along with the base file
 		self.tail_offset = PsuedoBuffIntValue(self, TailPageID(self.next_tail_page_id.value()), config.byte_position.base_tail.OFFSET) # the current offset is based on the last written page
 	
+	# the names of the per-page files of the STORAGE_PAGE_FILES format
 	def base_path(self, base_page_id: BasePageID) -> str:
 		return os.path.join(self.table_path, f"base_{base_page_id}")
 	
@@ -255,15 +267,12 @@ class FileHandler:
 
 	# this calculated property gives the path for a "table file". 
 	# Table files are files which apply to the entire table. These files are, as of now, 
-	# "catalog", "page_directory.pickle", and "indices.pickle". The page directory and indices
-	# files are only specified by their names (even though they will be persisted separately with pickle)
+	# "catalog", "page_directory" (see page_directory.py), and "indices" (see Index.save).
+	# tables written before the indexes were saved have a pickled, always empty "indices.pickle" instead
 	def table_file_path(self, file_name: Literal["catalog", "page_directory", "indices"]) -> str:
-		path = os.path.join(self.table_path, file_name)
-		if file_name == "page_directory" or file_name == "indices":
-			path += ".pickle" # these files have the .pickle extension
-		return path
+		return os.path.join(self.table_path, file_name)
 
-	def page_id_to_path(self, page_id: PageID) -> str:
+	def page_file_path(self, page_id: PageID) -> str:
 		path: str = ""
 		if isinstance(page_id, BasePageID):
 			path = self.base_path(page_id)
@@ -275,50 +284,64 @@ class FileHandler:
 			raise(Exception(f"page_id had unexpected type of {type(page_id)}"))
 		return path
 
-	@staticmethod
-	def write_position(page_path: str, byte_position: int, value: int) -> bool:
-		with open(page_path, "r+b") as file:
-			file.seek(byte_position)
-			file.write(value.to_bytes(config.BYTES_PER_INT, byteorder="big"))
-		file.close()
+	# where a page is stored: the file, and the byte position the page starts at in it. that's the page's slot in its
+	# segment file with the segment format, and the start of the page's own file otherwise
+	def page_location(self, page_id: PageID) -> tuple[str, int]:
+		if self.segments is None:
+			return self.page_file_path(page_id), 0
+		return os.path.join(self.table_path, self.segments.file_name(page_id)), self.segments.page_position(page_id)
+
+	# the file and position of a value at byte_position in a page (relative to the start of the page) or a table file
+	def file_location(self, page_sub_path: PageID | Literal["catalog"], byte_position: int) -> tuple[str, int]:
+		if isinstance(page_sub_path, str): # "catalog"; page ids are ints
+			return self.table_file_path(page_sub_path), byte_position
+		path, page_position = self.page_location(page_sub_path)
+		return path, page_position + byte_position
+
+	# whether the page has been created
+	def page_exists(self, page_id: PageID) -> bool:
+		path, _ = self.page_location(page_id)
+		if not os.path.isfile(path):
+			return False
+		if self.segments is None:
+			return True
+		assert self.segments is not None
+		return int.from_bytes(self.fd_cache.read(path, self.segments.page_table_position(page_id), config.BYTES_PER_INT), "big") == page_id
+
+	# returns the metadata page a base or tail page points to (read from the page header the first time)
+	def metadata_page_id(self, page_id: BaseTailPageID) -> MetadataPageID:
+		key = (type(page_id), int(page_id))
+		metadata_page_id = self.metadata_page_ids.get(key)
+		if metadata_page_id is None:
+			metadata_ptr = self.read_int_value(page_id, config.byte_position.base_tail.METADATA_PTR)
+			metadata_page_id = BaseMetadataPageID(metadata_ptr) if isinstance(page_id, BasePageID) else TailMetadataPageID(metadata_ptr)
+			self.metadata_page_ids[key] = metadata_page_id
+		return metadata_page_id
+
+	# returns the file and byte position where a physical page of a base or tail page is stored.
+	# metadata columns (raw index < NUM_METADATA_COL) live in the page's metadata file, data columns in the page file itself
+	def physical_page_location(self, page_id: BaseTailPageID, physical_page_index: RawIndex) -> tuple[str, int]:
+		if physical_page_index < config.NUM_METADATA_COL:
+			return self.file_location(self.metadata_page_id(page_id), config.byte_position.metadata.DATA + physical_page_index * config.PHYSICAL_PAGE_SIZE)
+		data_idx = RawIndex(physical_page_index).toDataIndex()
+		return self.file_location(page_id, config.byte_position.base_tail.DATA + data_idx * config.PHYSICAL_PAGE_SIZE)
+
+	def write_position(self, page_path: str, byte_position: int, value: int) -> bool:
+		self.fd_cache.write(page_path, byte_position, value.to_bytes(config.BYTES_PER_INT, byteorder="big"))
 		return True
 
-	def read_value_page_directory(self) -> dict[int, 'PageDirectoryEntry']:
-		page_path = self.page_path("page_directory")
-		ret: dict[int, 'PageDirectoryEntry'] 
-		with open(page_path, "rb") as handle:
-			ret = pickle.load(handle) # this is not typesafe at all.... ohwell
-		handle.close()
-		return ret
-
 	def read_int_value(self, page_sub_path: PageID | Literal["catalog"], byte_position: int) -> int:
-		page_path = self.page_path(page_sub_path)
-		ret: int = 0
-		with open(page_path, "rb") as file:
-			assert byte_position is not None
-			file.seek(byte_position)
-			ret = int.from_bytes(file.read(8), "big")
-		file.close()
-		return ret
+		assert byte_position is not None
+		page_path, file_position = self.file_location(page_sub_path, byte_position)
+		return int.from_bytes(self.fd_cache.read(page_path, file_position, config.BYTES_PER_INT), "big") # 0 past the end of the file
 	
-	def read_dict_value(self, page_sub_path: Literal["page_directory", "indices"]) -> dict:
-		page_path = self.page_path(page_sub_path)
-		ret: dict
-		with open(page_path, "rb") as handle:
-			ret = pickle.load(handle)
-		handle.close()
-		return ret
-
 	@staticmethod
 	def is_valid_table_file_name(name: Any) -> TypeGuard[Literal["catalog", "page_directory", "indices"]]:
 		return name == "catalog" or name == "page_directory" or name == "indices"
 
-	# returns the full page path, given a particular pageID OR 
-	# the special catalog/page_directory files
-	def page_path(self, page_sub_path: PageID | Literal["catalog", "page_directory", "indices"]) -> str:
-		if isinstance(page_sub_path, BasePageID) or isinstance(page_sub_path, TailPageID) or isinstance(page_sub_path, BaseMetadataPageID) or isinstance(page_sub_path, TailMetadataPageID):
-			return self.page_id_to_path(page_sub_path)
-		elif FileHandler.is_valid_table_file_name(page_sub_path):
+	# returns the full path of the special catalog/page_directory files. pages are found with page_location
+	def page_path(self, page_sub_path: Literal["catalog", "page_directory", "indices"]) -> str:
+		if FileHandler.is_valid_table_file_name(page_sub_path):
 			return self.table_file_path(page_sub_path)
 		else:
 			raise(Exception(f"unexpected page_sub_path {page_sub_path}"))
@@ -326,41 +349,73 @@ class FileHandler:
 	# reads the full base or tail page written to disk. will follow metadata pointer for metadata as well
 	# set projected_columns_index to None to get all columns.
 	# returns None for any pages not requested
-	def read_projected_cols_of_page(self, page_id: BaseTailPageID, projected_columns_index: list[Literal[0, 1]] | None = None) -> FilePageReadResult | None: 
+	# reads the requested data columns and metadata columns of a page. both default to all columns.
+	# columns that weren't requested are None in the result and aren't read at all
+	def read_projected_cols_of_page(self, page_id: BaseTailPageID, projected_columns_index: list[Literal[0, 1]] | None = None, projected_metadata_index: list[Literal[0, 1]] | None = None) -> FilePageReadResult | None: 
 		projected_columns_idx: Any = ([1] * self.table.num_columns) if projected_columns_index is None else projected_columns_index  # type: ignore
+		projected_metadata_idx: Any = ([1] * config.NUM_METADATA_COL) if projected_metadata_index is None else projected_metadata_index  # type: ignore
 		assert projected_columns_idx is not None
 		physical_pages: list[PhysicalPage | None] = [None] * self.table.num_columns
 		metadata_pages: list[PhysicalPage | None] = [None] * config.NUM_METADATA_COL
 
-		metadata_buff = PBBaseMetadataPageID(self, page_id, config.byte_position.base_tail.METADATA_PTR) if isinstance(page_id, BasePageID) else PBTailMetadataPageID(self, page_id, config.byte_position.base_tail.METADATA_PTR)
-		val = metadata_buff.value()
-		# assert isMetadataPageID(val)
-		assert isinstance(val, BaseMetadataPageID) or isinstance(val, TailMetadataPageID)
-
-		metadata_path = self.metadata_path(val)
-		path = self.page_id_to_path(page_id)
-		if not os.path.isfile(metadata_path) or not os.path.isfile(path):
+		if not self.page_exists(page_id):
 			return None
+		metadata_page_id = self.metadata_page_id(page_id)
+		if not self.page_exists(metadata_page_id):
+			return None
+		path, data_position = self.file_location(page_id, config.byte_position.base_tail.DATA)
+		metadata_path, metadata_position = self.file_location(metadata_page_id, config.byte_position.metadata.DATA)
 		
 		offset = self.read_int_value(page_id, config.byte_position.base_tail.OFFSET)
+		if self.mapped_files is not None:
+			return self.map_projected_cols_of_page(path, data_position, metadata_path, metadata_position, offset, projected_columns_idx, projected_metadata_idx)
+
 		# read selected metadata
-		with open(metadata_path, "rb") as metadata_file:
-			metadata_file.seek(config.byte_position.metadata.DATA)
-			for i in range(config.NUM_METADATA_COL):
-				metadata_pages[i] = PhysicalPage(data=bytearray(metadata_file.read(config.PHYSICAL_PAGE_SIZE)), offset=offset)
-		metadata_file.close()
+		for i, data in self.read_physical_pages(metadata_path, metadata_position, projected_metadata_idx).items():
+			metadata_pages[i] = PhysicalPage(data=data, offset=offset)
 
 		# read selected data
-		with open(path, "rb") as file: 
-			file.seek(config.byte_position.base_tail.DATA)
+		for i, data in self.read_physical_pages(path, data_position, projected_columns_idx).items():
+			physical_pages[i] = PhysicalPage(data=data, offset=offset)
+		return FilePageReadResult(metadata_pages, physical_pages)
+
+	# reads the physical pages marked with 1 in `projected` from the file, where physical page i starts at
+	# data_position + i * PHYSICAL_PAGE_SIZE. pages next to each other are read with one read.
+	def read_physical_pages(self, path: str, data_position: int, projected: list[Literal[0, 1]]) -> dict[int, bytearray]:
+		pages: dict[int, bytearray] = {}
+		i = 0
+		while i < len(projected):
+			if projected[i] != 1:
+				i += 1
+				continue
+			run_end = i
+			while run_end < len(projected) and projected[run_end] == 1:
+				run_end += 1
+			run = self.fd_cache.read(path, data_position + i * config.PHYSICAL_PAGE_SIZE, (run_end - i) * config.PHYSICAL_PAGE_SIZE)
+			for j in range(i, run_end):
+				start = (j - i) * config.PHYSICAL_PAGE_SIZE
+				pages[j] = bytearray(run[start : start + config.PHYSICAL_PAGE_SIZE])
+			i = run_end
+		return pages
+
+	# the "mmap" backend's version of read_projected_cols_of_page: the physical pages are views into the mapped files, not copies
+	# the physical pages start at data_position and metadata_position of their files
+	def map_projected_cols_of_page(self, path: str, data_position: int, metadata_path: str, metadata_position: int, offset: int, projected_columns_idx: list[Literal[0, 1]], projected_metadata_idx: list[Literal[0, 1]]) -> FilePageReadResult:
+		assert self.mapped_files is not None
+		physical_pages: list[PhysicalPage | None] = [None] * self.table.num_columns
+		metadata_pages: list[PhysicalPage | None] = [None] * config.NUM_METADATA_COL
+		if 1 in projected_metadata_idx:
+			metadata_view = self.mapped_files.view(metadata_path)
+			for i in range(config.NUM_METADATA_COL):
+				if projected_metadata_idx[i] == 1:
+					start = metadata_position + i * config.PHYSICAL_PAGE_SIZE
+					metadata_pages[i] = PhysicalPage(data=metadata_view[start : start + config.PHYSICAL_PAGE_SIZE], offset=offset) # type: ignore[arg-type]
+		if 1 in projected_columns_idx:
+			view = self.mapped_files.view(path)
 			for i in range(self.table.num_columns):
 				if projected_columns_idx[i] == 1:
-					physical_pages[i] = PhysicalPage(data=bytearray(file.read(config.PHYSICAL_PAGE_SIZE)), offset=offset)
-					# physical_pages.append(PhysicalPage(data=bytearray(file.read(config.PHYSICAL_PAGE_SIZE)), offset=offset))
-				else:
-					# physical_pages.append(None)
-					file.seek(config.PHYSICAL_PAGE_SIZE, 1) # seek 4096 (or size) bytes forward from current position (the 1 means "from current position")
-		file.close()
+					start = data_position + i * config.PHYSICAL_PAGE_SIZE
+					physical_pages[i] = PhysicalPage(data=view[start : start + config.PHYSICAL_PAGE_SIZE], offset=offset) # type: ignore[arg-type]
 		return FilePageReadResult(metadata_pages, physical_pages)
 
 	# def read_full_page(self, page_id: PageID) -> FullFilePageReadResult:
@@ -383,140 +438,149 @@ class FileHandler:
 	
 
 	def insert_base_record(self, metadata: WriteSpecifiedBaseMetadata, *columns: int | None) -> int | None: # returns RID of inserted record
-		# curr_offset = self.base_offset.value()
-		metadata_page_id = self.next_base_metadata_page_id.value()
-		base_page_id = self.next_base_page_id.value()
-		# proj_data_cols = list(map(lambda col: 1 if col is not None else 0, columns))
-		if self.base_offset.value() == config.PHYSICAL_PAGE_SIZE - config.BYTES_PER_INT:
-			self.next_base_page_id.value(1)
-			self.next_base_metadata_page_id.value(1)
+		with self.insert_lock: # one insert at a time per table; inserts share the current page, its offset and the RID counter
+			# curr_offset = self.base_offset.value()
 			metadata_page_id = self.next_base_metadata_page_id.value()
 			base_page_id = self.next_base_page_id.value()
-			print(f"set new base_page_id to {base_page_id}")
-			self.initialize_metadata_file(metadata_page_id)
-			self.initialize_base_tail_page(base_page_id, metadata_page_id)
-			self.base_offset.flush() # flush the old base_offset before making a new one
-			self.base_offset = PsuedoBuffIntValue(self, base_page_id, config.byte_position.base_tail.OFFSET)
-			self.base_offset.add_flush_location(BaseMetadataPageID(metadata_page_id), config.byte_position.metadata.OFFSET) # flush the offset in the corresponding metadata file along with the base file
-			# curr_offset = self.base_offset.value()
-
-		# get the indices in the bufferpool where data_pages and metadata_pages are
-		# append a new record at the curr_offset
-		# increment curr_offset
-
-		# found, metadata_buff_indices, data_buff_indices = self.table.db_bpool.is_page_in_bufferpool(self.table, base_page_id, proj_data_cols) # type: ignore[arg-type]
-		# assert self.table.db_bpool.bring_from_disk(self.table, base_page_id, proj_data_cols, None) # type: ignore[arg-type]
-		page_res = self.table.db_bpool.get_page(self.table, base_page_id, [1] * self.table.num_columns)
-		if page_res is None:
-			return None
-		
-		# for each data_buff_indices
-			# pull up the physical page
-			# append the relevant column value to that physical page
-			# mark the entry as dirty
-		# ..same for metadata_buff_indices
-		# increment the base and metadata offsets
-
-		for col_idx, buff_idx in enumerate(page_res.data_buff_indices):
-			assert buff_idx is not None # we should have gotten all the columns, so nothing should be none
-			col = columns[col_idx]
-			curr_offset = self.base_offset.value()
-			self.table.db_bpool[buff_idx].physical_page.data[curr_offset:curr_offset+config.BYTES_PER_INT] = helper.encode(col if col is not None else 0)
-			self.table.db_bpool[buff_idx].dirty_bit = True
-
-		null_bitmask = 0
-		total_cols = self.table.total_columns
-		if metadata.indirection_column is None: # set 1 for null indirection column
-			null_bitmask = helper.ith_total_col_shift(total_cols, config.INDIRECTION_COLUMN)
-		for idx, column in enumerate(columns):
-			if column is None:
-				null_bitmask = null_bitmask | helper.ith_total_col_shift(len(columns), idx, False) #
-		for i, buff_idx in enumerate(page_res.metadata_buff_indices):
-			assert buff_idx is not None # we should have gotten all the columns, so nothing should be none
-			curr_offset = self.base_offset.value()
-			# physical_page =  
-			metadata_field: int = 0
-			rid = self.next_base_rid.value(1)
-			match i:
-				case config.RID_COLUMN:
-					metadata_field = rid
-				case config.TIMESTAMP_COLUMN:
-					metadata_field = int(time.time())
-				case config.NULL_COLUMN:
-					metadata_field = null_bitmask
-				case config.BASE_RID:
-					metadata_field = rid
-
-			self.table.db_bpool[buff_idx].dirty_bit = True
-
-			(self.table.db_bpool[buff_idx].physical_page).data[curr_offset:curr_offset+config.BYTES_PER_INT] = helper.encode(metadata_field)
-
-		self.table.page_directory_buff.value_assign(rid, PageDirectoryEntry(base_page_id, metadata_page_id, self.base_offset.value(), "base"))
-		self.base_offset.value(config.BYTES_PER_INT) # increment by 8
+			# proj_data_cols = list(map(lambda col: 1 if col is not None else 0, columns))
+			if self.base_offset.value() == config.PHYSICAL_PAGE_SIZE - config.BYTES_PER_INT:
+				self.next_base_page_id.value(1)
+				self.next_base_metadata_page_id.value(1)
+				metadata_page_id = self.next_base_metadata_page_id.value()
+				base_page_id = self.next_base_page_id.value()
+				print(f"set new base_page_id to {base_page_id}")
+				self.initialize_metadata_file(metadata_page_id)
+				self.initialize_base_tail_page(base_page_id, metadata_page_id)
+				self.base_offset.flush() # flush the old base_offset before making a new one
+				self.base_offset = PsuedoBuffIntValue(self, base_page_id, config.byte_position.base_tail.OFFSET)
+				self.base_offset.add_flush_location(BaseMetadataPageID(metadata_page_id), config.byte_position.metadata.OFFSET) # flush the offset in the corresponding metadata file along with the base file
+				# curr_offset = self.base_offset.value()
+
+			# get the indices in the bufferpool where data_pages and metadata_pages are
+			# append a new record at the curr_offset
+			# increment curr_offset
+
+			# found, metadata_buff_indices, data_buff_indices = self.table.db_bpool.is_page_in_bufferpool(self.table, base_page_id, proj_data_cols) # type: ignore[arg-type]
+			# assert self.table.db_bpool.bring_from_disk(self.table, base_page_id, proj_data_cols, None) # type: ignore[arg-type]
+			with self.table.db_bpool.pinned_page(self.table, base_page_id, [1] * self.table.num_columns) as page_res:
+				if page_res is None:
+					return None
+				with self.table.db_bpool.latch_pages(page_res.metadata_buff_indices + page_res.data_buff_indices, exclusive=True): # type: ignore[operator]
+					# for each data_buff_indices
+						# pull up the physical page
+						# append the relevant column value to that physical page
+						# mark the entry as dirty
+					# ..same for metadata_buff_indices
+					# increment the base and metadata offsets
+
+					logged_values: list[tuple[int, int]] = [] # (raw index, value) of every column written, for the write-ahead log
+					for col_idx, buff_idx in enumerate(page_res.data_buff_indices):
+						assert buff_idx is not None # we should have gotten all the columns, so nothing should be none
+						col = columns[col_idx]
+						curr_offset = self.base_offset.value()
+						self.table.db_bpool[buff_idx].physical_page.data[curr_offset:curr_offset+config.BYTES_PER_INT] = helper.encode(col if col is not None else 0)
+						self.table.db_bpool[buff_idx].dirty_bit = True
+						logged_values.append((DataIndex(col_idx).toRawIndex(), col if col is not None else 0))
+
+					null_bitmask = 0
+					total_cols = self.table.total_columns
+					if metadata.indirection_column is None: # set 1 for null indirection column
+						null_bitmask = helper.ith_total_col_shift(total_cols, config.INDIRECTION_COLUMN)
+					for idx, column in enumerate(columns):
+						if column is None:
+							null_bitmask = null_bitmask | helper.ith_total_col_shift(len(columns), idx, False) #
+					rid = self.next_base_rid.value(1) # one rid per record, shared by the RID and BASE_RID columns and the page directory
+					for i, buff_idx in enumerate(page_res.metadata_buff_indices):
+						assert buff_idx is not None # we should have gotten all the columns, so nothing should be none
+						curr_offset = self.base_offset.value()
+						# physical_page =  
+						metadata_field: int = 0
+						match i:
+							case config.RID_COLUMN:
+								metadata_field = rid
+							case config.TIMESTAMP_COLUMN:
+								metadata_field = int(time.time())
+							case config.NULL_COLUMN:
+								metadata_field = null_bitmask
+							case config.BASE_RID:
+								metadata_field = rid
+
+						self.table.db_bpool[buff_idx].dirty_bit = True
+
+						(self.table.db_bpool[buff_idx].physical_page).data[curr_offset:curr_offset+config.BYTES_PER_INT] = helper.encode(metadata_field)
+						logged_values.append((i, metadata_field))
+					self.table.db_bpool.log_change(self.table, WAL_INSERT, base_page_id, self.base_offset.value(), logged_values, page_res.metadata_buff_indices + page_res.data_buff_indices, rid, metadata_page_id) # type: ignore[operator]
+
+			self.table.page_directory_buff.value_assign(rid, PageDirectoryEntry(base_page_id, metadata_page_id, self.base_offset.value(), "base"))
+			self.base_offset.value(config.BYTES_PER_INT) # increment by 8
 		
-		return rid
+			return rid
+
+	# the number of records written to a base page. base pages fill in order, so every page before the current one is full
+	def base_page_record_count(self, page_id: BasePageID) -> int:
+		if page_id < self.next_base_page_id.value():
+			return config.BASE_RECORDS_PER_PAGE
+		if page_id > self.next_base_page_id.value():
+			return 0
+		return self.base_offset.value() // config.BYTES_PER_INT
 
 	def insert_tail_record(self, metadata: WriteSpecifiedTailMetadata, *columns: int | None) -> int: # returns RID of inserted record
-		null_bitmask = 0
-		total_cols = self.table.total_columns
-		if metadata.indirection_column is None: # set 1 for null indirection column
-			null_bitmask = helper.ith_total_col_shift(total_cols, config.INDIRECTION_COLUMN)
-		for idx, column in enumerate(columns):
-			if column is None:
-				null_bitmask = null_bitmask | helper.ith_total_col_shift(len(columns), idx, False) #
+		with self.insert_lock:
+			null_bitmask = 0
+			total_cols = self.table.total_columns
+			if metadata.indirection_column is None: # set 1 for null indirection column
+				null_bitmask = helper.ith_total_col_shift(total_cols, config.INDIRECTION_COLUMN)
+			for idx, column in enumerate(columns):
+				if column is None:
+					null_bitmask = null_bitmask | helper.ith_total_col_shift(len(columns), idx, False) #
 			
-		list_columns: list[int | None] = list(columns)
-		data_columns = list_columns
-		metadata_columns: list[int | None] = []
-		tid = self.next_tail_rid.value(-1) # tail RIDs decrease
-		metadata_columns.insert(config.INDIRECTION_COLUMN, metadata.indirection_column)
-		metadata_columns.insert(config.RID_COLUMN, tid)
-		metadata_columns.insert(config.TIMESTAMP_COLUMN, int(time.time()))
-		metadata_columns.insert(config.SCHEMA_ENCODING_COLUMN, metadata.schema_encoding)
-		metadata_columns.insert(config.NULL_COLUMN, null_bitmask)
-		metadata_columns.insert(config.BASE_RID, metadata.base_rid)
-		# cols = tuple(data_columns + metadata_columns)
-		curr_offset = self.tail_offset.value()
-		metadata_page_id = self.next_tail_metadata_page_id.value()
-		tail_page_id = self.next_tail_page_id.value()
-		if curr_offset == config.PHYSICAL_PAGE_SIZE: 
-			self.next_tail_page_id.value(1)
-			self.next_tail_metadata_page_id.value(1)
+			list_columns: list[int | None] = list(columns)
+			data_columns = list_columns
+			metadata_columns: list[int | None] = []
+			tid = self.next_tail_rid.value(-1) # tail RIDs decrease
+			metadata_columns.insert(config.INDIRECTION_COLUMN, metadata.indirection_column)
+			metadata_columns.insert(config.RID_COLUMN, tid)
+			metadata_columns.insert(config.TIMESTAMP_COLUMN, int(time.time()))
+			metadata_columns.insert(config.SCHEMA_ENCODING_COLUMN, metadata.schema_encoding)
+			metadata_columns.insert(config.NULL_COLUMN, null_bitmask)
+			metadata_columns.insert(config.BASE_RID, metadata.base_rid)
+			# cols = tuple(data_columns + metadata_columns)
+			curr_offset = self.tail_offset.value()
 			metadata_page_id = self.next_tail_metadata_page_id.value()
 			tail_page_id = self.next_tail_page_id.value()
-			# print(f"set new base_page_id to {base_page_id}")
-			self.initialize_metadata_file(metadata_page_id)
-			self.initialize_base_tail_page(tail_page_id, metadata_page_id)
-			self.tail_offset.flush() # flush the old base_offset before making a new one
-			self.tail_offset = PsuedoBuffIntValue(self, tail_page_id, config.byte_position.base_tail.OFFSET)
-			curr_offset = self.tail_offset.value()
-			# print(f"set curr_offset to {curr_offset}")
-			# self.base_offset.value(-config.PHYSICAL_PAGE_SIZE) # set to 0
-			assert self.tail_offset.value() == 0
-
-		metadata_path = self.metadata_path(TailMetadataPageID(metadata_page_id))
-		with open(metadata_path, "r+b") as mfile:
-			mfile.seek(8)
-			mfile.seek(curr_offset, 1)
-			for mcol in metadata_columns:
-				mfile.write(int.to_bytes(mcol if mcol is not None else 0, config.BYTES_PER_INT, "big"))
-				mfile.seek(config.PHYSICAL_PAGE_SIZE - config.BYTES_PER_INT, 1)
-		mfile.close()
-		
-
-		tail_path = self.tail_path(TailPageID(tail_page_id))
-		# print(f"base path = {base_path}")
-		with open(tail_path, "r+b") as tfile:
-			tfile.seek(24)
-			tfile.seek(curr_offset, 1)
-			for dcol in data_columns:
-				tfile.write(int.to_bytes(dcol if dcol is not None else 0, config.BYTES_PER_INT, "big"))
-				tfile.seek(config.PHYSICAL_PAGE_SIZE - config.BYTES_PER_INT, 1) 
-		tfile.close()
-		pg_dir_entry = PageDirectoryEntry(TailPageID(tail_page_id), TailMetadataPageID(metadata_page_id), self.tail_offset.value(), "tail")
-		self.table.page_directory_buff.value_assign(tid, pg_dir_entry)
-		self.tail_offset.value(config.BYTES_PER_INT)
-		return tid
+			if curr_offset == config.PHYSICAL_PAGE_SIZE: 
+				self.next_tail_page_id.value(1)
+				self.next_tail_metadata_page_id.value(1)
+				metadata_page_id = self.next_tail_metadata_page_id.value()
+				tail_page_id = self.next_tail_page_id.value()
+				# print(f"set new base_page_id to {base_page_id}")
+				self.initialize_metadata_file(metadata_page_id)
+				self.initialize_base_tail_page(tail_page_id, metadata_page_id)
+				self.tail_offset.flush() # flush the old base_offset before making a new one
+				self.tail_offset = PsuedoBuffIntValue(self, tail_page_id, config.byte_position.base_tail.OFFSET)
+				curr_offset = self.tail_offset.value()
+				# print(f"set curr_offset to {curr_offset}")
+				# self.base_offset.value(-config.PHYSICAL_PAGE_SIZE) # set to 0
+				assert self.tail_offset.value() == 0
+
+			# the record is written into the bufferpool frames of the tail page; they are written to disk as whole
+			# pages when they are evicted, by the background writer, or when the database is closed.
+			# the page is only pinned while the record is written. every append references its frames, so the
+			# replacement policy keeps the page resident while it is being filled and it rarely has to be read back in
+			bufferpool = self.table.db_bpool
+			with bufferpool.pinned_page(self.table, TailPageID(tail_page_id), [1] * self.table.num_columns) as tail_page:
+				if tail_page is None:
+					raise(Exception(f"no room in the bufferpool for tail page {tail_page_id} of table {self.table.name}"))
+				with bufferpool.latch_pages(tail_page.metadata_buff_indices + tail_page.data_buff_indices, exclusive=True): # type: ignore[operator]
+					for buff_idx, col in zip(tail_page.metadata_buff_indices + tail_page.data_buff_indices, metadata_columns + data_columns): # type: ignore[operator]
+						assert buff_idx is not None
+						bufferpool[buff_idx].physical_page.data[curr_offset:curr_offset+config.BYTES_PER_INT] = helper.encode(col if col is not None else 0)
+						bufferpool[buff_idx].dirty_bit = True
+					bufferpool.log_change(self.table, WAL_INSERT, TailPageID(tail_page_id), curr_offset, [(raw_idx, col if col is not None else 0) for raw_idx, col in enumerate(metadata_columns + data_columns)], tail_page.metadata_buff_indices + tail_page.data_buff_indices, tid, metadata_page_id) # type: ignore[operator]
+			pg_dir_entry = PageDirectoryEntry(TailPageID(tail_page_id), TailMetadataPageID(metadata_page_id), self.tail_offset.value(), "tail")
+			self.table.page_directory_buff.value_assign(tid, pg_dir_entry)
+			self.tail_offset.value(config.BYTES_PER_INT)
+			return tid
 
 	def initialize_table_files(self) -> None:
 		# initialize catalog file
@@ -532,25 +596,27 @@ class FileHandler:
 			helper.write_int(catalog_file, 1)
 			helper.write_int(catalog_file, 1) # RIDs start at one..
 			helper.write_int(catalog_file, config.INITIAL_TID) # but TIDs start at 2^64 - 1
+			helper.write_int(catalog_file, STORAGE_SEGMENTS if config.STORAGE_FORMAT == "segment" else STORAGE_PAGE_FILES)
+			helper.write_int(catalog_file, ADDRESSING_ARITHMETIC if config.RID_ADDRESSING == "arithmetic" else ADDRESSING_DIRECTORY)
 		catalog_file.close()
 
 		page_dir_path = self.table_file_path('page_directory')
 		open(page_dir_path, "x")
 		with open(page_dir_path, "w+b") as page_directory_file:
-			pickle.dump({}, page_directory_file)
-			pass # just create the file, it should be empty
+			page_directory_file.write(ArrayPageDirectory.HEADER.pack(ArrayPageDirectory.FORMAT_VERSION, 0, 0)) # no entries yet
 		page_directory_file.close()
 
 		# final_path=os.path.join(newpath,"page_directory")
-		index_path = self.table_file_path("indices")
-		open(index_path, "x")
-		with open(index_path, "w+b") as index_file:
-			pickle.dump(Index(self.table.num_columns), index_file)
-		index_file.close()
+		Index(self.table.num_columns).save(self.table_file_path("indices"), 1) # no records yet
 
 	def initialize_base_tail_page(self, page_id: BasePageID | TailPageID, metadata_id: BaseMetadataPageID | TailMetadataPageID) -> None:
 		#print(f"initializing page id {page_id} of type {type(page_id)}")
-		page_path = self.page_id_to_path(page_id)
+		self.metadata_page_ids[(type(page_id), int(page_id))] = metadata_id
+		if self.segments is not None:
+			header = metadata_id.to_bytes(config.BYTES_PER_INT, "big") + (0).to_bytes(config.BYTES_PER_INT, "big") + config.INITIAL_TPS.to_bytes(config.BYTES_PER_INT, "big")
+			self.initialize_segment_page(page_id, header)
+			return
+		page_path = self.page_file_path(page_id)
 		open(page_path, "xb") # create the file
 		with open(page_path, "w+b") as base_file:
 			# base_file.write(metadata_id.to_bytes(config.BYTES_PER_INT, "big"))
@@ -562,7 +628,10 @@ class FileHandler:
 		base_file.close()
 
 	def initialize_metadata_file(self, page_id: BaseMetadataPageID | TailMetadataPageID) -> None:
-		page_path = self.page_id_to_path(page_id)
+		if self.segments is not None:
+			self.initialize_segment_page(page_id, (0).to_bytes(config.BYTES_PER_INT, "big")) # starting offset = 0
+			return
+		page_path = self.page_file_path(page_id)
 		open(page_path, "xb") 
 		with open(page_path, "w+b") as file: # open metadata file
 			helper.write_int(file, 0) # starting offset = 0
@@ -570,6 +639,93 @@ class FileHandler:
 				file.write(bytearray(config.PHYSICAL_PAGE_SIZE)) # write the metadata columns
 		file.close()
 	
+	# claims the page's slot in its segment file (creating the file if it's the first page of its range) and writes
+	# the page's header. the rest of the slot is already zeros
+	def initialize_segment_page(self, page_id: PageID, header: bytes) -> None:
+		assert self.segments is not None
+		path, page_position = self.page_location(page_id)
+		with self.segment_lock: # recovery can create pages of the same segment on several threads
+			if not os.path.isfile(path):
+				self.segments.create(path)
+			page_table_position = self.segments.page_table_position(page_id)
+			if int.from_bytes(self.fd_cache.read(path, page_table_position, config.BYTES_PER_INT), "big") != 0:
+				raise(Exception(f"page {page_id} of table {self.table.name} already exists"))
+			self.fd_cache.write(path, page_position, header)
+			self.fd_cache.write(path, page_table_position, int(page_id).to_bytes(config.BYTES_PER_INT, "big")) # the page exists once it has a header
+
+	# converts a table stored in per-page files (STORAGE_PAGE_FILES) to segment files. every page file is copied into
+	# its slot, the segments are synced, and only then is the catalog switched over and the page files removed;
+	# a crash before the catalog is switched leaves the page files in use, and the migration simply runs again.
+	# runs when the table is opened, before anything is read from its pages
+	def migrate_to_segments(self) -> None:
+		self.segments = SegmentLayout(self.table.num_columns)
+		page_files: list[str] = []
+		for file_name in os.listdir(self.table_path):
+			if file_name.startswith("segment_"): # left over from a migration that didn't finish
+				os.remove(os.path.join(self.table_path, file_name))
+		for file_name in sorted(os.listdir(self.table_path)):
+			match = re.fullmatch(r"(base|tail|base_metadata|tail_metadata)_(\d+)", file_name)
+			if match is None:
+				continue
+			page_id: PageID = {"base": BasePageID, "tail": TailPageID, "base_metadata": BaseMetadataPageID, "tail_metadata": TailMetadataPageID}[match.group(1)](int(match.group(2)))
+			page_path = os.path.join(self.table_path, file_name)
+			with open(page_path, "rb") as page_file:
+				data = page_file.read()
+			type_idx, _ = self.segments.slot(page_id)
+			if len(data) != self.segments.page_sizes[type_idx]:
+				raise(Exception(f"can't migrate {page_path}: expected {self.segments.page_sizes[type_idx]} bytes, found {len(data)}"))
+			path, page_position = self.page_location(page_id)
+			if not os.path.isfile(path):
+				self.segments.create(path)
+			self.fd_cache.write(path, page_position, data)
+			self.fd_cache.write(path, self.segments.page_table_position(page_id), int(page_id).to_bytes(config.BYTES_PER_INT, "big"))
+			page_files.append(page_path)
+		self.fd_cache.sync_written()
+		self.write_position(self.table_file_path("catalog"), config.byte_position.catalog.STORAGE_FORMAT, STORAGE_SEGMENTS)
+		self.fd_cache.sync_written()
+		for page_path in page_files:
+			self.fd_cache.close(page_path)
+			os.remove(page_path)
+
+	# moves the insert position of base or tail records forward to `next_offset` in the given page, and the RID
+	# counters past `rid`, if they are behind. recovery calls this for every insert it redoes, since the catalog on
+	# disk may be older than the log
+	def advance_insert_position(self, page_id: BaseTailPageID, metadata_page_id: MetadataPageID, next_offset: int, rid: int) -> None:
+		with self.insert_lock:
+			if isinstance(page_id, BasePageID):
+				if rid >= self.next_base_rid.value():
+					self.next_base_rid.value_assign(rid + 1)
+				if page_id > self.next_base_page_id.value():
+					self.next_base_page_id.value_assign(page_id)
+					self.next_base_metadata_page_id.value_assign(metadata_page_id)
+					self.base_offset.flush()
+					self.base_offset = PsuedoBuffIntValue(self, page_id, config.byte_position.base_tail.OFFSET)
+					self.base_offset.add_flush_location(BaseMetadataPageID(metadata_page_id), config.byte_position.metadata.OFFSET)
+				if page_id == self.next_base_page_id.value() and next_offset > self.base_offset.value():
+					self.base_offset.value_assign(next_offset)
+			else:
+				if rid <= self.next_tail_rid.value(): # tail RIDs decrease
+					self.next_tail_rid.value_assign(rid - 1)
+				if page_id > self.next_tail_page_id.value():
+					self.next_tail_page_id.value_assign(page_id)
+					self.next_tail_metadata_page_id.value_assign(metadata_page_id)
+					self.tail_offset.flush()
+					self.tail_offset = PsuedoBuffIntValue(self, page_id, config.byte_position.base_tail.OFFSET)
+				if page_id == self.next_tail_page_id.value() and next_offset > self.tail_offset.value():
+					self.tail_offset.value_assign(next_offset)
+
+	# writes the catalog counters and page offsets without flushing them, so they can still be used. used by checkpoints
+	def checkpoint(self) -> None:
+		with self.insert_lock: # inserts change several counters together
+			for value in [self.next_base_page_id, self.next_tail_page_id, self.next_base_metadata_page_id, self.next_tail_metadata_page_id, self.next_base_rid, self.next_tail_rid, self.base_offset, self.tail_offset]:
+				value.checkpoint()
+
+	# makes the writes to the table's files durable
+	def sync_files(self) -> None:
+		if self.mapped_files is not None:
+			self.mapped_files.flush_all()
+		self.fd_cache.sync_written()
+
 	def flush(self) -> None:
 		self.next_base_page_id.flush()
 		self.next_tail_page_id.flush()
@@ -581,6 +737,13 @@ class FileHandler:
 		self.tail_offset.flush()
 		self.is_flushed = True
 
+	# closes the cached file descriptors. the bufferpool may still write through this FileHandler afterwards;
+	# files are then simply reopened
+	def close_files(self) -> None:
+		self.fd_cache.close_all()
+		if self.mapped_files is not None:
+			self.mapped_files.close_all()
+
 	def __del__(self) -> None:
 		if not self.is_flushed:
 			raise Exception("File Handler of table: %s was not flushed", self.table)
@@ -595,14 +758,17 @@ class Table:
 	:param key: int             #Index of table key in columns
 	"""
 
-	def __init__(self, name: str, num_columns: int, key_index: DataIndex, db_path: str, db_bpool: Bufferpool):
+	def __init__(self, name: str, num_columns: int, key_index: DataIndex, db_path: str, db_bpool: Bufferpool, migrate_storage: bool = False):
 		self.name: str = name
 		self.key_index = DataIndex(key_index)
 		self.num_columns: int = num_columns # data columns only
 		self.total_columns = self.num_columns + config.NUM_METADATA_COL # inclding metadata
 		self.db_path = db_path
-		self.file_handler = FileHandler(self)
-		self.page_directory_buff = PseudoBuffDictValue[int, PageDirectoryEntry](self.file_handler, "page_directory")
+		self.db_bpool = db_bpool
+		db_bpool.check_table_fits(self.name, self.total_columns) # before any of the table's files are created
+		self.stats = BufferpoolStats() # bufferpool activity on this table's pages
+		self.file_handler = FileHandler(self, migrate_storage) # migrate_storage converts per-page files to segment files
+		self.page_directory_buff = ArrayPageDirectory(self.file_handler)
 		# self.last_rid = 1
 
 		# ## second milestone
@@ -613,10 +779,12 @@ class Table:
 		
 		# Page Directory:
 		# {Rid: (Page, offset)}
-		from lstore.index import Index
-		self.index = Index(self.num_columns)
+		# the indexes saved by the last checkpoint or close. if they are missing or out of date (after a crash, or
+		# for tables written before indexes were saved), index_stale is set and rebuild_index() has to be called
+		loaded = Index.load(self.file_handler.table_file_path("indices"), self.num_columns, self.file_handler.next_base_rid.value())
+		self.index_stale = loaded is None
+		self.index = loaded if loaded is not None else Index(self.num_columns)
 
-		self.db_bpool = db_bpool
 		# create a B-tree index object for the key index (hard-coded for M1)
 		self.index.create_index(self.key_index)
 
@@ -627,6 +795,41 @@ class Table:
 
 
 
+	# saves what the table keeps in memory besides the bufferpool (counters, page directory), while queries keep running
+	def checkpoint(self) -> None:
+		self.page_directory_buff.checkpoint()
+		self.file_handler.checkpoint()
+		self.save_index()
+
+	def save_index(self) -> None:
+		if self.file_handler.next_base_rid.flushed:
+			return # the file handler was flushed already, so the RID counter can't be read; the index is rebuilt on open
+		self.index.save(self.file_handler.table_file_path("indices"), self.file_handler.next_base_rid.value())
+		legacy_path = self.file_handler.table_file_path("indices") + ".pickle"
+		if os.path.isfile(legacy_path):
+			os.remove(legacy_path)
+
+	# builds the indexes again from the base pages. the index is never pruned, so every base record is in it,
+	# deleted ones too (a delete only sets the null bit of the RID column), with the key it was inserted with
+	def rebuild_index(self) -> None:
+		index = Index(self.num_columns)
+		index.create_index(self.key_index)
+		key_tree = index.indices[self.key_index]
+		assert key_tree is not None
+		projected_columns_index: list[Literal[0, 1]] = [0] * self.num_columns
+		projected_columns_index[self.key_index] = 1
+		rids_by_key: dict[int, list[BaseRID]] = {}
+		for page in self.db_bpool.scan_base_pages(self, projected_columns_index):
+			rids, keys = page.rids, page.column(self.key_index)
+			if HAS_NUMPY:
+				rids, keys = rids.tolist(), keys.tolist()
+			for rid, key in zip(rids, keys):
+				if rid != 0: # the record was written
+					rids_by_key.setdefault(key, []).append(BaseRID(rid))
+		key_tree.update(rids_by_key)
+		self.index = index
+		self.index_stale = False
+
 	def ith_total_col_shift(self, col_idx: RawIndex) -> int: # returns the bit vector shifted to the indicated col idx
 		return 0b1 << (self.total_columns - col_idx - 1)
 
@@ -763,11 +966,12 @@ class Table:
 	# 	object_to_get_tps._value = int.from_bytes(indirection_column)
 	# 	object_to_get_tps.flush()
 
+# a BufferedPage or BufferedRecord keeps the frames it refers to pinned until unpin() is called.
+# use them through Bufferpool.pinned_page / Bufferpool.pinned_record, which unpin as soon as the `with` block ends.
+# __del__ only unpins as a last resort, for holders that never called unpin().
 class BufferedPage:
 	def __del__(self) -> None:
-		self.bufferpool.change_pin_count(self.data_buff_indices, -1)
-		self.bufferpool.change_pin_count(self.metadata_buff_indices, -1)
-		pass
+		self.unpin()
 	def __init__(self, bufferpool: Bufferpool, table: Table, data_buff_indices: List[BufferpoolIndex | None], metadata_buff_indices: List[BufferpoolIndex], projected_columns_index: List[Literal[0, 1]]):
 		# self.initialized = False
 		self.bufferpool = bufferpool
@@ -777,13 +981,19 @@ class BufferedPage:
 		self.projected_columns_index = projected_columns_index
 		bufferpool.change_pin_count(data_buff_indices, +1) # increment pin counts of relevant bufferpool frames
 		bufferpool.change_pin_count(metadata_buff_indices, +1) # increment pin counts of relevant bufferpool frames
+		self.pinned = True
+
+	def unpin(self) -> None:
+		if self.pinned:
+			self.pinned = False
+			self.bufferpool.change_pin_count(self.data_buff_indices, -1)
+			self.bufferpool.change_pin_count(self.metadata_buff_indices, -1)
 
 
 class BufferedRecord:
 	def __del__(self) -> None:
-		self.bufferpool.change_pin_count(self.metadata_buff_indices + self.data_buff_indices, -1)
-		pass
-	def __init__(self, bufferpool: Bufferpool, table: Table, buff_indices: List[BufferpoolIndex], record_offset: int, record_id: RID, projected_columns_index: List[Literal[0, 1]]):
+		self.unpin()
+	def __init__(self, bufferpool: Bufferpool, table: Table, metadata_buff_indices: List[BufferpoolIndex], data_buff_indices: List[BufferpoolIndex | None], record_offset: int, record_id: RID, projected_columns_index: List[Literal[0, 1]]):
 		self.bufferpool = bufferpool
 		self.metadata_buff_indices = metadata_buff_indices
 		self.data_buff_indices = data_buff_indices
@@ -791,105 +1001,201 @@ class BufferedRecord:
 		self.record_offset = record_offset
 		self.record_id = record_id
 		self.projected_columns_index = projected_columns_index
-		bufferpool.change_pin_count(buff_indices, +1) # increment pin counts of relevant bufferpool frames
+		bufferpool.change_pin_count(metadata_buff_indices, +1) # increment pin counts of relevant bufferpool frames
+		bufferpool.change_pin_count(data_buff_indices, +1) # type: ignore[arg-type]
+		self.pinned = True
 
-	def add_buff_idx(self, buff_idx: BufferpoolIndex) -> None:
-		self.buff_indices.append(buff_idx)
-		self.bufferpool[buff_idx].pin_count += 1 # will be decremented later because it was addded to base_buff_indices
-
-	def unpin_buff_indices(self, buff_indices: List[BufferpoolIndex]) -> None:
-		for buff_idx in buff_indices:
-			self.bufferpool[buff_idx].pin_count -= 1
-			self.buff_indices.remove(buff_idx)
+	def unpin(self) -> None:
+		if self.pinned:
+			self.pinned = False
+			self.bufferpool.change_pin_count(self.metadata_buff_indices, -1)
+			self.bufferpool.change_pin_count(self.data_buff_indices, -1) # type: ignore[arg-type]
 
 	def get_value(self) -> Record:
+		with self.bufferpool.latch_pages(self.metadata_buff_indices + self.data_buff_indices): # type: ignore[operator]
+			return self.unpack_value()
+
+	# reads the record out of its frames. the caller holds the frames' latches.
+	# every field is decoded straight out of the frame's bytearray with a precompiled struct, so nothing is sliced or copied,
+	# and the NULL column is read once up front instead of once per zero value.
+	def unpack_value(self) -> Record:
 		num_cols = len(self.projected_columns_index) # number of data_cols
-		# will be set to none if that physical page is not in the projected columns
-		metadata_cols: Annotated[List[PhysicalPage], num_cols] = [] # no record should have partial metadata.  
-		data_cols: Annotated[List[PhysicalPage | None], num_cols] = [None] * num_cols
-		for m_buff_idx in self.metadata_buff_indices:
-			col_idx = self.bufferpool[m_buff_idx].physical_page_index
-			assert col_idx is not None, "column held by BufferedRecord was None!"
-			physical_page = self.bufferpool[m_buff_idx].physical_page
-			metadata_cols.append(physical_page)
-		for d_buff_idx in self.data_buff_indices:
-			if d_buff_idx is None:
-				data_cols.append(None)
-			else:
-				col_idx = self.bufferpool[d_buff_idx].physical_page_index
-				assert col_idx is not None, "column held by BufferedRecord was None!"
-				physical_page = self.bufferpool[d_buff_idx].physical_page
-				data_cols.append(physical_page)
-				data_cols[col_idx.toDataIndex()] = physical_page
+		record_offset = self.record_offset
+		unpack_from = helper.UINT64.unpack_from
+		entries = self.bufferpool.entries
 
-		all_cols = metadata_cols + data_cols
+		# metadata_buff_indices is in raw index order, so metadata[i] is the value of metadata column i
+		metadata = [unpack_from(helper.not_null(entries[m_buff_idx]).physical_page.data, record_offset)[0] for m_buff_idx in self.metadata_buff_indices]
+		null_col = metadata[config.NULL_COLUMN]
+		total_cols = self.table.total_columns
 
-		def get_no_none_check(col_idx: RawIndex, record_offset: int) -> int:
-			return helper.unpack_data(helper.not_null(all_cols[col_idx]).data, record_offset)
-		
-		def get_check_for_none(col_idx: RawIndex, record_offset: int) -> int | None:
-			val = get_no_none_check(col_idx, record_offset)
-			if val == 0:
-				# breaking an abstraction barrier for convenience right now. TODO: fix?
-				thing = helper.unpack_data(helper.not_null(all_cols[config.NULL_COLUMN]).data, record_offset)
-				# thing = helper.unpack_col(self, config.NULL_COLUMN, record_offset / config.BYTES_PER_INT)
-				# thing = struct.unpack(config.PACKING_FORMAT_STR, self.physical_pages[config.NULL_COLUMN].data[(record_idx * 8):(record_idx * 8)+8])[0]
-				# is_none = (self.physical_pages[config.NULL_COLUMN].data[(record_idx * 8):(record_idx * 8)+8] == b'x01')
-
-				# is_none = ( thing >> ( self.num_columns + config.NUM_METADATA_COL - col_idx - 1 ) ) & 1
-				is_none = helper.ith_bit(thing, self.table.total_columns, col_idx)
-				if is_none == 1:
-					return None
+		def or_none(col_idx: RawIndex) -> int | None:
+			val = metadata[col_idx]
+			if val == 0 and helper.ith_bit(null_col, total_cols, col_idx) == 1:
+				return None
 			return val
-			
 
-		indirection_column, rid, schema_encoding, timestamp,  null_col, base_rid = \
-			get_check_for_none(config.INDIRECTION_COLUMN, self.record_offset), \
-			get_check_for_none(config.RID_COLUMN, self.record_offset), \
-			get_no_none_check(config.SCHEMA_ENCODING_COLUMN, self.record_offset), \
-			get_no_none_check(config.TIMESTAMP_COLUMN, self.record_offset), \
-			get_check_for_none(config.NULL_COLUMN, self.record_offset), \
-			get_no_none_check(config.BASE_RID, self.record_offset), \
+		indirection_column, rid, base_rid = or_none(config.INDIRECTION_COLUMN), or_none(config.RID_COLUMN), metadata[config.BASE_RID]
+		schema_encoding, timestamp = metadata[config.SCHEMA_ENCODING_COLUMN], metadata[config.TIMESTAMP_COLUMN]
+		null_value = or_none(config.NULL_COLUMN)
 
-		
-		# check the first place where the self.data_buff_indices is not None (ie the first requested column),
-		# then get the page type of that index
-		# this is just outside the metadata column range. thus it should reveal the actual page type of base or tail (both base and tail pages will have other "metadata" type pages in the bufferpool)
-		first_non_null_data_buff_idx = self.data_buff_indices[[i for i in range(len(self.projected_columns_index)) if self.data_buff_indices[i] is not None][0]]
-		assert first_non_null_data_buff_idx is not None
-		page_type = self.bufferpool.get_page_type(first_non_null_data_buff_idx)
-		# page_type = self.bufferpool[self.buff_indices[config.NUM_METADATA_COL]].page_type
-		is_base_page = False
-		if page_type == "base":
-			is_base_page = True
-		else:
+		# metadata frames are stored under the ID of the base or tail page they belong to, so any frame gives the page type
+		page_type = self.bufferpool.get_page_type(self.metadata_buff_indices[0])
+		if page_type != "base" and page_type != "tail":
 			raise(Exception("should not be getting metadata page type in get_record."))
+		is_base_page = page_type == "base"
 
 		columns: Annotated[List[int | None], num_cols] = [None] * num_cols
-
-		# the data_cols variable contains only the data columns in the order they 
-		# were specified in the projected_columns.
-		j = 0
+		for d_buff_idx in self.data_buff_indices:
+			if d_buff_idx is None:
+				continue
+			entry = helper.not_null(entries[d_buff_idx])
+			col_idx = entry.physical_page_index
+			assert col_idx is not None, "column held by BufferedRecord was None!"
+			data_idx = col_idx.toDataIndex()
+			if self.projected_columns_index[data_idx] == 1:
+				columns[data_idx] = unpack_from(entry.physical_page.data, record_offset)[0]
 		for i, proj in enumerate(self.projected_columns_index):
-			if proj == 1:
-				data_col = data_cols[i]
-				assert data_col is not None, "this record is missing a column specified in the projected_columns_index"
-				columns[i] = helper.unpack_data(data_col.data, self.record_offset)
-				j += 1
+			assert proj == 0 or self.data_buff_indices[i] is not None, "this record is missing a column specified in the projected_columns_index"
 
 		def rid_type(rid: int | None) -> RID:
 			if rid is None:
 				return None
 			return BaseRID(rid) if rid < self.table.file_handler.next_tail_rid.value() else TailRID(rid)
-		return Record(FullMetadata(rid_type(rid), timestamp, rid_type(indirection_column), schema_encoding, null_col, rid_type(base_rid)), is_base_page, *columns)
+		return Record(FullMetadata(rid_type(rid), timestamp, rid_type(indirection_column), schema_encoding, null_value, rid_type(base_rid)), is_base_page, *columns)
+
+
+# a small private ring of frames used by sequential scans, in the style of PostgreSQL's buffer access strategies.
+# until the ring is full, frames for the scan are taken from the bufferpool as usual and added to the ring.
+# after that, the scan recycles the frames in its own ring instead of evicting pages that other queries are using.
+class ScanRing:
+	def __init__(self, size: int) -> None:
+		self.size = size
+		self.frames: deque[BufferpoolIndex] = deque()
+		self.owned: dict[BufferpoolIndex, FrameKey] = {} # the page the ring loaded into each of its frames
+
+	def add_frame(self, buff_idx: BufferpoolIndex) -> None:
+		if len(self.frames) < self.size and buff_idx not in self.owned:
+			self.frames.append(buff_idx)
+			self.owned[buff_idx] = ("", type(None), 0, 0) # filled in by adopt() once the page is loaded
+
+	def adopt(self, buff_idx: BufferpoolIndex, key: FrameKey) -> None:
+		if buff_idx in self.owned:
+			self.owned[buff_idx] = key
+
+	def drop_frame(self, buff_idx: BufferpoolIndex) -> None:
+		self.frames.remove(buff_idx)
+		del self.owned[buff_idx]
+
+	# returns one of the ring's frames that can be recycled, or None if every frame in the ring is in use.
+	# the frame is claimed the same way Bufferpool.evict_physical_page claims frames.
+	# only frames in `partition` are considered, since the page being loaded has to go there.
+	def recycle_frame(self, bufferpool: Bufferpool, partition: BufferpoolPartition, save: list[BufferpoolIndex], table: Table, claimed: int) -> BufferpoolIndex | None:
+		for _ in range(len(self.frames)):
+			buff_idx = self.frames[0]
+			self.frames.rotate(-1)
+			if bufferpool.frame_partition[buff_idx] is not partition:
+				continue
+			entry = bufferpool.maybe_get_entry(buff_idx)
+			if entry is None:
+				if buff_idx in partition.free_frames and not bufferpool.at_table_max(table, claimed): # the frame was emptied by someone else; it is still ours to use
+					partition.free_frames.discard(buff_idx)
+					return buff_idx
+				continue # claimed, but not filled yet
+			if Bufferpool.frame_key(entry.table, entry.physical_page_id, entry.physical_page_index) != self.owned[buff_idx]:
+				self.drop_frame(buff_idx) # the main pool reused this frame for another page; it's not ours anymore
+				continue
+			if entry.pin_count == 0 and buff_idx not in save and bufferpool.quota_allows_eviction(entry.table, table, claimed):
+				for stats in bufferpool.stats_for(entry.table, partition):
+					stats.evictions += 1
+				with bufferpool.io_lock:
+					if entry.dirty_bit == True:
+						bufferpool.write_back(bufferpool.dirty_neighbour_frames(buff_idx))
+					bufferpool.remove_from_bufferpool(buff_idx)
+				partition.free_frames.discard(buff_idx)
+				return buff_idx
+		return None
 
+# a slice of the bufferpool's frames with its own replacement policy, free list, latch and stats.
+# pages are spread over the partitions by a hash of (table, page ID) (see Bufferpool.partition_for), so threads working on
+# different pages mostly take different latches. frame numbers stay global BufferpoolIndex values; a partition owns
+# the frames in [start, end), and translates them to its policy's own 0-based frame numbers.
+class BufferpoolPartition:
+	def __init__(self, number: int, start: int, end: int, replacement_policy: str) -> None:
+		self.number = number
+		self.start = start
+		self.end = end
+		self.free_frames: set[BufferpoolIndex] = set(BufferpoolIndex(i) for i in range(start, end))
+		self.policy: ReplacementPolicy = make_replacement_policy(replacement_policy, end - start)
+		# protects this partition's frames: their entries and frame_table mappings, pin counts, the free list and the policy.
+		# it is only held for bookkeeping, never while reading a page from disk
+		self.latch = threading.RLock()
+		self.frame_unpinned = threading.Condition(self.latch) # notified whenever a frame's pin count drops to 0
+		# pages being read from disk right now, so a second thread asking for the same page waits for the first
+		# one instead of reading it again
+		self.loads_in_flight: dict[tuple[str, type, int], threading.Event] = {}
+		self.stats = BufferpoolStats()
+
+	def __len__(self) -> int:
+		return self.end - self.start
+
+	def record_load(self, buff_idx: BufferpoolIndex, page_key: FrameKey) -> None:
+		self.policy.record_load(buff_idx - self.start, page_key)
+
+	def record_removal(self, buff_idx: BufferpoolIndex, page_key: FrameKey) -> None:
+		self.policy.record_removal(buff_idx - self.start, page_key)
+
+	def record_access(self, buff_indices: list[BufferpoolIndex]) -> None:
+		self.policy.record_access([buff_idx - self.start for buff_idx in buff_indices])
+
+	def choose_victim(self, can_evict: typing.Callable[[BufferpoolIndex], bool]) -> BufferpoolIndex | None:
+		victim = self.policy.choose_victim(lambda i: can_evict(BufferpoolIndex(i + self.start)))
+		return BufferpoolIndex(victim + self.start) if victim is not None else None
 
 class Bufferpool:
 	TProjected_Columns = List[Literal[0, 1]]
-	def __init__(self, path: str) -> None: 
-		self.entries: Annotated[List[BufferpoolEntry | None], config.BUFFERPOOL_SIZE] = [None] * config.BUFFERPOOL_SIZE
+	def __init__(self, path: str, replacement_policy: str = config.REPLACEMENT_POLICY, io_backend: str = config.IO_BACKEND, readahead: bool = config.READAHEAD_ENABLED, memory_budget: int = config.BUFFERPOOL_MEMORY_BUDGET, num_partitions: int = config.BUFFERPOOL_PARTITIONS, wal: WriteAheadLog | None = None) -> None: 
+		self.size = memory_budget // config.PHYSICAL_PAGE_SIZE # number of frames
+		if self.size < 1:
+			raise(Exception(f"a memory budget of {memory_budget} bytes doesn't fit a single {config.PHYSICAL_PAGE_SIZE} byte physical page"))
+		if num_partitions < 1 or num_partitions > self.size:
+			raise(Exception(f"can't split {self.size} frames into {num_partitions} partitions"))
+		self.entries: List[BufferpoolEntry | None] = [None] * self.size
+		# maps every resident physical page to the frame that holds it, so lookups don't have to scan `entries`.
+		# it is kept in sync by __setitem__, which every load, eviction and close goes through.
+		self.frame_table: dict[FrameKey, BufferpoolIndex] = {}
 		self.path = path
-		self.curr_clock_hand = 0
+		if io_backend not in ("buffered", "mmap"):
+			raise(Exception(f"unknown I/O backend {io_backend}; expected \"buffered\" or \"mmap\""))
+		self.io_backend = io_backend
+		# the frames are split as evenly as possible over the partitions
+		self.partitions: list[BufferpoolPartition] = []
+		self.frame_partition: list[BufferpoolPartition] = [] # the partition of each frame
+		for number in range(num_partitions):
+			partition = BufferpoolPartition(number, self.size * number // num_partitions, self.size * (number + 1) // num_partitions, replacement_policy)
+			self.partitions.append(partition)
+			self.frame_partition += [partition] * len(partition)
+		# per table name. tables without a quota can use any frame not reserved by another table
+		self.table_quotas: dict[str, TableQuota] = {}
+		self.frames_in_use: dict[str, int] = {} # frames holding each table's pages, kept up to date by __setitem__
+		self.quota_lock = threading.Lock() # frames_in_use is shared by all partitions
+		self.scan_state = threading.local() # the scan ring of the sequential scan running on each thread, if any
+		# LATCHING
+		# each partition's latch protects its frames (see BufferpoolPartition). all frames of a page are in the same
+		# partition, so working on one page only ever takes one partition latch.
+		# `frame_latches` protect the contents of each frame's physical page (see latch.py); a frame has to be pinned
+		# before its latch is taken. lock order is partition latch -> frame latches -> io_lock; a thread holding a
+		# frame latch must not wait for a partition latch.
+		self.frame_latches = [RWLatch() for _ in range(self.size)]
+		# held while a frame is written to disk, and while a frame is checked and removed during eviction,
+		# so the background writer and eviction never race on the same frame
+		self.io_lock = threading.RLock()
+		self.background_writer: BackgroundWriter | None = None
+		# mapped files don't need readahead; the OS already does it for them
+		self.readahead: Readahead | None = Readahead(self) if readahead and io_backend == "buffered" else None
+		self.stats = BufferpoolStats() # each Table has its own as well
+		self.query_depth = threading.local() # how deeply queries are nested on each thread, so only the outermost one is counted
+		self.wal = wal # changes to pages are logged here first, if the database has a write-ahead log
 	
 	# def get_item(self, key: int) -> BufferpoolEntry | None:
 	# 	entry = self.entries[key]
@@ -898,22 +1204,18 @@ class Bufferpool:
 	# look up an rid in the page directory to get its pageID
 	@staticmethod
 	def rid_to_page_id(table: Table, rid: RID) -> BaseTailPageID:
-		page_dir = table.page_directory_buff.value_get()
-		if not rid in page_dir:
+		try:
+			return table.page_directory_buff.page_id(rid) # type: ignore[arg-type]
+		except (KeyError, TypeError): # TypeError for a None rid
 			raise(Exception("RECORD NOT PRESENT"))
-			return BufferpoolRecordSearchResult(False, [], [], None)
-		page_directory_entry = page_dir[rid]
-		return page_directory_entry.page_id
 
 	# look up an rid in the page directory to get its offset
 	@staticmethod
 	def rid_to_offset(table: Table, rid: RID) -> int:
-		page_dir = table.page_directory_buff.value_get()
-		if not rid in page_dir:
+		try:
+			return table.page_directory_buff.offset(rid) # type: ignore[arg-type]
+		except (KeyError, TypeError):
 			raise(Exception("RECORD NOT PRESENT"))
-			return BufferpoolRecordSearchResult(False, [], [], None)
-		page_directory_entry = page_dir[rid]
-		return page_directory_entry.offset
 
 	def __getitem__(self, key: int) -> BufferpoolEntry:
 		entry = self.entries[key]
@@ -924,17 +1226,255 @@ class Bufferpool:
 		return self.entries[key]
 	
 	def __setitem__(self, key: int, item: BufferpoolEntry | None) -> None:
+		old_entry = self.entries[key]
+		if old_entry is not None:
+			old_key = Bufferpool.frame_key(old_entry.table, old_entry.physical_page_id, old_entry.physical_page_index)
+			if self.frame_table.get(old_key) == key: # a newer copy of the same physical page may have replaced this frame in the table
+				del self.frame_table[old_key]
+			self.frame_partition[key].record_removal(BufferpoolIndex(key), old_key)
+			with self.quota_lock:
+				self.frames_in_use[old_entry.table.name] -= 1
+			self.frame_partition[key].free_frames.add(BufferpoolIndex(key))
 		self.entries[key] = item
+		if item is not None:
+			new_key = Bufferpool.frame_key(item.table, item.physical_page_id, item.physical_page_index)
+			self.frame_table[new_key] = BufferpoolIndex(key)
+			self.frame_partition[key].record_load(BufferpoolIndex(key), new_key)
+			with self.quota_lock:
+				self.frames_in_use[item.table.name] = self.frames_in_use.get(item.table.name, 0) + 1
+			self.frame_partition[key].free_frames.discard(BufferpoolIndex(key))
+
+	# raises ValueError if the partitions are too small for a table with total_columns columns (metadata included).
+	# all frames of a page are in the same partition, and a page may have to stay pinned while another one is brought
+	# in next to it, so every partition needs room for two pages of the table
+	def check_table_fits(self, name: str, total_columns: int) -> None:
+		smallest_partition = min(len(partition) for partition in self.partitions)
+		if smallest_partition < 2 * total_columns:
+			raise(ValueError(f"table {name} needs {2 * total_columns} frames ({2 * total_columns * config.PHYSICAL_PAGE_SIZE} bytes) in every bufferpool partition to hold two of its pages, but the smallest of the {len(self.partitions)} partitions has {smallest_partition}; use a larger memory budget or fewer partitions"))
+
+	# gives a table a reserved and/or maximum share of the bufferpool, in bytes.
+	# reserved frames can't be taken by other tables while the table uses fewer frames than that, so a big table
+	# scanning through the bufferpool can't push a small hot table out. the table itself is never allowed to use
+	# more than max_bytes. a table needs at least enough frames for one page (all its columns) to get anything done
+	def set_table_quota(self, table: Table, reserved_bytes: int = 0, max_bytes: int | None = None) -> None:
+		reserved_frames = reserved_bytes // config.PHYSICAL_PAGE_SIZE
+		max_frames = max_bytes // config.PHYSICAL_PAGE_SIZE if max_bytes is not None else None
+		if max_frames is not None and max_frames < table.total_columns:
+			raise(Exception(f"table {table.name} needs at least {table.total_columns * config.PHYSICAL_PAGE_SIZE} bytes of the bufferpool to hold a page"))
+		if max_frames is not None and reserved_frames > max_frames:
+			raise(Exception(f"reserved share of table {table.name} is larger than its maximum share"))
+		reserved_by_others = sum(quota.reserved_frames for name, quota in self.table_quotas.items() if name != table.name)
+		if reserved_by_others + reserved_frames > self.size:
+			raise(Exception(f"reserving {reserved_bytes} bytes for table {table.name} would reserve more than the bufferpool's {self.size * config.PHYSICAL_PAGE_SIZE} bytes"))
+		self.table_quotas[table.name] = TableQuota(reserved_frames, max_frames)
+
+	# frames reserved by tables other than `table` that those tables aren't using right now
+	def unused_reserved_frames(self, table: Table) -> int:
+		return sum(max(0, quota.reserved_frames - self.frames_in_use.get(name, 0)) for name, quota in self.table_quotas.items() if name != table.name)
+
+	# whether `table` has used up its maximum share, counting `claimed` frames it is about to fill
+	def at_table_max(self, table: Table, claimed: int) -> bool:
+		quota = self.table_quotas.get(table.name)
+		return quota is not None and quota.max_frames is not None and self.frames_in_use.get(table.name, 0) + claimed >= quota.max_frames
+
+	# whether a page of `owner` may be evicted to make room for a page of `table`
+	def quota_allows_eviction(self, owner: Table, table: Table, claimed: int) -> bool:
+		if owner is table:
+			return True
+		if self.at_table_max(table, claimed):
+			return False # the table has to make room among its own pages
+		quota = self.table_quotas.get(owner.name)
+		return quota is None or self.frames_in_use.get(owner.name, 0) > quota.reserved_frames
+
+	@property
+	def scan_ring(self) -> ScanRing | None:
+		return getattr(self.scan_state, "ring", None)
+
+	@scan_ring.setter
+	def scan_ring(self, ring: ScanRing | None) -> None:
+		self.scan_state.ring = ring
+
+	# latches the physical pages of the given (pinned) frames, shared for reading or exclusive for writing.
+	# None indices (columns that weren't requested) are skipped
+	def latch_pages(self, buff_indices: Sequence[BufferpoolIndex | None], exclusive: bool = False) -> typing.ContextManager[None]:
+		return latch_frames(self.frame_latches, [idx for idx in buff_indices if idx is not None], exclusive)
+
+	# the partition a page's frames live in
+	def partition_for(self, table: Table, page_id: PageID) -> BufferpoolPartition:
+		if len(self.partitions) == 1:
+			return self.partitions[0]
+		return self.partitions[hash((table.name, type(page_id), int(page_id))) % len(self.partitions)]
+
+	# the stats objects an event on this table's pages is counted in: the whole bufferpool's, the table's and,
+	# for events that happen in a partition, the partition's
+	def stats_for(self, table: Table, partition: BufferpoolPartition | None = None) -> tuple[BufferpoolStats, ...]:
+		if partition is None:
+			return (self.stats, table.stats)
+		return (self.stats, table.stats, partition.stats)
+
+	# counts one query in the stats of the bufferpool and the table. queries run inside another query's scope
+	# (update and delete run a select first) are part of that query and aren't counted separately
+	@contextmanager
+	def query_scope(self, table: Table) -> Iterator[None]:
+		depth = getattr(self.query_depth, "value", 0)
+		if depth == 0:
+			for stats in self.stats_for(table):
+				stats.queries += 1
+		self.query_depth.value = depth + 1
+		try:
+			yield
+		finally:
+			self.query_depth.value = depth
+		if depth == 0 and self.wal is not None:
+			self.wal.commit() # the outermost query is the unit of commit
+
+	# logs a change to a record (see wal.py) and stamps the frames it changes with the record's LSN.
+	# the caller holds the frames' exclusive latches, so the change and the stamp are seen together by write_back.
+	# call it after the frames are changed and marked dirty: a checkpoint that starts after the record is logged then
+	# always finds the frames dirty (see Database.checkpoint).
+	# `values` are (raw column index, value) pairs as written to the page at `offset`. does nothing without a log
+	def log_change(self, table: Table, kind: int, page_id: BaseTailPageID, offset: int, values: list[tuple[int, int]], buff_indices: Sequence[BufferpoolIndex | None], rid: int = 0, metadata_page_id: int = 0) -> None:
+		if self.wal is None:
+			return
+		page_type: Literal["base", "tail"] = "base" if isinstance(page_id, BasePageID) else "tail"
+		lsn = self.wal.append(kind, table.name, page_type, page_id, metadata_page_id, offset, rid, values)
+		for buff_idx in buff_indices:
+			if buff_idx is not None:
+				self[buff_idx].page_lsn = lsn
+
+	@staticmethod
+	def frame_key(table: Table, page_id: PageID, physical_page_index: RawIndex | int) -> FrameKey:
+		return (table.name, type(page_id), int(page_id), int(physical_page_index))
+
+	# returns the frame holding the given physical page, or None if it is not in the bufferpool
+	def lookup_frame(self, table: Table, page_id: PageID, physical_page_index: RawIndex | int) -> BufferpoolIndex | None:
+		return self.frame_table.get(Bufferpool.frame_key(table, page_id, physical_page_index))
 
 	def close_bufferpool(self) -> None:
-		for i in [BufferpoolIndex(_) for _ in range(config.BUFFERPOOL_SIZE)]:
+		self.stop_background_writer()
+		if self.readahead is not None:
+			self.readahead.shutdown()
+			self.readahead = None
+		self.flush_dirty_frames()
+		for i in [BufferpoolIndex(_) for _ in range(self.size)]:
 			if self.entries[i]!=None:
-				if self[i].dirty_bit==True:
-					table = self[i].table
-					self.write_to_disk(table, i)
 				self.change_bufferpool_entry(None,i)
 				# bufferpool_entry=BufferpoolEntry(0, None, False,  None,  None,  None,  None)
 	
+	def start_background_writer(self) -> None:
+		if self.background_writer is None:
+			self.background_writer = BackgroundWriter(self)
+			self.background_writer.start()
+
+	def stop_background_writer(self) -> None:
+		if self.background_writer is not None:
+			self.background_writer.stop()
+			self.background_writer = None
+
+	# writes every frame that is dirty when it is looked at, pinned or not. returns the number written.
+	# a frame another thread (the background writer, clean_frame, eviction) has already marked clean may still be on
+	# its way to disk, so this also waits for those writes; when it returns, every change made before it was called
+	# has been written (checkpoints rely on this before they sync the files and cut the log)
+	def flush_dirty_frames(self) -> int:
+		num_written = self.write_back([BufferpoolIndex(i) for i, entry in enumerate(self.entries) if entry is not None and entry.dirty_bit])
+		self.wait_for_write_backs()
+		return num_written
+
+	# waits until the write-backs that have already copied their pages are done. write_back_partition copies pages
+	# under the partition latch and takes io_lock before it lets go of the latch, so once every partition latch and
+	# then io_lock have been taken, each of those writes has finished
+	def wait_for_write_backs(self) -> None:
+		for partition in self.partitions:
+			with partition.latch:
+				pass
+		with self.io_lock:
+			pass
+
+	def dirty_frame_count(self) -> int:
+		return len([entry for entry in self.entries if entry is not None and entry.dirty_bit])
+
+	# writes a dirty frame to disk and marks it clean, without evicting it. returns False if there was nothing to write.
+	# the dirty bit is cleared before the page is copied, so a change made while the write is in progress
+	# sets it again and the frame gets written again later.
+	def clean_frame(self, buff_idx: int) -> bool:
+		return self.write_back([BufferpoolIndex(buff_idx)]) > 0
+
+	# writes the given frames to disk (the ones that are dirty) and marks them clean. returns the number of frames written.
+	# frames are grouped by file and sorted by position, and physical pages that are next to each other in a file
+	# (like the columns of one base page) are written with one vectored write.
+	# as in clean_frame, dirty bits are cleared before the pages are copied.
+	def write_back(self, buff_indices: list[BufferpoolIndex]) -> int:
+		indices_by_partition: dict[int, list[BufferpoolIndex]] = {}
+		for buff_idx in buff_indices:
+			indices_by_partition.setdefault(self.frame_partition[buff_idx].number, []).append(buff_idx)
+		return sum(self.write_back_partition(self.partitions[number], indices) for number, indices in indices_by_partition.items())
+
+	# write_back for frames of one partition.
+	# pages are copied under the partition latch (and their frame latches) and written after the partition latch
+	# is released; io_lock is taken before it is released so eviction can't drop a frame whose write hasn't finished.
+	def write_back_partition(self, partition: BufferpoolPartition, buff_indices: list[BufferpoolIndex]) -> int:
+		partition.latch.acquire()
+		try:
+			pages_by_path: dict[str, tuple[FileHandler, list[tuple[int, bytes]]]] = {}
+			num_written = 0
+			max_page_lsn = 0
+			for buff_idx in buff_indices:
+				entry = self.maybe_get_entry(buff_idx)
+				if entry is None or not entry.dirty_bit:
+					continue
+				with self.frame_latches[buff_idx].shared(): # waits for a query that is changing the page
+					entry.dirty_bit = False
+					page_copy = bytes(entry.physical_page.data) # copy first; the page may be changed by a query while it is being written
+					page_lsn = entry.page_lsn
+				num_written += 1
+				file_handler = entry.table.file_handler
+				for stats in self.stats_for(entry.table, partition):
+					stats.dirty_write_backs += 1
+				if file_handler.mapped_files is not None:
+					continue # the frame is a view of the mapped file, so the change is already in the file (Database.open doesn't allow a log with mapped files)
+				max_page_lsn = max(max_page_lsn, page_lsn)
+				for stats in self.stats_for(entry.table, partition):
+					stats.bytes_written += config.PHYSICAL_PAGE_SIZE
+				page_id = entry.physical_page_id
+				assert isinstance(page_id, BasePageID) or isinstance(page_id, TailPageID)
+				if self.readahead is not None and isinstance(page_id, BasePageID):
+					self.readahead.invalidate(entry.table, page_id)
+				path, position = file_handler.physical_page_location(page_id, entry.physical_page_index)
+				pages_by_path.setdefault(path, (file_handler, []))[1].append((position, page_copy))
+			self.io_lock.acquire()
+		finally:
+			partition.latch.release()
+		try:
+			if self.wal is not None and max_page_lsn > 0:
+				self.wal.flush(max_page_lsn) # write-ahead: the log records of a change reach disk before the page does
+			for path, (file_handler, pages) in pages_by_path.items():
+				pages.sort(key=lambda page: page[0])
+				run_position, run = pages[0][0], [pages[0][1]]
+				for position, data in pages[1:]:
+					if position == run_position + len(run) * config.PHYSICAL_PAGE_SIZE:
+						run.append(data)
+					else:
+						file_handler.fd_cache.writev(path, run_position, run)
+						run_position, run = position, [data]
+				file_handler.fd_cache.writev(path, run_position, run)
+			return num_written
+		finally:
+			self.io_lock.release()
+
+	# returns the dirty, unpinned frames holding other columns of the same page as the given frame, plus the frame itself.
+	# when a dirty frame is evicted, these are written along with it since they sit right next to it on disk
+	def dirty_neighbour_frames(self, buff_idx: BufferpoolIndex) -> list[BufferpoolIndex]:
+		entry = self[buff_idx]
+		neighbours = [buff_idx]
+		for raw_idx in range(entry.table.total_columns):
+			neighbour_idx = self.lookup_frame(entry.table, entry.physical_page_id, raw_idx)
+			if neighbour_idx is None or neighbour_idx == buff_idx:
+				continue
+			neighbour = self[neighbour_idx]
+			if neighbour.dirty_bit and neighbour.pin_count == 0:
+				neighbours.append(neighbour_idx)
+		return neighbours
+
 	def change_bufferpool_entry(self, entry: BufferpoolEntry | None, buff_idx: BufferpoolIndex) -> None:
 		self[buff_idx] = entry
 
@@ -966,7 +1506,11 @@ class Bufferpool:
 	def change_pin_count(self, buff_indices: list[BufferpoolIndex], change: int) -> None:
 		for idx in buff_indices:
 			if idx is not None:
-				self[idx].pin_count += change
+				partition = self.frame_partition[idx]
+				with partition.latch:
+					self[idx].pin_count += change
+					if self[idx].pin_count == 0:
+						partition.frame_unpinned.notify_all()
 		# print(f"pin counts are now {list(map(lambda e: e.pin_count if e is not None else None, self.entries))}")
 
 	
@@ -994,27 +1538,14 @@ class Bufferpool:
 		# after this point, data_columns_found array is NOT_FOUND if requested and None if not requested.
 
 		metadata_buff_indices: List[BufferpoolIndex | TNOT_FOUND] = [-1] * config.NUM_METADATA_COL
-		#column_list = [None] * len(projected_columns_index)
-
-		for i in [BufferpoolIndex(_) for _ in range(config.BUFFERPOOL_SIZE)]:
-			if self.maybe_get_entry(i) is None:
-				continue
-			if helper.eq(self[i].physical_page_id, page_id, False):
-				# print(f"potential match... for entry idx {i} and type {type(self[i].physical_page_id)}")
-				raw_idx = self[i].physical_page_index
-				assert raw_idx is not None, "non None in ids_of_physical_pages but None in index_of_physical_page_in_page?"
-				if raw_idx < config.NUM_METADATA_COL:
-					# print(f"adding metadata idx {raw_idx} with value {i} for record type ")
-					metadata_buff_indices[raw_idx] = i
-				else:
-					data_idx = raw_idx.toDataIndex() 
-					if data_idx in requested_columns: # is a data column we requested?
-						# print("adding data buff idx")
-						data_buff_indices[data_idx] = i
-						# print("FOUND something")
-					else:
-						# print(f"data_idx was {data_idx} but requested_columns was {requested_columns}")
-						continue
+		for raw_idx in range(config.NUM_METADATA_COL):
+			buff_idx = self.lookup_frame(table, page_id, raw_idx)
+			if buff_idx is not None:
+				metadata_buff_indices[raw_idx] = buff_idx
+		for col in requested_columns:
+			buff_idx = self.lookup_frame(table, page_id, col.toRawIndex())
+			if buff_idx is not None:
+				data_buff_indices[col] = buff_idx
 
 		found = (len([True for idx in data_buff_indices if idx == -1]) == 0) and (len([True for idx in metadata_buff_indices if idx == -1]) == 0)
 		return BufferpoolPageSearchResult(found, data_buff_indices, metadata_buff_indices)
@@ -1026,16 +1557,19 @@ class Bufferpool:
 
 	def delete_nth_record(self, table : Table, page_id: PageID, offset :int) -> bool:
 		bitmask = table.ith_total_col_shift(config.RID_COLUMN)
-		null_column_marked=False
-		rid_column_marked=False
-		for entry in self.entries:
-			if entry is not None and entry.physical_page_id == page_id and entry.physical_page_index == config.NULL_COLUMN:
-				entry.physical_page.data[offset:offset+8] = int.to_bytes(bitmask, config.BYTES_PER_INT, "big")
-				null_column_marked=True
-			if entry is not None and entry.physical_page_id == page_id and entry.physical_page_index == config.RID_COLUMN:
-				entry.physical_page.data[offset:offset+8] = int.to_bytes(0, config.BYTES_PER_INT, "big")
-				rid_column_marked=True
-		return rid_column_marked and null_column_marked
+		with self.partition_for(table, page_id).latch: # the frames aren't pinned, so keep them from being evicted while they are changed
+			null_buff_idx = self.lookup_frame(table, page_id, config.NULL_COLUMN)
+			rid_buff_idx = self.lookup_frame(table, page_id, config.RID_COLUMN)
+			if null_buff_idx is None or rid_buff_idx is None:
+				return False
+			with self.latch_pages([null_buff_idx, rid_buff_idx], exclusive=True):
+				assert isinstance(page_id, BasePageID) or isinstance(page_id, TailPageID)
+				self[null_buff_idx].physical_page.data[offset:offset+8] = int.to_bytes(bitmask, config.BYTES_PER_INT, "big")
+				self[null_buff_idx].dirty_bit = True
+				self[rid_buff_idx].physical_page.data[offset:offset+8] = int.to_bytes(0, config.BYTES_PER_INT, "big")
+				self[rid_buff_idx].dirty_bit = True
+				self.log_change(table, WAL_WRITE, page_id, offset, [(config.NULL_COLUMN, bitmask), (config.RID_COLUMN, 0)], [null_buff_idx, rid_buff_idx])
+		return True
 	
 	# updates a column of a specified record in place.
 	# returns True on success
@@ -1053,7 +1587,7 @@ class Bufferpool:
 			proj_metadata_idx[raw_col_idx] = 1
 			desired_page_type += "_metadata" # base_metadata type
 		else:
-			proj_data_idx[raw_col_idx] = 1
+			proj_data_idx[raw_col_idx.toDataIndex()] = 1
 			# desired_page_type remains as "base"
 		
 		# col_idx = raw_col_idx.toDataIndex()
@@ -1086,25 +1620,31 @@ class Bufferpool:
 		# 	# self.change_bufferpool_entry(BufferpoolEntry(0, ))
 
 		page_id = self.rid_to_page_id(table, rid)
-		indexes = self.get_page(table, page_id, proj_data_idx)
 		page_offset = self.rid_to_offset(table, rid)
-		
-		assert indexes is not None	# should this be an assert???
-
-		# now, we can actually update the value now that we know it's in the bufferpool
-		self[indexes[raw_col_idx]].physical_page.data[page_offset : page_offset+config.BYTES_PER_INT] = helper.encode(new_value) 
-		self[indexes[raw_col_idx]].dirty_bit = True # the value has been changed, it should be dirty
+		with self.pinned_page(table, page_id, proj_data_idx) as page:
+			if page is None:
+				return False
+			buff_idx = page.metadata_buff_indices[raw_col_idx] if is_metadata else page.data_buff_indices[raw_col_idx.toDataIndex()] # type: ignore[assignment]
+			assert buff_idx is not None and buff_idx != -1
+
+			# now, we can actually update the value now that we know it's in the bufferpool
+			with self.frame_latches[buff_idx].exclusive():
+				self[buff_idx].physical_page.data[page_offset : page_offset+config.BYTES_PER_INT] = helper.encode(new_value) 
+				self[buff_idx].dirty_bit = True # the value has been changed, it should be dirty
+				self.log_change(table, WAL_WRITE, page_id, page_offset, [(raw_col_idx, new_value)], [buff_idx], int(rid))
 		return True
 	
-	def update_nth_record(self, page_id: PageID, offset: int, col_idx: int, new_value: int) -> bool:
-		record_column_entry = None
-		for entry in self.entries:
-			if entry is not None and entry.physical_page_id == page_id and entry.physical_page_index == col_idx:
-				record_column_entry = entry
-		
-		if record_column_entry is None: 
-			return False
-		record_column_entry.physical_page.data[offset: offset+8] = int.to_bytes(new_value, config.BYTES_PER_INT,"big")
+	def update_nth_record(self, table: Table, page_id: PageID, offset: int, col_idx: int, new_value: int) -> bool:
+		with self.partition_for(table, page_id).latch: # the frame isn't pinned, so keep it from being evicted while it is changed
+			buff_idx = self.lookup_frame(table, page_id, col_idx)
+			if buff_idx is None: 
+				return False
+			record_column_entry = self[buff_idx]
+			with self.frame_latches[buff_idx].exclusive():
+				assert isinstance(page_id, BasePageID) or isinstance(page_id, TailPageID)
+				record_column_entry.physical_page.data[offset: offset+8] = int.to_bytes(new_value, config.BYTES_PER_INT,"big")
+				record_column_entry.dirty_bit = True
+				self.log_change(table, WAL_WRITE, page_id, offset, [(col_idx, new_value)], [buff_idx])
 		return True
 
 	def get_updated_col(self, table: Table, record: Record, col_idx: DataIndex) -> int | None:
@@ -1119,19 +1659,16 @@ class Bufferpool:
 			assert curr_rid is not None, "record rid wasn't none, so none of the indirections should be none either"
 			proj_col: List[Literal[0, 1]] = [0] * table.num_columns
 			proj_col[col_idx] = 1 # only get the desired column
-			curr_record = self.get_record(table, curr_rid, proj_col)
+			curr_record = self.read_record(table, curr_rid, proj_col)
 			assert curr_record is not None, "a record with a non-None RID was not found"
-			curr_schema_encoding = curr_record.get_value().metadata.schema_encoding ## this schema encoding doesn't work properly
+			curr_schema_encoding = curr_record.metadata.schema_encoding ## this schema encoding doesn't work properly
 			while helper.ith_bit(curr_schema_encoding, table.num_columns, col_idx, False) == 0b0: # while not found
-				assert curr_record is not None, "a record with a non-None RID was not found"
-				curr_rid = curr_record.get_value().metadata.indirection_column
+				curr_rid = curr_record.metadata.indirection_column
 				assert curr_rid is not None
-				# curr_record.unpin()
-				curr_record = self.get_record(table, curr_rid, proj_col)
-				assert curr_record is not None
-				curr_schema_encoding = curr_record.get_value().metadata.schema_encoding
-			desired_col = curr_record.get_value()[col_idx]
-			# curr_record.unpin()
+				curr_record = self.read_record(table, curr_rid, proj_col)
+				assert curr_record is not None, "a record with a non-None RID was not found"
+				curr_schema_encoding = curr_record.metadata.schema_encoding
+			desired_col = curr_record[col_idx]
 		return desired_col 
 	
 	def get_version_col(self, table: Table, record: Record, col_idx: DataIndex, relative_version: int) -> int | None:
@@ -1146,9 +1683,9 @@ class Bufferpool:
 			assert curr_rid is not None, "record rid wasn't none, so none of the indirections should be none either"
 			proj_col: List[Literal[0, 1]] = [0] * table.num_columns
 			proj_col[col_idx] = 1 # only get the desired column
-			buff_record = self.get_record(table, curr_rid, proj_col)
-			assert buff_record is not None
-			record = buff_record.get_value()
+			read_res = self.read_record(table, curr_rid, proj_col)
+			assert read_res is not None
+			record = read_res
 			curr_record = record
 			assert curr_record is not None, "a record with a non-None RID was not found"
 			curr_schema_encoding = curr_record.metadata.schema_encoding
@@ -1158,16 +1695,16 @@ class Bufferpool:
 			curr_rid = curr_record.metadata.indirection_column
 			while counter > relative_version or helper.ith_bit(curr_schema_encoding, table.num_columns, col_idx, False) == 0b0: # while not found
 				assert curr_rid is not None
-				temp = self.get_record(table, curr_rid, proj_col)
+				temp = self.read_record(table, curr_rid, proj_col)
 				if temp is None:
 					overversioned = True
 					break
 				assert curr_record is not None
-				curr_rid = temp.get_value().metadata.indirection_column
+				curr_rid = temp.metadata.indirection_column
 				assert curr_rid is not None, "potential incomplete delete?"
-				record_buff = self.get_record(table, curr_rid, proj_col)
-				assert record_buff is not None
-				curr_record = record_buff.get_value()
+				next_record = self.read_record(table, curr_rid, proj_col)
+				assert next_record is not None
+				curr_record = next_record
 				curr_schema_encoding = curr_record.metadata.schema_encoding
 				counter -= 1
 			if overversioned is True:
@@ -1180,16 +1717,16 @@ class Bufferpool:
 		# table: Table = next(table for table in self.tables if table.name == table_name)
 
 		# If there are multiple writers we probably need a lock here so the indirection column is not modified after we get it
-		buffered_record = self.get_record(table, record_id, projected_columns_index)
-		if buffered_record is None:
+		record = self.read_record(table, record_id, projected_columns_index)
+		if record is None:
 			return None
 		columns: List[int | None] = []
 		for i in range(len(projected_columns_index)):
 			if projected_columns_index[i] == 1:
-				columns.append(self.get_version_col(table, buffered_record.get_value(), DataIndex(i), relative_version))
+				columns.append(self.get_version_col(table, record, DataIndex(i), relative_version))
 			else:
 				columns.append(None)
-		version_record = Record(buffered_record.get_value().metadata, True, *columns)
+		version_record = Record(record.metadata, True, *columns)
 		return version_record
 
 	# THIS FUNCTION RECEIVES ONLY **BASE** RECORDS
@@ -1198,125 +1735,144 @@ class Bufferpool:
 		# table: Table = next(table for table in self.tables if table.name == table_name)
 
 		# If there are multiple writers we probably need a lock here so the indirection column is not modified after we get it
-		buffered_record = self.get_record(table, record_id, projected_columns_index)
-		if buffered_record is None:
+		record = self.read_record(table, record_id, projected_columns_index)
+		if record is None:
 			return None
 		columns: List[int | None] = []
 		for i in range(len(projected_columns_index)):
 			if projected_columns_index[i] == 1:
-				columns.append(self.get_updated_col(table, buffered_record.get_value(), DataIndex(i)))
+				columns.append(self.get_updated_col(table, record, DataIndex(i)))
 			else:
 				columns.append(None)
-		updated_record = Record(buffered_record.get_value().metadata, True, *columns)
-		# buffered_record.unpin()
+		updated_record = Record(record.metadata, True, *columns)
 		return updated_record
 
 		# read_res = table.file_handler.read_projected_cols_of_page(page_directory_entry.page_id, proj_data_cols, proj_metadata_cols)
 
 	# ONLY THIS FUNCTION reads from disk
-	def bring_from_disk(self, table: Table, page_id: BaseTailPageID, proj_data_cols: List[Literal[0, 1]] | None = None, save: List[BufferpoolIndex] = []) -> bool:
+	# frames are claimed under the partition latch, the page is read without it, and the frames are filled under it again.
+	# callers make sure no other thread is loading the same page at the same time (see get_page)
+	# only the data and metadata columns marked with 1 in proj_data_cols and proj_metadata_cols are read and given frames
+	def bring_from_disk(self, table: Table, page_id: BaseTailPageID, proj_data_cols: List[Literal[0, 1]] | None = None, save: List[BufferpoolIndex] = [], proj_metadata_cols: List[Literal[0, 1]] | None = None) -> bool:
 		if proj_data_cols is None:
 			proj_data_cols = [1] * table.num_columns # type: ignore[assignment]
+		if proj_metadata_cols is None:
+			proj_metadata_cols = [1] * config.NUM_METADATA_COL # type: ignore[assignment]
 
-		assert proj_data_cols is not None
+		assert proj_data_cols is not None and proj_metadata_cols is not None
 
-		num_slots = config.NUM_METADATA_COL # evict enough slots for metadata and data
-		for c in proj_data_cols:
+		num_slots = 0 # evict enough slots for the requested metadata and data
+		for c in proj_metadata_cols + proj_data_cols:
 			if c == 1:
 				num_slots += 1
 		if num_slots == 0:
 			return True # no slots is basically a no-op
-		print(f"evicted {num_slots} slots ")
-		evicted_buff_idx: List[BufferpoolIndex] | None = self.evict_n_slots(num_slots, save)
+		partition = self.partition_for(table, page_id)
+		with partition.latch:
+			evicted_buff_idx: List[BufferpoolIndex] | None = self.evict_n_slots(table, partition, num_slots, save)
 		if evicted_buff_idx is None:
 			return False
-		read_res = table.file_handler.read_projected_cols_of_page(page_id, proj_data_cols)
-		assert read_res is not None
+		try:
+			read_res = None
+			if self.readahead is not None and isinstance(page_id, BasePageID):
+				read_res = self.readahead.take(table, page_id)
+				if read_res is not None: # the read-ahead copy has every column; keep the ones that were asked for
+					read_res = FilePageReadResult([page if proj_metadata_cols[i] == 1 else None for i, page in enumerate(read_res.metadata_physical_pages)], [page if proj_data_cols[i] == 1 else None for i, page in enumerate(read_res.data_physical_pages)])
+			if read_res is None:
+				read_res = table.file_handler.read_projected_cols_of_page(page_id, proj_data_cols, proj_metadata_cols)
+			assert read_res is not None
+		except BaseException:
+			with partition.latch:
+				partition.free_frames.update(evicted_buff_idx) # give the claimed frames back
+			raise
 		metadata_physical_pages, data_physical_pages = read_res
 		# print(f"read {proj_data_cols} from {page_id} and got {data_physical_pages}")
 		# assert t_ is not None
 		all_physical_pages = metadata_physical_pages + data_physical_pages
 
-		j = 0
-		for i, physical_page_ in enumerate(all_physical_pages):
-			if physical_page_ is not None:
-				buff_idx = evicted_buff_idx[j]
-				self[buff_idx] = BufferpoolEntry(0, physical_page_, False, page_id, RawIndex(i), table)
-				# print(f"set {buff_idx} to {page_id} and type {type(page_id)}")
-				j += 1 # use up one slot
+		with partition.latch:
+			j = 0
+			for i, physical_page_ in enumerate(all_physical_pages):
+				if physical_page_ is not None:
+					buff_idx = evicted_buff_idx[j]
+					self[buff_idx] = BufferpoolEntry(0, physical_page_, False, page_id, RawIndex(i), table)
+					if self.scan_ring is not None:
+						self.scan_ring.adopt(buff_idx, Bufferpool.frame_key(table, page_id, i))
+					# print(f"set {buff_idx} to {page_id} and type {type(page_id)}")
+					j += 1 # use up one slot
+			partition.free_frames.update(evicted_buff_idx[j:]) # in case fewer pages came back than were asked for
+		for stats in self.stats_for(table, partition):
+			stats.misses += j
+			stats.bytes_read += j * config.PHYSICAL_PAGE_SIZE # for mapped files, bytes mapped rather than copied
 		return True
 
 
 	# TODO remove
-	def get_page(self, table: Table, page_id: BaseTailPageID, projected_columns_index: list[Literal[0] | Literal[1]]) -> BufferedPage | None: # type: ignore[return]
+	# returns the requested columns of the page, pinned. the lookup and the pinning happen under the partition latch,
+	# so the frames can't be evicted in between. if columns are missing, they are read from disk by at most one
+	# thread at a time; other threads asking for the same page wait for that read and look again.
+	# if every frame is pinned, waits up to config.PIN_WAIT_TIMEOUT seconds for other threads to unpin some before giving up
+	def get_page(self, table: Table, page_id: BaseTailPageID, projected_columns_index: list[Literal[0] | Literal[1]]) -> BufferedPage | None:
 		requested_columns: list[DataIndex] = [DataIndex(i) for i, binary_item in enumerate(projected_columns_index) if binary_item == 1]
-		found, data_buff_indices, metadata_buff_indices = self.is_page_in_bufferpool(table, page_id, projected_columns_index)
-		assert len(data_buff_indices) == table.num_columns
-		assert len(metadata_buff_indices) == config.NUM_METADATA_COL
-
-		# None means not requested
-
-		data_cols_to_get: List[DataIndex] = []
-		metadata_cols_to_get: List[int] = [] # should be from 0 to config.NUM_METADATA_COL - 1
-
-		# the main difference here is that a certain column MAY be requested, 
-		# but all columns of metadata are requested.
-		# as a reminder, -1 for a buff_idx here means not found, None means not requested.
-		buff_idx_to_save: list[BufferpoolIndex] = [] # these are only temporarily "pinned" through the save array
-
-		for j, buff_idx in enumerate(data_buff_indices):
-			print(f"BUFF IDX = {buff_idx}")
-			if buff_idx == -1 and (j in requested_columns):
-				data_cols_to_get.append(DataIndex(j))
-			elif buff_idx == -1 and (not (j in requested_columns)):
-				# breakpoint()
-				raise(Exception("Hfehwkjefh"))
-				# print(f"-1::: missing col was {j} but cols were {requested_columns}")
-			# elif buff_idx == None:
-			# 	data_physical_pages.append(None)
-			elif isinstance(buff_idx, BufferpoolIndex) and buff_idx != -1:
-				buff_idx_to_save.append(buff_idx)
-			else:
-				raise(Exception("WTF"))
-			# 	data_physical_pages.append(self[buff_idx].physical_page)
-			# 	self[buff_idx].pin_count += 1 
-		# 	else:
-		# 		raise(Exception("unexpected datatype for buff_idx inside the is_record_in_bufferpool output"))
-
-		for j, buff_idx in enumerate(metadata_buff_indices):
-			if buff_idx == -1:
-				metadata_cols_to_get.append(DataIndex(j))
-			else:
-				buff_idx_to_save.append(buff_idx) # type: ignore[arg-type]
-
-		# NOTE: this is the new proj_cols, to get only whatever we don't have already
-		proj_data_cols: List[Literal[0, 1]] = [0] * table.num_columns
-		for i in range(len(data_cols_to_get)):
-			proj_data_cols[data_cols_to_get[i]] = 1
-
-		if not self.bring_from_disk(table, page_id, proj_data_cols, buff_idx_to_save):
-			return None
-
-
-		found, data_buff_indices, metadata_buff_indices = self.is_page_in_bufferpool(table, page_id, projected_columns_index)
-		assert found, "record not found after bringing it into bufferpool"
-
-		# filtering out the -1s should be the same as taking out the Nones
-		# ie taking out all not requesteds should leave us with all columns
-		filtered_data_buff_indices =  [idx for idx in data_buff_indices if (idx != -1) and (isinstance(idx, BufferpoolIndex)) ]
-		filtered_metadata_buff_indices =  [idx for idx in metadata_buff_indices if (idx != -1) and (isinstance(idx, BufferpoolIndex)) ]
-		relevant_data_buff_indices = [idx for idx in data_buff_indices if idx is not None]
-		relevant_metadata_buff_indices = [idx for idx in metadata_buff_indices if idx is not None]
-		assert len(filtered_data_buff_indices) == len(relevant_data_buff_indices)
-		assert len(filtered_metadata_buff_indices) == len(relevant_metadata_buff_indices)
-
-		for idx in data_buff_indices:
-			assert (idx != -1 and isinstance(idx, BufferpoolIndex)) or idx is None # should be either None (not requested) or a BufferpoolIndex
-
-		for idx in metadata_buff_indices:
-			assert (idx != -1 and isinstance(idx, BufferpoolIndex)) # should all be BufferpoolIndex(s)
-
-		return BufferedPage(self, table, data_buff_indices, metadata_buff_indices, projected_columns_index) # type: ignore[arg-type]
+		if self.readahead is not None and isinstance(page_id, BasePageID):
+			self.readahead.record_access(table, page_id)
+		load_key = (table.name, type(page_id), int(page_id))
+		partition = self.partition_for(table, page_id)
+		first_lookup = True
+		pin_wait_deadline: float | None = None
+		while True:
+			with partition.latch:
+				found, data_buff_indices, metadata_buff_indices = self.is_page_in_bufferpool(table, page_id, projected_columns_index)
+				assert len(data_buff_indices) == table.num_columns
+				assert len(metadata_buff_indices) == config.NUM_METADATA_COL
+				if first_lookup: # later lookups only find what this thread or another one just loaded
+					num_hits = len([idx for idx in metadata_buff_indices + data_buff_indices if idx is not None and idx != -1])
+					for stats in self.stats_for(table, partition):
+						stats.hits += num_hits
+					first_lookup = False
+				if found:
+					for idx in metadata_buff_indices:
+						assert (idx != -1 and isinstance(idx, BufferpoolIndex)) # should all be BufferpoolIndex(s)
+					accessed = [idx for idx in metadata_buff_indices + data_buff_indices if isinstance(idx, BufferpoolIndex)]
+					if self.scan_ring is not None: # a scan's own frames are not references the replacement policy should learn from
+						accessed = [idx for idx in accessed if idx not in self.scan_ring.owned]
+					partition.record_access(accessed)
+					for stats in self.stats_for(table, partition):
+						stats.frames_pinned += len(metadata_buff_indices) + len(requested_columns)
+					return BufferedPage(self, table, data_buff_indices, metadata_buff_indices, projected_columns_index) # type: ignore[arg-type]
+				load_done = partition.loads_in_flight.get(load_key)
+				if load_done is None:
+					load_done = threading.Event()
+					partition.loads_in_flight[load_key] = load_done
+					# as a reminder, -1 for a buff_idx here means not found, None means not requested.
+					# the columns that are here already are pinned until the missing ones are in
+					resident = [idx for idx in metadata_buff_indices + data_buff_indices if isinstance(idx, BufferpoolIndex) and idx != -1]
+					self.change_pin_count(resident, +1)
+					# NOTE: this is the new proj_cols, to get only whatever we don't have already
+					proj_data_cols: List[Literal[0, 1]] = [1 if idx == -1 else 0 for idx in data_buff_indices]
+					proj_metadata_cols: List[Literal[0, 1]] = [1 if idx == -1 else 0 for idx in metadata_buff_indices]
+					loading = True
+				else:
+					loading = False
+			if not loading:
+				load_done.wait() # another thread is reading this page; look again once it's done
+				continue
+			try:
+				loaded = self.bring_from_disk(table, page_id, proj_data_cols, resident, proj_metadata_cols)
+			finally:
+				with partition.latch:
+					self.change_pin_count(resident, -1)
+					del partition.loads_in_flight[load_key]
+				load_done.set()
+			if not loaded:
+				if pin_wait_deadline is None:
+					pin_wait_deadline = time.monotonic() + config.PIN_WAIT_TIMEOUT
+				with partition.latch:
+					remaining = pin_wait_deadline - time.monotonic()
+					if remaining <= 0 or not partition.frame_unpinned.wait(remaining):
+						for stats in self.stats_for(table, partition):
+							stats.pin_failures += 1
+						return None
 
 
 
@@ -1325,36 +1881,114 @@ class Bufferpool:
 	# TODO: specialize for tail records to only put the non-null columns in bufferpool
 	def get_record(self, table: Table, rid: RID, projected_columns_index: list[Literal[0] | Literal[1]]) -> BufferedRecord | None:
 		page_res = self.get_page(table, Bufferpool.rid_to_page_id(table, rid), projected_columns_index)
-		assert page_res is not None
+		if page_res is None:
+			return None
 		r = BufferedRecord(self, table, page_res.metadata_buff_indices, page_res.data_buff_indices, Bufferpool.rid_to_offset(table, rid), rid, projected_columns_index)
+		page_res.unpin() # the record holds its own pins now
 		return r
+
+	# pins the requested columns of a page for the duration of a `with` block:
+	#	with bufferpool.pinned_page(table, page_id, projected_columns_index) as page:
+	#		...
+	# the frames are unpinned as soon as the block is left. page is None if there weren't enough free frames to bring it in
+	@contextmanager
+	def pinned_page(self, table: Table, page_id: BaseTailPageID, projected_columns_index: list[Literal[0] | Literal[1]]) -> Iterator[BufferedPage | None]:
+		page = self.get_page(table, page_id, projected_columns_index)
+		try:
+			yield page
+		finally:
+			if page is not None:
+				page.unpin()
+
+	# reads a table's base pages one at a time as column vectors (see column_vector.py), for queries that look at
+	# every base record. only the data columns marked with 1 in projected_columns_index are read; the metadata always is.
+	# each page is pinned and latched only while its columns are copied out, and the scan goes through a scan ring
+	def scan_base_pages(self, table: Table, projected_columns_index: list[Literal[0] | Literal[1]]) -> Iterator[PageColumns]:
+		with self.sequential_scan():
+			for page_number in range(1, table.file_handler.next_base_page_id.value() + 1):
+				page_id = BasePageID(page_number)
+				count = table.file_handler.base_page_record_count(page_id)
+				if count == 0:
+					continue
+				with self.pinned_page(table, page_id, projected_columns_index) as page:
+					if page is None:
+						raise(Exception(f"no room in the bufferpool to scan base page {page_id}"))
+					with self.latch_pages(page.metadata_buff_indices + page.data_buff_indices): # type: ignore[operator]
+						metadata = [page_vector(self[buff_idx].physical_page.data, count) for buff_idx in page.metadata_buff_indices]
+						columns = [None if buff_idx is None else page_vector(self[buff_idx].physical_page.data, count) for buff_idx in page.data_buff_indices]
+				yield PageColumns(page_id, table.num_columns, count, metadata, columns)
+
+	# like pinned_page, for a single record
+	@contextmanager
+	def pinned_record(self, table: Table, rid: RID, projected_columns_index: list[Literal[0] | Literal[1]]) -> Iterator[BufferedRecord | None]:
+		record = self.get_record(table, rid, projected_columns_index)
+		try:
+			yield record
+		finally:
+			if record is not None:
+				record.unpin()
+
+	# reads a record into a Record object, keeping its frames pinned only while it is being read
+	def read_record(self, table: Table, rid: RID, projected_columns_index: list[Literal[0] | Literal[1]]) -> Record | None:
+		with self.pinned_record(table, rid, projected_columns_index) as buffered_record:
+			if buffered_record is None:
+				return None
+			return buffered_record.get_value()
 		
 
-	# returns buffer index of evicted physical page. 
+	# returns buffer index of an empty frame in the partition, evicting a page chosen by the partition's replacement
+	# policy if no frame is empty. the caller holds the partition's latch.
+	# the returned frame is claimed by the caller: it stays empty but won't be handed out again until it is filled or released.
 	# does not evict anything in the `save` array.
-	def evict_physical_page_clock(self, save: list[BufferpoolIndex] = []) -> BufferpoolIndex | None: 
-		start_hand = self.curr_clock_hand % config.BUFFERPOOL_SIZE
-		def curr_hand() -> BufferpoolIndex:
-			return BufferpoolIndex(self.curr_clock_hand % config.BUFFERPOOL_SIZE)
-		self.curr_clock_hand += 1
-		while curr_hand() != start_hand:
-			i = curr_hand()
-			if self.maybe_get_entry(i) is None:
-				return i
-			if self[i].pin_count == 0 and i not in save:
-				if self[i].dirty_bit == True: 
-					self.write_to_disk(self[i].table, i)
-				self.remove_from_bufferpool(i) # remove from the buffer without writing in disk
-				return i
-			self.curr_clock_hand += 1
-		return None
+	# `table` is the table the frame is for and `claimed` the number of frames it has claimed already for the same
+	# page; they are used to keep to the table quotas
+	def evict_physical_page(self, table: Table, partition: BufferpoolPartition, save: list[BufferpoolIndex] = [], claimed: int = 0) -> BufferpoolIndex | None: 
+		if self.scan_ring is not None and len(self.scan_ring.frames) >= self.scan_ring.size:
+			recycled = self.scan_ring.recycle_frame(self, partition, save, table, claimed)
+			if recycled is not None:
+				return recycled
+		buff_idx = self.evict_physical_page_from_pool(table, partition, save, claimed)
+		if buff_idx is not None and self.scan_ring is not None:
+			self.scan_ring.add_frame(buff_idx)
+		return buff_idx
+
+	# picks a frame from the whole partition: an empty one if there is one, otherwise the replacement policy's victim
+	def evict_physical_page_from_pool(self, table: Table, partition: BufferpoolPartition, save: list[BufferpoolIndex] = [], claimed: int = 0) -> BufferpoolIndex | None:
+		# free frames are kept for the tables that haven't filled their reserved share yet (each partition keeps its share of them)
+		unused_reserved = -(-self.unused_reserved_frames(table) // len(self.partitions))
+		if len(partition.free_frames) > unused_reserved and not self.at_table_max(table, claimed):
+			return partition.free_frames.pop()
+		victim = partition.choose_victim(lambda i: self[i].pin_count == 0 and i not in save and self.quota_allows_eviction(self[i].table, table, claimed))
+		if victim is None:
+			return None
+		i = victim
+		for stats in self.stats_for(self[i].table, partition):
+			stats.evictions += 1
+		with self.io_lock: # waits for the background writer if it is writing this frame right now
+			if self[i].dirty_bit == True: 
+				self.write_back(self.dirty_neighbour_frames(i))
+			self.remove_from_bufferpool(i) # remove from the buffer without writing in disk
+		partition.free_frames.discard(i)
+		return i
+
+	# while inside this context, pages brought in from disk use a private ring of `ring_size` frames
+	# instead of the whole bufferpool. used by full table scans.
+	@contextmanager
+	def sequential_scan(self, ring_size: int = config.SCAN_RING_SIZE) -> Iterator[ScanRing]:
+		previous_ring = self.scan_ring
+		self.scan_ring = ScanRing(ring_size)
+		try:
+			yield self.scan_ring
+		finally:
+			self.scan_ring = previous_ring
 
 	# NOTE: just pin the indices you want to keep rather than populating the save array... 
-	def evict_n_slots(self, n: int, save: list[BufferpoolIndex] = []) -> List[BufferpoolIndex] | None: # returns buffer indices freed, or None if not all slots could be evicted
+	def evict_n_slots(self, table: Table, partition: BufferpoolPartition, n: int, save: list[BufferpoolIndex] = []) -> List[BufferpoolIndex] | None: # returns buffer indices freed, or None if not all slots could be evicted
 		evicted_buff_idx: list[BufferpoolIndex] = []
 		for _ in range(n):
-			evicted = self.evict_physical_page_clock(save)
+			evicted = self.evict_physical_page(table, partition, save, len(evicted_buff_idx))
 			if evicted is None:
+				partition.free_frames.update(evicted_buff_idx) # give back the frames claimed so far
 				return None
 			evicted_buff_idx.append(evicted)
 		return evicted_buff_idx
@@ -1363,18 +1997,6 @@ class Bufferpool:
 		self[index] = None
 
 	def write_to_disk(self, table: Table, index: BufferpoolIndex) -> None:
-		page_id = self[index].physical_page_id
-		physical_page_index = self[index].physical_page_index
-		assert page_id is not None
-		assert physical_page_index is not None
-		physical_page = self[index].physical_page
-		assert physical_page is not None
-		path = table.file_handler.page_id_to_path(page_id)
-		with open(path, 'r+b') as file:
-			file.seek((physical_page_index * config.PHYSICAL_PAGE_SIZE) + config.byte_position.metadata.DATA)
-			if self[index].physical_page != None:
-				print(f"wrote {physical_page.data} to offset {(physical_page_index * config.PHYSICAL_PAGE_SIZE) + config.byte_position.metadata.DATA} in path {path}")
-				file.write(physical_page.data)
-			else:
-				raise(Exception("physical page in bufferpoolw as none?"))
+		assert self[index].table is table
+		self.write_back([index])
 
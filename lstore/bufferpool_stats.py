@@ -0,0 +1,56 @@
+from __future__ import annotations
+from typing import NamedTuple
+
+# Counters describing how the bufferpool is doing. The Bufferpool keeps one of these for the whole pool and every
+# Table keeps one for its own pages; each event is counted in both.
+# Counting is a few integer additions per get_page, so the counters are always on. They are not locked: a count
+# made by the background writer at the same moment as a query can occasionally be lost, which is fine for statistics.
+# Units:
+#	hits / misses: physical pages (frames) asked for by get_page that were / weren't in the bufferpool already
+#	evictions: pages removed from the bufferpool to make room for another page
+#	dirty_write_backs: dirty frames written to disk (by eviction, the background writer or close)
+#	bytes_read / bytes_written: bytes of physical pages brought in from / written to the page files
+#	pin_failures: get_page calls that returned None because every frame was pinned
+#	queries / frames_pinned: top-level queries run, and the frames get_page pinned while they ran
+class BufferpoolStatsSnapshot(NamedTuple):
+	hits: int
+	misses: int
+	evictions: int
+	dirty_write_backs: int
+	bytes_read: int
+	bytes_written: int
+	pin_failures: int
+	queries: int
+	frames_pinned: int
+
+	@property
+	def hit_ratio(self) -> float:
+		requests = self.hits + self.misses
+		return self.hits / requests if requests > 0 else 0.0
+
+	@property
+	def avg_frames_pinned_per_query(self) -> float:
+		return self.frames_pinned / self.queries if self.queries > 0 else 0.0
+
+	# the change between an earlier snapshot and this one
+	def since(self, earlier: BufferpoolStatsSnapshot) -> BufferpoolStatsSnapshot:
+		return BufferpoolStatsSnapshot(*[now - before for now, before in zip(self, earlier)])
+
+
+class BufferpoolStats:
+	def __init__(self) -> None:
+		self.reset()
+
+	def reset(self) -> None:
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.dirty_write_backs = 0
+		self.bytes_read = 0
+		self.bytes_written = 0
+		self.pin_failures = 0
+		self.queries = 0
+		self.frames_pinned = 0
+
+	def snapshot(self) -> BufferpoolStatsSnapshot:
+		return BufferpoolStatsSnapshot(self.hits, self.misses, self.evictions, self.dirty_write_backs, self.bytes_read, self.bytes_written, self.pin_failures, self.queries, self.frames_pinned)
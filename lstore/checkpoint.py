@@ -0,0 +1,27 @@
+from __future__ import annotations
+import threading
+import typing
+
+from lstore.config import config
+
+if typing.TYPE_CHECKING:
+	from lstore.db import Database
+
+# Runs Database.checkpoint every `interval` seconds on a background thread, so a crash only has to redo the log
+# written since the last checkpoint and closing the database has little left to write.
+class Checkpointer(threading.Thread):
+	def __init__(self, database: Database, interval: float = config.CHECKPOINT_INTERVAL) -> None:
+		super().__init__(name="checkpointer", daemon=True)
+		self.database = database
+		self.interval = interval
+		self.checkpoints = 0
+		self.stop_event = threading.Event()
+
+	def run(self) -> None:
+		while not self.stop_event.wait(self.interval):
+			self.database.checkpoint()
+			self.checkpoints += 1
+
+	def stop(self) -> None:
+		self.stop_event.set()
+		self.join()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import struct
+import typing
+from typing import Any
+
+from lstore.config import config
+from lstore.page_directory_entry import BasePageID
+
+try:
+	import numpy
+except ImportError: # numpy is optional; without it the vectors below are plain tuples of ints
+	numpy = None # type: ignore[assignment]
+
+HAS_NUMPY = numpy is not None
+
+# a column of values read out of one physical page: a numpy uint64 array when numpy is installed, a tuple of ints otherwise
+Vector: typing.TypeAlias = Any
+
+# Whole physical pages read as column vectors, for queries that look at every record of a page (full scans, sum).
+# A physical page is an array of big-endian uint64s, so numpy.frombuffer can view it without decoding anything;
+# the view is copied out in native byte order while the frame is latched, so the frame can be unpinned right away
+# and the vectors stay valid however long the query holds on to them.
+# Without numpy the page is decoded with a single struct.unpack_from instead of one call per record.
+def page_vector(data: bytearray, count: int) -> Vector:
+	if numpy is not None:
+		return numpy.frombuffer(data, dtype=">u8", count=count).astype(numpy.uint64)
+	return struct.unpack_from(f">{count}Q", data)
+
+
+# the columns of the first `count` records of a base page. data columns that weren't asked for are None
+class PageColumns:
+	def __init__(self, page_id: BasePageID, num_columns: int, count: int, metadata: list[Vector], columns: list[Vector | None]) -> None:
+		self.page_id = page_id
+		self.num_columns = num_columns
+		self.count = count
+		self.metadata = metadata
+		self.columns = columns
+
+	def __len__(self) -> int:
+		return self.count
+
+	@property
+	def rids(self) -> Vector:
+		return self.metadata[config.RID_COLUMN]
+
+	def rid(self, position: int) -> int:
+		return int(self.rids[position])
+
+	def column(self, data_idx: int) -> Vector:
+		column = self.columns[data_idx]
+		assert column is not None, f"column {data_idx} was not read for this page"
+		return column
+
+	# per record, 1 if the column has been updated since the base record was written (its schema encoding bit is set),
+	# in which case the base page value is stale and the latest value has to be found through the tail records
+	def updated(self, data_idx: int) -> Vector:
+		return self.bits(self.metadata[config.SCHEMA_ENCODING_COLUMN], self.num_columns - data_idx - 1)
+
+	# per record, 1 unless the record was deleted (a null RID), matching Record.metadata.rid being None
+	def live(self) -> Vector:
+		rids = self.rids
+		null_rid = self.bits(self.metadata[config.NULL_COLUMN], self.num_columns + config.NUM_METADATA_COL - config.RID_COLUMN - 1)
+		if numpy is not None:
+			return ~((rids == 0) & (null_rid == 1))
+		return tuple(0 if rid == 0 and null == 1 else 1 for rid, null in zip(rids, null_rid))
+
+	@staticmethod
+	def bits(vector: Vector, shift: int) -> Vector:
+		if numpy is not None:
+			return (vector >> numpy.uint64(shift)) & numpy.uint64(1)
+		return tuple((value >> shift) & 1 for value in vector)
+
+	# positions of the live records whose column might equal `value`: the ones whose base value does, plus the updated
+	# ones, which the caller has to check against their latest version
+	def candidates(self, data_idx: int, value: int) -> list[int]:
+		values, updated, live = self.column(data_idx), self.updated(data_idx), self.live()
+		if numpy is not None:
+			matches = values == numpy.uint64(value) if 0 <= value < 2 ** 64 else numpy.zeros(self.count, dtype=bool) # values are unsigned 64 bit
+			return numpy.flatnonzero(live & (matches | (updated == 1))).tolist()
+		return [i for i in range(self.count) if live[i] and (values[i] == value or updated[i])]
+
+	# sums the aggregate column over the live records whose key column is in [start, end].
+	# returns (sum, number of records summed, positions the caller still has to check): records whose key or
+	# aggregate column was updated can't be decided from the base page alone and are left to the caller
+	def sum_in_range(self, key_idx: int, start: int, end: int, aggregate_idx: int) -> tuple[int, int, list[int]]:
+		keys, values = self.column(key_idx), self.column(aggregate_idx)
+		key_updated, value_updated, live = self.updated(key_idx), self.updated(aggregate_idx), self.live()
+		if end < 0:
+			return 0, 0, [] # values are unsigned
+		start = max(start, 0)
+		if numpy is not None:
+			in_range = (keys >= numpy.uint64(start)) & (keys <= numpy.uint64(end))
+			slow = live & ((key_updated == 1) | (in_range & (value_updated == 1)))
+			fast = live & in_range & ~slow
+			selected = values[fast]
+			# a uint64 sum wraps around, so the high and low 32 bits are summed separately; neither half can overflow
+			# with fewer than 2 ** 32 records in a page
+			total = (int((selected >> numpy.uint64(32)).sum(dtype=numpy.uint64)) << 32) + int((selected & numpy.uint64(0xFFFFFFFF)).sum(dtype=numpy.uint64))
+			return total, int(numpy.count_nonzero(fast)), numpy.flatnonzero(slow).tolist()
+		total, found, slow_positions = 0, 0, []
+		for i in range(self.count):
+			if not live[i]:
+				continue
+			if key_updated[i] or (start <= keys[i] <= end and value_updated[i]):
+				slow_positions.append(i)
+			elif start <= keys[i] <= end:
+				total += values[i]
+				found += 1
+		return total, found, slow_positions
+
@@ -12,14 +12,48 @@ class config:
 	NUM_METADATA_COL = 6
 	
 	INDENT = "    " # Use "\t"
-	PAGES_PER_PAGERANGE = 16 
+	PAGES_PER_PAGERANGE = 16 # pages of each type per segment file (see segment_file.py)
+	STORAGE_FORMAT = "segment" # how new tables store their pages: "segment" (one file per page range) or "page" (one file per page)
+	RID_ADDRESSING = "arithmetic" # how new tables find records: "arithmetic" (computed from the RID) or "directory" (see page_directory.py)
 	PACKING_FORMAT_STR = ">Q"
 	PHYSICAL_PAGE_SIZE = 4096
+	BASE_RECORDS_PER_PAGE = (PHYSICAL_PAGE_SIZE - 8) // 8 # a base page rolls over once its offset reaches PHYSICAL_PAGE_SIZE - BYTES_PER_INT
+	TAIL_RECORDS_PER_PAGE = PHYSICAL_PAGE_SIZE // 8 # a tail page rolls over once its offset reaches PHYSICAL_PAGE_SIZE
 	UPDATES_BEFORE_MERGE= 1024
 	ID_COUNT = 1 # Is to make sure we dont have two files with the same name
 	PATH = "./Pages"
 
 	BUFFERPOOL_SIZE = 256
+	BUFFERPOOL_MEMORY_BUDGET = BUFFERPOOL_SIZE * PHYSICAL_PAGE_SIZE # bytes of physical pages the bufferpool may hold, unless Database.open is given a budget
+	BUFFERPOOL_PARTITIONS = 1 # independent slices of the bufferpool, each with its own latch and replacement policy
+	REPLACEMENT_POLICY = "clock" # one of "clock", "lru", "lru-k", "2q" (see replacement_policy.py)
+	LRU_K = 2
+	LRU_K_CORRELATED_PERIOD = 16 # references to a frame less than this many requests apart count as one reference
+	TWO_Q_KIN_RATIO = 0.25 # share of the frames the 2Q A1in FIFO may hold before it is preferred for eviction
+	TWO_Q_KOUT_RATIO = 0.5 # number of evicted pages 2Q remembers, relative to the number of frames
+	BACKGROUND_WRITER_ENABLED = False
+	BACKGROUND_WRITER_INTERVAL = 0.2 # seconds between background writer rounds
+	BACKGROUND_WRITER_MAX_PAGES = 32 # dirty frames written per round
+	BACKGROUND_WRITER_DIRTY_RATIO_LOW = 0.1 # the background writer only writes once this share of the frames is dirty..
+	BACKGROUND_WRITER_DIRTY_RATIO_HIGH = 0.5 # ..and stops sleeping between rounds above this share
+	IO_BACKEND = "buffered" # "buffered" reads pages into private copies, "mmap" maps the page files (see mapped_file_cache.py)
+	FD_CACHE_SIZE = 64 # open page files kept per table
+	MMAP_CACHE_SIZE = 256 # mapped page files kept per table with the "mmap" I/O backend
+	READAHEAD_ENABLED = False
+	READAHEAD_TRIGGER = 2 # consecutive base pages a table has to be read in order before readahead starts
+	READAHEAD_PAGES = 8 # base pages read ahead of the current one
+	PIN_WAIT_TIMEOUT = 1.0 # seconds get_page waits for other threads to unpin frames before giving up
+	SCAN_RING_SIZE = 32 # frames a sequential scan may use before it starts recycling its own frames
+	WAL_ENABLED = False
+	WAL_FSYNC_POLICY = "commit" # "commit", "interval" or "never" (see wal.py)
+	WAL_FSYNC_INTERVAL = 0.01 # seconds between fsyncs of the log with the "interval" policy
+	WAL_BUFFER_SIZE = 1 << 20 # bytes of log records buffered before they are written out, unless a commit comes first
+	CHECKPOINT_ENABLED = False
+	CHECKPOINT_INTERVAL = 30.0 # seconds between checkpoints (see Database.checkpoint)
+	PAGE_DIRECTORY_LOG_BUFFER_SIZE = 1 << 16 # bytes of page directory entries buffered before they are appended to its log
+	PAGE_DIRECTORY_COMPACT_MIN_ENTRIES = 1 << 16 # the page directory log isn't compacted before it has this many entries
+	RECOVERY_WORKERS = 4 # threads redoing the log when a database is opened after a crash
+	SUM_SCAN_MIN_FRACTION = 0.05 # Query.sum scans whole base pages instead of looking up each key once the range covers this share of the base records
 	INITIAL_TPS = (2**64) - 1
 	INITIAL_TID = (2**64) - 1
 	# BASE_PAGE_FILE_SCHEMA = ["metadata_pointer", "offset", "TPS", "base_data"]
@@ -53,6 +87,12 @@ class config:
 			LAST_TAIL_METADATA_PAGE_ID = 5*8
 			LAST_BASE_RID = 6*8
 			LAST_TAIL_RID = 7*8
+			STORAGE_FORMAT = 8*8
+			RID_ADDRESSING = 9*8
+		class segment:
+			NUM_COLUMNS = 0*8
+			PAGES_PER_SEGMENT = 1*8
+			PAGE_TABLE = 2*8
 
 	BYTES_PER_INT = 8	
 
@@ -9,27 +9,61 @@ from lstore.index import Index
 from lstore.page_directory_entry import BasePageID, MetadataPageID, TailPageID
 from lstore.record_physical_page import PhysicalPage
 import os
+import threading
 from  lstore.bufferpool import Bufferpool, Table
+from lstore.wal import WriteAheadLog
+from lstore.checkpoint import Checkpointer
+from lstore.recovery import Recovery, RecoveryStats
 class Database():
 
     def __init__(self) -> None:
         self.tables: list[Table] = []
         self.path=""
+        self.wal: WriteAheadLog | None = None
+        self.checkpointer: Checkpointer | None = None
+        self.checkpoint_lock = threading.Lock()
+        self.recovery_stats: RecoveryStats | None = None # how the last open() went, if it had a log to redo
         pass
 
     def table_by_name(self, table_name: str) -> Table | None:
         return next(( table for table in self.tables if table.name == table_name ), None)
     # Not required for milestone1
     
-    def open(self, path: str) -> None:
+    # replacement_policy is one of "clock", "lru", "lru-k" or "2q". "lru-k" and "2q" keep pages that are
+    # referenced repeatedly in the bufferpool when a full table scan runs through it.
+    # background_writer starts a thread that writes dirty pages ahead of eviction (see background_writer.py).
+    # io_backend is "buffered" or "mmap" (see mapped_file_cache.py). "mmap" can't be used with wal: the OS may write
+    # a mapped page back at any time, before the log records of its changes are on disk.
+    # readahead reads the next base pages in the background when a table is read page after page (see readahead.py).
+    # memory_budget is the number of bytes of physical pages the bufferpool holds; it gets one frame per 4 KB.
+    # tables can be given a share of it with create_table or set_table_quota.
+    # partitions splits the bufferpool into that many independent parts (see BufferpoolPartition), so threads
+    # working on different pages don't wait on the same latch. each partition gets an equal share of memory_budget,
+    # which has to hold two pages of every table (see Bufferpool.check_table_fits).
+    # wal keeps a write-ahead log of every change in the "wal" directory of the database (see wal.py). wal_fsync
+    # is when the log is fsynced: "commit" (every query, with group commit), "interval" (every wal_fsync_interval
+    # seconds) or "never".
+    # checkpoints runs checkpoint() every checkpoint_interval seconds in the background.
+    # with a log, open() first redoes whatever the log holds past the last checkpoint (see recovery.py); a database
+    # that was closed normally has nothing to redo. recovery_workers is the number of threads redoing pages.
+    # new tables store their pages in one segment file per page range (see segment_file.py). tables written with
+    # one file per page are still read as they are; migrate_storage converts them to segment files while opening.
+    def open(self, path: str, replacement_policy: str = config.REPLACEMENT_POLICY, background_writer: bool = config.BACKGROUND_WRITER_ENABLED, io_backend: str = config.IO_BACKEND, readahead: bool = config.READAHEAD_ENABLED, memory_budget: int = config.BUFFERPOOL_MEMORY_BUDGET, partitions: int = config.BUFFERPOOL_PARTITIONS, wal: bool = config.WAL_ENABLED, wal_fsync: str = config.WAL_FSYNC_POLICY, wal_fsync_interval: float = config.WAL_FSYNC_INTERVAL, checkpoints: bool = config.CHECKPOINT_ENABLED, checkpoint_interval: float = config.CHECKPOINT_INTERVAL, recovery_workers: int = config.RECOVERY_WORKERS, migrate_storage: bool = False) -> None:
+        if wal and io_backend == "mmap":
+            raise(ValueError("the \"mmap\" I/O backend can't be used with a write-ahead log; mapped pages can reach disk before their log records"))
         self.path=path
         #if database is new and there are previous files 
         try:
             os.mkdir(path)
         except:  #the db is empty so there are no tables to load to bufferpool
             pass
-        self.bpool=Bufferpool(path)
+        self.wal = WriteAheadLog(os.path.join(path, "wal"), wal_fsync, wal_fsync_interval) if wal else None
+        self.bpool=Bufferpool(path, replacement_policy, io_backend, readahead, memory_budget, partitions, self.wal)
+        if background_writer:
+            self.bpool.start_background_writer()
         for table_name in os.listdir(path):
+            if not os.path.isfile(os.path.join(path, table_name, "catalog")):
+                continue # not a table (the write-ahead log lives in the database directory too)
             if self.table_by_name(table_name) is None:
                 with open(os.path.join(path, table_name, "catalog"), "rb") as catalog_file:
                     num_columns= int.from_bytes(catalog_file.read(8), "big")
@@ -39,20 +73,56 @@ class Database():
                     # self.tables.append(Table(table_name, ))
                     # with open(file_handler.table_file_path("catalog"), 'rb') as catalog:
 
-                table = Table(table_name, num_columns, key_index, path, self.bpool)
+                table = Table(table_name, num_columns, key_index, path, self.bpool, migrate_storage)
                 self.tables.append(table)
             # table_names.append(table_name)
+        self.recovery_stats = Recovery(self, recovery_workers).run() if self.wal is not None else None
+        for table in self.tables:
+            if table.index_stale:
+                table.rebuild_index() # after recovery, so the base pages hold every record
+        if self.recovery_stats is not None and self.recovery_stats.records > 0:
+            self.checkpoint() # so the redone log isn't redone again after another crash
+        if checkpoints:
+            self.checkpointer = Checkpointer(self, checkpoint_interval)
+            self.checkpointer.start()
+
+    # a fuzzy checkpoint: saves what the database keeps in memory (dirty pages, the catalog counters, new page
+    # directory entries) while queries keep running. everything logged before it starts is on disk when it ends,
+    # so recovery only has to redo the log from there. changes made while it runs may be saved too; redoing them is harmless.
+    def checkpoint(self) -> None:
+        with self.checkpoint_lock:
+            redo_lsn = self.wal.current_lsn() if self.wal is not None else 0
+            tables = list(self.tables)
+            for table in tables:
+                table.checkpoint()
+            self.bpool.flush_dirty_frames()
+            for table in tables:
+                table.file_handler.sync_files()
+            if self.wal is not None:
+                self.wal.checkpoint(redo_lsn)
 
 
     def close(self) -> None:
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+            self.checkpointer = None
         for table in self.tables:
             print("Im the table: ", table.name)
             table.page_directory_buff.flush()
+            table.save_index() # before the RID counter is flushed with the catalog
             # table.file_handler.write_new_base_page()
             print("flushed file handler")
             table.file_handler.flush()
         self.bpool.close_bufferpool()
+        for table in self.tables:
+            if self.wal is not None:
+                table.file_handler.sync_files()
+            table.file_handler.close_files()
         self.tables.clear()
+        if self.wal is not None:
+            self.wal.checkpoint(self.wal.current_lsn()) # everything is on disk, so none of the log needs redoing
+            self.wal.close()
+            self.wal = None
 
 
         
@@ -61,19 +131,32 @@ class Database():
     :param name: string         #Table name
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key_index: int             #Index of table key in columns
+    :param reserved_memory: int       #Bytes of the bufferpool no other table can take from this one (optional)
+    :param max_memory: int            #Bytes of the bufferpool this table may use at most (optional)
 
     """
-    def create_table(self, name : str, num_columns : int, key_index: int) -> Table:
+    def create_table(self, name : str, num_columns : int, key_index: int, reserved_memory: int = 0, max_memory: int | None = None) -> Table:
         key_index = DataIndex(key_index)
+        self.bpool.check_table_fits(name, num_columns + config.NUM_METADATA_COL)
         table_path = os.path.join(self.path, name)
         if not os.path.isdir(table_path):
             os.mkdir(table_path)
         table = Table(name, num_columns, key_index, self.path, self.bpool)
         self.tables.append(table)
+        if reserved_memory > 0 or max_memory is not None:
+            self.bpool.set_table_quota(table, reserved_memory, max_memory)
 
         # initialize catalog file
         return table
 
+    # sets the bufferpool share of a table, in bytes (see Bufferpool.set_table_quota).
+    # quotas aren't saved with the database; set them again after opening it
+    def set_table_quota(self, name: str, reserved_memory: int = 0, max_memory: int | None = None) -> None:
+        table = self.get_table(name)
+        if table is None:
+            raise(Exception(f"no table named {name}"))
+        self.bpool.set_table_quota(table, reserved_memory, max_memory)
+
     
     # Deletes the specified table
     def drop_table(self, name: str) -> None:
@@ -0,0 +1,73 @@
+from __future__ import annotations
+from collections import OrderedDict
+import os
+import threading
+
+from lstore.config import config
+
+# Keeps up to `capacity` page files open so that reading or writing a page doesn't cost an open()/close() pair.
+# Each table's FileHandler has one of these, keyed by page path. Files are opened read/write and unbuffered, and
+# all I/O is positional (pread/pwrite), so there is no file position or userspace buffer to keep in sync:
+# closing a descriptor, whether it is evicted or close_all() is called, never loses a write.
+# The lock is held for the whole read or write so a descriptor can't be closed by another thread while in use.
+class FileDescriptorCache:
+	def __init__(self, capacity: int = config.FD_CACHE_SIZE) -> None:
+		self.capacity = capacity
+		self.fds: OrderedDict[str, int] = OrderedDict() # least recently used first
+		self.lock = threading.RLock()
+		self.written_paths: set[str] = set() # files written since the last sync_written()
+
+	# returns an open descriptor for the path. must be called with the lock held
+	def fd(self, path: str) -> int:
+		fd = self.fds.get(path)
+		if fd is not None:
+			self.fds.move_to_end(path)
+			return fd
+		fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+		self.fds[path] = fd
+		while len(self.fds) > self.capacity:
+			_, old_fd = self.fds.popitem(last=False)
+			os.close(old_fd)
+		return fd
+
+	def read(self, path: str, offset: int, size: int) -> bytes:
+		with self.lock:
+			return os.pread(self.fd(path), size, offset)
+
+	def write(self, path: str, offset: int, data: bytes | bytearray | memoryview) -> int:
+		with self.lock:
+			self.written_paths.add(path)
+			return os.pwrite(self.fd(path), data, offset)
+
+	# writes the buffers back to back starting at offset, with a single vectored write where the platform has one
+	def writev(self, path: str, offset: int, buffers: list[bytes]) -> int:
+		with self.lock:
+			self.written_paths.add(path)
+			fd = self.fd(path)
+			total = sum(len(buffer) for buffer in buffers)
+			if not hasattr(os, "pwritev"):
+				return os.pwrite(fd, b"".join(buffers), offset)
+			written = os.pwritev(fd, buffers, offset)
+			if written < total: # short write; finish the rest the simple way
+				written += os.pwrite(fd, b"".join(buffers)[written:], offset + written)
+			return written
+
+	# fsyncs every file written since the last call, so the writes survive a crash of the machine, not just the process.
+	# a file whose descriptor was closed in between is reopened; fsync covers writes made through any descriptor
+	def sync_written(self) -> None:
+		with self.lock:
+			paths, self.written_paths = self.written_paths, set()
+			for path in paths:
+				os.fsync(self.fd(path))
+
+	def close(self, path: str) -> None:
+		with self.lock:
+			fd = self.fds.pop(path, None)
+			if fd is not None:
+				os.close(fd)
+
+	def close_all(self) -> None:
+		with self.lock:
+			while len(self.fds) > 0:
+				_, fd = self.fds.popitem()
+				os.close(fd)
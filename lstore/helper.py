@@ -6,6 +6,7 @@ from lstore.ColumnIndex import DataIndex, RawIndex
 from lstore.config import config
 
 class helper:
+	UINT64 = struct.Struct(config.PACKING_FORMAT_STR) # one column value, compiled once
 	@staticmethod
 	def str_each_el(arr: list, delim: str="") -> str:
 		return delim.join([str(el) for el in arr])
@@ -17,7 +18,7 @@ class helper:
 	@staticmethod
 	def unpack_data(data: bytearray, record_offset: int) -> int: 
 		# # #print(f"data{data}", record_idx)
-		return int.from_bytes(data[record_offset:record_offset+8], byteorder="big")
+		return helper.UINT64.unpack_from(data, record_offset)[0] # reads in place; slicing the bytearray would copy it
 		# return struct.unpack(config.PACKING_FORMAT_STR, data[record_offset:record_offset+8])[0]
 
 	@staticmethod
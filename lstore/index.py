@@ -1,6 +1,13 @@
 """
 A  -Trees, but other data structures can be used as well.
 """
+from __future__ import annotations
+from array import array
+import os
+import struct
+import sys
+import threading
+
 from BTrees.OOBTree import OOBTree  # type: ignore
 
 
@@ -9,6 +16,7 @@ class Index:
     def __init__(self, num_columns: int):
         # One index for each table. All our empty initially.
         self.indices: list[BTree | None] = [None] * num_columns
+        self.lock = threading.Lock() # so save() sees the trees between updates
 
         pass
 
@@ -44,14 +52,15 @@ class Index:
     def update_index(self, column_number: int, key: int, value: int) -> None:
 
         index_object = self.indices[column_number]
-        existing_vals = self.locate(column_number, key)
+        with self.lock:
+            existing_vals = self.locate(column_number, key)
 
-        if existing_vals is not None:
-            existing_vals = index_object[key]
-            existing_vals.append(value)
-            index_object.update({key: existing_vals})
-        else:
-            index_object.update({key: [value]})
+            if existing_vals is not None:
+                existing_vals = index_object[key]
+                existing_vals.append(value)
+                index_object.update({key: existing_vals})
+            else:
+                index_object.update({key: [value]})
 
     """
     # optional: Drop index of specific column
@@ -60,4 +69,87 @@ class Index:
     def drop_index(self, column_number):
         pass
 
+    # The indexes are saved to the table's "indices" file in a flat binary form, so loading them doesn't unpickle
+    # one object per key. All numbers are little-endian uint64s:
+    #   HEADER: FORMAT_VERSION, number of columns, the next base RID when the file was written, number of indexes
+    #   then per index COLUMN_HEADER (column, number of keys, number of RIDs) and three arrays: the keys in order,
+    #   the number of RIDs of each key, and the RIDs of all keys one after the other.
+    # The next base RID is how a stale file is recognized: the index has to have exactly one RID for every base record
+    # (nothing is removed from it), so a file whose RID count doesn't match the table's RID counter is out of date.
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct("<QQQQ")
+    COLUMN_HEADER = struct.Struct("<QQQ")
+
+    # writes the indexes to path, replacing the file atomically. keys that don't fit in a uint64 can't be saved;
+    # then the file is removed instead, and the index is rebuilt when the table is opened
+    def save(self, path: str, next_base_rid: int) -> None:
+        columns: list[tuple[int, array, array, array]] = []
+        try:
+            with self.lock:
+                for column, tree in enumerate(self.indices):
+                    if tree is None:
+                        continue
+                    keys, counts, rids = array("Q"), array("Q"), array("Q")
+                    for key, key_rids in tree.items():
+                        keys.append(key)
+                        counts.append(len(key_rids))
+                        rids.extend(key_rids)
+                    columns.append((column, keys, counts, rids))
+        except (TypeError, OverflowError):
+            if os.path.isfile(path):
+                os.remove(path)
+            return
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as index_file:
+            index_file.write(Index.HEADER.pack(Index.FORMAT_VERSION, len(self.indices), next_base_rid, len(columns)))
+            for column, keys, counts, rids in columns:
+                index_file.write(Index.COLUMN_HEADER.pack(column, len(keys), len(rids)))
+                for values in (keys, counts, rids):
+                    if sys.byteorder == "big":
+                        values.byteswap()
+                    values.tofile(index_file)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temp_path, path)
+
+    # reads indexes written by save(). returns None if there is no file, or it doesn't match the table
+    @staticmethod
+    def load(path: str, num_columns: int, next_base_rid: int) -> Index | None:
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as index_file:
+            header = index_file.read(Index.HEADER.size)
+            if len(header) < Index.HEADER.size:
+                return None
+            version, saved_columns, saved_next_rid, num_indexes = Index.HEADER.unpack(header)
+            if version != Index.FORMAT_VERSION or saved_columns != num_columns or saved_next_rid != next_base_rid:
+                return None
+            index = Index(num_columns)
+            try:
+                for _ in range(num_indexes):
+                    column, num_keys, num_rids = Index.COLUMN_HEADER.unpack(index_file.read(Index.COLUMN_HEADER.size))
+                    keys, counts, rids = array("Q"), array("Q"), array("Q")
+                    keys.fromfile(index_file, num_keys)
+                    counts.fromfile(index_file, num_keys)
+                    rids.fromfile(index_file, num_rids)
+                    if sys.byteorder == "big":
+                        for values in (keys, counts, rids):
+                            values.byteswap()
+                    if column >= num_columns or num_rids != next_base_rid - 1: # every base record has to be in every index
+                        return None
+                    tree = index.BTree()
+                    if num_rids == num_keys: # one RID per key, the usual case for the primary key
+                        tree.update([(key, [rid]) for key, rid in zip(keys, rids)])
+                    else:
+                        position = 0
+                        items = []
+                        for key, count in zip(keys, counts):
+                            items.append((key, rids[position:position + count].tolist()))
+                            position += count
+                        tree.update(items)
+                    index.indices[column] = tree
+            except (struct.error, EOFError, ValueError): # the file was cut off
+                return None
+        return index
+
 
@@ -0,0 +1,81 @@
+from __future__ import annotations
+from contextlib import contextmanager
+import threading
+from typing import Iterator
+
+# A readers-writer latch: any number of threads can hold it shared, or one thread exclusively.
+# The Bufferpool keeps one per frame to protect the contents of the physical page in the frame; queries hold it
+# shared while reading a record and exclusively while changing one. Frames themselves are protected by pins,
+# not by these latches: a pinned frame is never evicted, so latching a frame only orders reads and writes of its page.
+# Waiting writers block new readers so a steady stream of readers can't starve them.
+# Not reentrant: a thread must not take a latch it already holds.
+class RWLatch:
+	def __init__(self) -> None:
+		self.condition = threading.Condition(threading.Lock())
+		self.readers = 0
+		self.writer = False
+		self.waiting_writers = 0
+
+	def acquire_shared(self) -> None:
+		with self.condition:
+			while self.writer or self.waiting_writers > 0:
+				self.condition.wait()
+			self.readers += 1
+
+	def release_shared(self) -> None:
+		with self.condition:
+			self.readers -= 1
+			if self.readers == 0:
+				self.condition.notify_all()
+
+	def acquire_exclusive(self) -> None:
+		with self.condition:
+			self.waiting_writers += 1
+			while self.writer or self.readers > 0:
+				self.condition.wait()
+			self.waiting_writers -= 1
+			self.writer = True
+
+	def release_exclusive(self) -> None:
+		with self.condition:
+			self.writer = False
+			self.condition.notify_all()
+
+	@contextmanager
+	def shared(self) -> Iterator[None]:
+		self.acquire_shared()
+		try:
+			yield
+		finally:
+			self.release_shared()
+
+	@contextmanager
+	def exclusive(self) -> Iterator[None]:
+		self.acquire_exclusive()
+		try:
+			yield
+		finally:
+			self.release_exclusive()
+
+
+# takes the latches of several frames at once, always in frame order so two threads latching overlapping
+# sets of frames can't deadlock
+@contextmanager
+def latch_frames(latches: list[RWLatch], buff_indices: list[int], exclusive: bool) -> Iterator[None]:
+	ordered = sorted(set(buff_indices))
+	taken: list[RWLatch] = []
+	try:
+		for buff_idx in ordered:
+			latch = latches[buff_idx]
+			if exclusive:
+				latch.acquire_exclusive()
+			else:
+				latch.acquire_shared()
+			taken.append(latch)
+		yield
+	finally:
+		for latch in reversed(taken):
+			if exclusive:
+				latch.release_exclusive()
+			else:
+				latch.release_shared()
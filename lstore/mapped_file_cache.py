@@ -0,0 +1,60 @@
+from __future__ import annotations
+from collections import OrderedDict
+import mmap
+import os
+import threading
+
+from lstore.config import config
+
+# The "mmap" I/O backend: page files are memory-mapped and bufferpool frames hold memoryview slices of the
+# mapping instead of private copies of the page. Reading a page doesn't copy anything, and changes made to a
+# frame are changes to the file's pages in the OS page cache, so frames never have to be written back explicitly.
+# The mapping is flushed to disk on close_all().
+# Page and segment files have a fixed size once they are created (see segment_file.py), so a file is
+# mapped once in full and never remapped.
+# Like FileDescriptorCache, at most `capacity` files are kept mapped; a mapping that frames still point into
+# can't be closed, so it stays open past the limit until those frames are gone.
+class MappedFileCache:
+	def __init__(self, capacity: int = config.MMAP_CACHE_SIZE) -> None:
+		self.capacity = capacity
+		self.mappings: OrderedDict[str, mmap.mmap] = OrderedDict() # least recently used first
+		self.lock = threading.RLock()
+
+	# returns a writable view of the whole file
+	def view(self, path: str) -> memoryview:
+		with self.lock:
+			mapping = self.mappings.get(path)
+			if mapping is not None:
+				self.mappings.move_to_end(path)
+				return memoryview(mapping)
+			fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+			try:
+				mapping = mmap.mmap(fd, 0, access=mmap.ACCESS_WRITE)
+			finally:
+				os.close(fd) # the mapping keeps its own reference to the file
+			self.mappings[path] = mapping
+			self.close_unused(self.capacity)
+			return memoryview(mapping)
+
+	# closes the least recently used mappings until at most `keep` are left, skipping mappings that are still in use
+	def close_unused(self, keep: int) -> None:
+		with self.lock:
+			for path in list(self.mappings.keys()):
+				if len(self.mappings) <= keep:
+					break
+				mapping = self.mappings[path]
+				mapping.flush()
+				try:
+					mapping.close()
+				except BufferError: # a frame still holds a view into this mapping
+					continue
+				del self.mappings[path]
+
+	def flush_all(self) -> None:
+		with self.lock:
+			for mapping in self.mappings.values():
+				mapping.flush()
+
+	def close_all(self) -> None:
+		self.flush_all()
+		self.close_unused(0)
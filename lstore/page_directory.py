@@ -0,0 +1,268 @@
+from __future__ import annotations
+from array import array
+import os
+import pickle
+import struct
+import sys
+import threading
+import typing
+
+from lstore.config import config
+from lstore.page_directory_entry import BaseMetadataPageID, BasePageID, PageDirectoryEntry, TailMetadataPageID, TailPageID
+
+if typing.TYPE_CHECKING:
+	from lstore.bufferpool import FileHandler
+
+# base RIDs count up from 1 and TIDs count down from INITIAL_TID, so the top bit tells them apart
+TAIL_RID_START = 2 ** 63
+BASE_RECORDS_PER_PAGE = config.BASE_RECORDS_PER_PAGE
+TAIL_RECORDS_PER_PAGE = config.TAIL_RECORDS_PER_PAGE
+BYTES_PER_INT = config.BYTES_PER_INT
+
+# how a table finds its records, kept in the catalog (config.byte_position.catalog.RID_ADDRESSING).
+# catalogs written before arithmetic addressing existed don't have the field, and read as ADDRESSING_DIRECTORY
+ADDRESSING_DIRECTORY = 0 # every record has a directory entry
+ADDRESSING_ARITHMETIC = 1 # locations are computed from the RID; only records stored elsewhere have an entry
+
+# The page directory of a table: where every base and tail record is stored.
+# Instead of a dict of PageDirectoryEntry objects, it keeps three parallel array('Q') columns per record type:
+# the page id, the metadata page id and the offset. Base records are at index RID, tail records at index
+# INITIAL_TID - TID, so both are dense. A page id of 0 (ids start at 1) means there is no record at that index.
+# That is 24 bytes per record, and entries are only made into PageDirectoryEntry objects when they are looked up.
+#
+# It is saved to "page_directory" as a flat file: a header (FORMAT_VERSION, number of base entries, number of tail
+# entries), then the base columns and the tail columns, each an array of little-endian uint64s. Every column is at a
+# fixed, 8-byte aligned position, so the file can be memory-mapped as is; loading it is one read per column.
+# Entries assigned after the file was written go to "page_directory.log" as they are made: value_assign appends
+# them (see LOG_ENTRY) to a buffer that is written to the end of the log once it holds
+# config.PAGE_DIRECTORY_LOG_BUFFER_SIZE bytes. checkpoint() and flush() write what is buffered and fsync the log, so
+# they cost as much as the entries assigned since the last one, and can be called any number of times.
+# Loading replays the log over the file. Once the log has as many entries as the file (and at least
+# config.PAGE_DIRECTORY_COMPACT_MIN_ENTRIES), checkpoint() and flush() compact it: the whole directory is written
+# to a new file that replaces the old one, and the log starts over. The file at least doubles in size between
+# compactions while a table grows, so every entry is rewritten a constant number of times on average.
+# Tables written before this kept the directory in page_directory.pickle; it is read once and converted on flush.
+#
+# With arithmetic addressing, the location of a record is computed from its RID instead. RIDs are handed out densely
+# and pages are filled in order, so base record RID is number RID - 1 and tail record TID is number INITIAL_TID - TID,
+# and there are BASE_RECORDS_PER_PAGE (TAIL_RECORDS_PER_PAGE) records per page; a base or tail page and its metadata
+# page always have the same id. value_assign only stores an entry if the record isn't where its RID says (a record
+# that was relocated, e.g. by a merge), and lookups use the stored entry if there is one. Tables written with
+# RID gaps (before every insert took exactly one RID) keep ADDRESSING_DIRECTORY.
+class ArrayPageDirectory:
+	FORMAT_VERSION = 1
+	HEADER = struct.Struct("<QQQ") # FORMAT_VERSION, base entries, tail entries
+	LOG_ENTRY = struct.Struct("<BQQQQ") # 1 for a tail record, index, page id, metadata page id, offset
+
+	def __init__(self, file_handler: FileHandler) -> None:
+		self.file_handler = file_handler
+		self.path = file_handler.table_file_path("page_directory")
+		self.log_path = self.path + ".log"
+		self.legacy_path = os.path.join(file_handler.table_path, "page_directory.pickle")
+		# [base columns, tail columns], each [page ids, metadata page ids, offsets]
+		self.columns: list[list[array]] = [[array("Q") for _ in range(3)] for _ in range(2)]
+		self.counts = [0, 0] # entries in use, the columns may be longer
+		self.lock = threading.Lock() # the columns and `pending`
+		self.log_lock = threading.Lock() # writes to the log and compaction, so batches reach the log in order. taken before `lock`
+		self.pending = bytearray() # log entries that haven't been written yet
+		self.log_entries = 0 # entries in the log file
+		self.file_entries = 0 # entries in the directory file
+		self.unsynced = False # whether entries were written to the log since it was last fsynced
+		self.needs_compaction = False # set when the directory was read from page_directory.pickle
+		self.arithmetic = file_handler.read_int_value("catalog", config.byte_position.catalog.RID_ADDRESSING) == ADDRESSING_ARITHMETIC
+		# the highest index with a record, by record type. with arithmetic addressing, every index up to it has one
+		self.last_index = [file_handler.next_base_rid.value() - 1, config.INITIAL_TID - file_handler.next_tail_rid.value() - 1]
+		if os.path.isfile(self.path):
+			self.load()
+		elif os.path.isfile(self.legacy_path):
+			self.load_legacy()
+
+	@staticmethod
+	def position(rid: int) -> tuple[int, int]:
+		if rid >= TAIL_RID_START:
+			return 1, config.INITIAL_TID - rid
+		return 0, rid
+
+	def load(self) -> None:
+		with open(self.path, "rb") as directory_file:
+			version, num_base, num_tail = ArrayPageDirectory.HEADER.unpack(directory_file.read(ArrayPageDirectory.HEADER.size))
+			if version != ArrayPageDirectory.FORMAT_VERSION:
+				raise(Exception(f"page directory {self.path} has format version {version}, expected {ArrayPageDirectory.FORMAT_VERSION}"))
+			for is_tail, count in enumerate([num_base, num_tail]):
+				for column in self.columns[is_tail]:
+					column.fromfile(directory_file, count)
+					if sys.byteorder == "big":
+						column.byteswap()
+				self.counts[is_tail] = count
+		self.file_entries = num_base + num_tail
+		if os.path.isfile(self.log_path):
+			with open(self.log_path, "r+b") as log_file:
+				data = log_file.read()
+				usable = len(data) - len(data) % ArrayPageDirectory.LOG_ENTRY.size
+				if usable < len(data):
+					log_file.truncate(usable) # the last entry was cut off by a crash; later entries have to line up
+			for is_tail, index, page_id, metadata_page_id, offset in ArrayPageDirectory.LOG_ENTRY.iter_unpack(memoryview(data)[:usable]):
+				self.set(is_tail, index, page_id, metadata_page_id, offset)
+			self.log_entries = usable // ArrayPageDirectory.LOG_ENTRY.size
+
+	# reads the pickled dict (and its pickled deltas) older tables have. the next flush() or checkpoint() writes it in the new format
+	def load_legacy(self) -> None:
+		legacy: dict[int, PageDirectoryEntry] = {}
+		for path in [self.legacy_path, self.legacy_path + ".delta"]:
+			if not os.path.isfile(path):
+				continue
+			with open(path, "rb") as legacy_file:
+				while True:
+					try:
+						legacy.update(pickle.load(legacy_file))
+					except (EOFError, pickle.UnpicklingError):
+						break
+		for rid, entry in legacy.items():
+			self.set(*self.position(rid), entry.page_id, entry.metadata_page_id, entry.offset)
+		self.needs_compaction = True
+
+	# sets an entry without logging it, growing the columns if needed
+	def set(self, is_tail: int, index: int, page_id: int, metadata_page_id: int, offset: int) -> None:
+		columns = self.columns[is_tail]
+		if index >= len(columns[0]):
+			grow = max(index + 1 - len(columns[0]), len(columns[0]), 1024) # at least double, so appending is amortized O(1)
+			for column in columns:
+				column.frombytes(bytes(grow * config.BYTES_PER_INT))
+		columns[0][index] = page_id
+		columns[1][index] = metadata_page_id
+		columns[2][index] = offset
+		if index >= self.counts[is_tail]:
+			self.counts[is_tail] = index + 1
+
+	def stored(self, is_tail: int, index: int) -> bool:
+		return 0 <= index < self.counts[is_tail] and self.columns[is_tail][0][index] != 0
+
+	# the page id and offset a record has with arithmetic addressing
+	@staticmethod
+	def computed_location(is_tail: int, index: int) -> tuple[int, int]:
+		if is_tail:
+			page_idx, record_idx = divmod(index, TAIL_RECORDS_PER_PAGE)
+		else:
+			page_idx, record_idx = divmod(index - 1, BASE_RECORDS_PER_PAGE) # RIDs start at 1
+		return page_idx + 1, record_idx * config.BYTES_PER_INT
+
+	def __contains__(self, rid: int) -> bool:
+		is_tail, index = self.position(rid)
+		return self.stored(is_tail, index) or (self.arithmetic and (1 - is_tail) <= index <= self.last_index[is_tail]) # base index 0 is unused
+
+	def __getitem__(self, rid: int) -> PageDirectoryEntry:
+		is_tail, index = self.position(rid)
+		page_id, metadata_page_id, offset = self.location(is_tail, index, rid)
+		if is_tail:
+			return PageDirectoryEntry(TailPageID(page_id), TailMetadataPageID(metadata_page_id), offset, "tail")
+		return PageDirectoryEntry(BasePageID(page_id), BaseMetadataPageID(metadata_page_id), offset, "base")
+
+	# (page id, metadata page id, offset) of a record. raises KeyError if there is no such record
+	def location(self, is_tail: int, index: int, rid: int) -> tuple[int, int, int]:
+		if self.stored(is_tail, index):
+			columns = self.columns[is_tail]
+			return columns[0][index], columns[1][index], columns[2][index]
+		if not self.arithmetic or not ((1 - is_tail) <= index <= self.last_index[is_tail]):
+			raise(KeyError(rid))
+		page_id, offset = self.computed_location(is_tail, index)
+		return page_id, page_id, offset
+
+	# the page id and offset of a record without making an entry object. raises KeyError like __getitem__.
+	# every read makes these lookups, so the arithmetic is done inline for records without an entry
+	def page_id(self, rid: int) -> BasePageID | TailPageID:
+		if self.arithmetic:
+			if rid < TAIL_RID_START:
+				if self.counts[0] <= rid <= self.last_index[0] and rid > 0:
+					return BasePageID((rid - 1) // BASE_RECORDS_PER_PAGE + 1)
+			elif self.counts[1] <= config.INITIAL_TID - rid <= self.last_index[1]:
+				return TailPageID((config.INITIAL_TID - rid) // TAIL_RECORDS_PER_PAGE + 1)
+		is_tail, index = self.position(rid)
+		page_id = self.location(is_tail, index, rid)[0]
+		return TailPageID(page_id) if is_tail else BasePageID(page_id)
+
+	def offset(self, rid: int) -> int:
+		if self.arithmetic:
+			if rid < TAIL_RID_START:
+				if self.counts[0] <= rid <= self.last_index[0] and rid > 0:
+					return (rid - 1) % BASE_RECORDS_PER_PAGE * BYTES_PER_INT
+			elif self.counts[1] <= config.INITIAL_TID - rid <= self.last_index[1]:
+				return (config.INITIAL_TID - rid) % TAIL_RECORDS_PER_PAGE * BYTES_PER_INT
+		is_tail, index = self.position(rid)
+		return self.location(is_tail, index, rid)[2]
+
+	# records where a record is. with arithmetic addressing, a record that is where its RID says isn't stored at all;
+	# use this for relocated records too
+	def value_assign(self, rid: int, entry: PageDirectoryEntry) -> None:
+		is_tail, index = self.position(rid)
+		if index > self.last_index[is_tail]:
+			self.last_index[is_tail] = index
+		if self.arithmetic and not self.stored(is_tail, index) and (entry.page_id, entry.offset) == self.computed_location(is_tail, index) and entry.metadata_page_id == entry.page_id:
+			return
+		with self.lock:
+			self.set(is_tail, index, entry.page_id, entry.metadata_page_id, entry.offset)
+			self.pending += ArrayPageDirectory.LOG_ENTRY.pack(is_tail, index, entry.page_id, entry.metadata_page_id, entry.offset)
+			full = len(self.pending) >= config.PAGE_DIRECTORY_LOG_BUFFER_SIZE
+		if full:
+			self.write_log(sync=False)
+
+	# appends the pending entries to the log. must be called with log_lock held
+	def append_pending(self, sync: bool) -> None:
+		with self.lock:
+			pending, self.pending = self.pending, bytearray()
+		if len(pending) == 0 and not (sync and self.unsynced):
+			return
+		with open(self.log_path, "ab") as log_file:
+			log_file.write(pending)
+			if sync:
+				log_file.flush()
+				os.fsync(log_file.fileno())
+		self.unsynced = not sync
+		self.log_entries += len(pending) // ArrayPageDirectory.LOG_ENTRY.size
+
+	def write_log(self, sync: bool) -> None:
+		with self.log_lock:
+			self.append_pending(sync)
+
+	# writes the whole directory to a new file that replaces the old one, and starts the log over.
+	# must be called with log_lock held
+	def compact(self) -> None:
+		temp_path = self.path + ".tmp"
+		with self.lock: # the new file has to include every entry the log would have had
+			with open(temp_path, "wb") as directory_file:
+				directory_file.write(ArrayPageDirectory.HEADER.pack(ArrayPageDirectory.FORMAT_VERSION, self.counts[0], self.counts[1]))
+				for is_tail in range(2):
+					for column in self.columns[is_tail]:
+						used = column[:self.counts[is_tail]]
+						if sys.byteorder == "big":
+							used.byteswap()
+						used.tofile(directory_file)
+				directory_file.flush()
+				os.fsync(directory_file.fileno())
+			os.replace(temp_path, self.path)
+			self.pending = bytearray()
+		# a crash before the log is removed just replays entries the new file already has
+		for path in [self.log_path, self.legacy_path, self.legacy_path + ".delta"]:
+			if os.path.isfile(path):
+				os.remove(path)
+		self.log_entries = 0
+		self.unsynced = False
+		self.file_entries = self.counts[0] + self.counts[1]
+		self.needs_compaction = False
+
+	# makes every entry assigned so far durable, compacting the log if it has grown as large as the directory file.
+	# the directory stays usable. used by checkpoints and when the database is closed
+	def flush(self) -> None:
+		with self.log_lock:
+			if self.needs_compaction or not os.path.isfile(self.path):
+				self.compact()
+				return
+			self.append_pending(sync=True)
+			if self.log_entries >= max(config.PAGE_DIRECTORY_COMPACT_MIN_ENTRIES, self.file_entries):
+				self.compact()
+
+	def checkpoint(self) -> None:
+		self.flush()
+
+	def __del__(self) -> None:
+		if len(self.pending) > 0:
+			raise(Exception("unflushed page directory"))
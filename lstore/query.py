@@ -1,4 +1,5 @@
-from typing import Literal
+import functools
+from typing import Any, Callable, Literal, TypeVar
 from lstore.bufferpool import PsuedoBuffIntValue, Table
 from lstore.ColumnIndex import DataIndex, RawIndex
 from lstore.page_directory_entry import BaseRID, PageDirectoryEntry, BasePageID
@@ -12,6 +13,17 @@ from lstore.helper import helper
 import struct
 
 
+TQueryResult = TypeVar("TQueryResult")
+
+# runs a query inside the bufferpool's query scope, so it shows up in the bufferpool and table statistics
+def counted_query(method: Callable[..., TQueryResult]) -> Callable[..., TQueryResult]:
+    @functools.wraps(method)
+    def wrapper(self: "Query", *args: Any, **kwargs: Any) -> TQueryResult:
+        with self.db_bpool.query_scope(self.table):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Query:
     """
     # Creates a Query object that can perform different queries on the specified table
@@ -30,6 +42,7 @@ class Query:
     # Return False if record doesn't exist or is locked due to 2PL
     """
 
+    @counted_query
     def delete(self, primary_key: int) -> bool:
 
         projected_columns_index : list[Literal[0, 1]] = [1] * self.table.num_columns
@@ -70,10 +83,9 @@ class Query:
             new_null_column = bitmask | record.metadata.null_column
             self.table.db_bpool.update_col_record_inplace(self.table, indirection_column, config.NULL_COLUMN, new_null_column)
 
-            buf_record = self.db_bpool.get_record(self.table, indirection_column, [1]*self.table.num_columns)
-            assert buf_record is not None
-            record = buf_record.get_value()
-            assert record is not None
+            read_res = self.db_bpool.read_record(self.table, indirection_column, [1]*self.table.num_columns)
+            assert read_res is not None
+            record = read_res
             indirection_column = record.metadata.indirection_column
             assert indirection_column is not None
             tmp = self.table.page_directory_buff[indirection_column]
@@ -126,6 +138,7 @@ class Query:
     # Return True upon succesful insertion
     # Returns False if insert fails for whatever reason
     """
+    @counted_query
     def insert(self, *columns: int | None) -> bool:
         schema_encoding = 0b0
         timestamp = int(time.time())
@@ -169,6 +182,7 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
+    @counted_query
     def select(self, search_key: int, search_key_index: DataIndex,
                projected_columns_index: list[Literal[0] | Literal[1]], use_idx: bool = False) -> list[Record]:
         # search_key_index = DataIndex(search_key_index)
@@ -188,21 +202,20 @@ class Query:
                 valid_records.append(record)
                 # #print(f"record cols was {valid_records[0].columns}")
         else:
-            last_base_rid_buff = self.table.file_handler.next_base_rid
-            for rid in [BaseRID(_) for _ in range(1, last_base_rid_buff.value())]:
-            # for rid in helper.cast_list(range(1, last_base_rid_buff.value()), BaseRID()):
-                record = self.db_bpool.get_updated_record(self.table, rid, [1] * self.table.num_columns)
-                assert record is not None
-                assert record.metadata.rid == rid
-                assert record.metadata.rid is not None
-                dir_entry = self.table.page_directory_buff[record.metadata.rid]
-                if dir_entry.page_type != "base":
-                    continue
-                search_key_col = self.db_bpool.get_updated_col(self.table, record, DataIndex(search_key_index))
-                # print(f"considering rid {rid}, its col was {search_key_col}. looking for {search_key}")
-                if search_key_col == search_key:
-                    valid_records.append(record)
-            # last_base_rid_buff.flush()
+            # the full scan filters a whole base page at a time on the search column; only records whose base value
+            # matches, or whose search column was updated, are read record by record
+            scan_cols: list[Literal[0, 1]] = [0] * self.table.num_columns
+            scan_cols[search_key_index] = 1
+            for page in self.db_bpool.scan_base_pages(self.table, scan_cols):
+                for position in page.candidates(search_key_index, search_key):
+                    rid = BaseRID(page.rid(position))
+                    record = self.db_bpool.get_updated_record(self.table, rid, [1] * self.table.num_columns)
+                    assert record is not None
+                    assert record.metadata.rid == rid
+                    search_key_col = self.db_bpool.get_updated_col(self.table, record, DataIndex(search_key_index))
+                    # print(f"considering rid {rid}, its col was {search_key_col}. looking for {search_key}")
+                    if search_key_col == search_key:
+                        valid_records.append(record)
         
         for record in valid_records:
             col_list = list(record.columns)
@@ -336,6 +349,7 @@ class Query:
     # TODO finish
     """
     """
+    @counted_query
     def update(self, primary_key: int, *columns: int | None, **kwargs: bool) -> bool:
         delete = kwargs.get("delete")
         if delete is None:
@@ -454,9 +468,8 @@ class Query:
                         break
                             
 
-                    current_buffer_record=self.db_bpool.get_record(self.table,tmp_indirection_col,[1]*self.table.num_columns)
-                    assert current_buffer_record is not None
-                    current_record=current_buffer_record.get_value()
+                    current_record=self.db_bpool.read_record(self.table,tmp_indirection_col,[1]*self.table.num_columns)
+                    assert current_record is not None
                     tmp_indirection_col=current_record.metadata.indirection_column
             
             
@@ -472,16 +485,6 @@ class Query:
                 self.db_bpool.delete_nth_record(self.table, BasePageID(base_record.metadata.base_rid), base_dir_entry.offset)# the other bits in the null column no longer matter because they are deleted
                 #base_dir_entry.page_id.update_nth_record(base_dir_entry.offset, config.NULL_COLUMN, bitmask)
         
-        #base_indirection = self.insert_tail(page_range, tail_indirection, tail_schema_encoding, *updated_columns)
-        base_metadata = WriteSpecifiedMetadata(tail_indirection, tail_schema_encoding, null_bitmask)
-        base_indirection = self.db_bpool.insert_tail_record(self.table, base_metadata, *updated_columns)
-        
-        #success = base_page_dir_entry.page_id.update_nth_record(base_page_dir_entry.offset, config.INDIRECTION_COLUMN,
-        #                                                        base_indirection)
-        
-        success = self.db_bpool.update_nth_record(base_dir_entry.page_id, base_dir_entry.offset, config.INDIRECTION_COLUMN, base_indirection)
-        assert success, "update not successful"
-
         #base_indirection = self.insert_tail(page_range, tail_indirection, tail_schema_encoding, *updated_columns)
         assert base_record.metadata.rid is not None
         tail_metadata = WriteSpecifiedTailMetadata(tail_indirection, tail_schema_encoding, null_bitmask, base_record.metadata.rid)
@@ -501,8 +504,6 @@ class Query:
         success = self.db_bpool.update_col_record_inplace(self.table, BaseRID(base_record.metadata.rid), config.SCHEMA_ENCODING_COLUMN, base_schema_encoding)
         assert success, "update not successful"
 
-        r = self.db_bpool.get_record(self.table, BaseRID(base_record.metadata.rid), [1] * self.table.num_columns)
-        
         return success
 
     
@@ -516,8 +517,12 @@ class Query:
     # Returns False if no record exists in the given range
     """
 
+    @counted_query
     def sum(self, start_range: int, end_range: int, aggregate_column_index: DataIndex) -> int | bool:
         s = None
+        base_records = self.table.file_handler.next_base_rid.value() - 1
+        if end_range - start_range + 1 >= base_records * config.SUM_SCAN_MIN_FRACTION:
+            return self.sum_by_scan(start_range, end_range, aggregate_column_index)
         # #print("hi")
         # valid_records: list[Record] = []
         valid_numbers: list[int] = []
@@ -569,6 +574,34 @@ class Query:
         return s
 
 
+    # sum() for wide ranges: reads the key and aggregate columns a whole base page at a time instead of one index lookup
+    # and select per key. records whose key or aggregate column was updated are resolved through their tail records
+    def sum_by_scan(self, start_range: int, end_range: int, aggregate_column_index: DataIndex) -> int | bool:
+        key_index = self.table.key_index
+        scan_cols: list[Literal[0, 1]] = [0] * self.table.num_columns
+        scan_cols[key_index] = 1
+        scan_cols[aggregate_column_index] = 1
+        total = 0
+        found = 0
+        for page in self.db_bpool.scan_base_pages(self.table, scan_cols):
+            page_total, page_found, slow_positions = page.sum_in_range(key_index, start_range, end_range, aggregate_column_index)
+            total += page_total
+            found += page_found
+            for position in slow_positions:
+                record = self.db_bpool.get_updated_record(self.table, BaseRID(page.rid(position)), scan_cols)
+                assert record is not None
+                key = record[key_index]
+                if key is None or not start_range <= key <= end_range:
+                    continue
+                num = record[aggregate_column_index]
+                assert num is not None
+                total += num
+                found += 1
+        if found == 0:
+            return False
+        return total
+
+
     """
     :param start_range: int         # Start of the key range to aggregate 
     :param end_range: int           # End of the key range to aggregate 
@@ -616,6 +649,7 @@ class Query:
     # Returns True is increment is successful
     # Returns False if no record matches key or if target record is locked by 2PL.
     """
+    @counted_query
     def increment(self, key: int, column: DataIndex) -> bool:
         r = self.select(key, self.table.key_index, [1] * self.table.num_columns)[0]
         if r is not False:
@@ -0,0 +1,92 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import typing
+
+from lstore.config import config
+from lstore.page_directory_entry import BasePageID
+
+if typing.TYPE_CHECKING:
+	from lstore.bufferpool import Bufferpool, FilePageReadResult, Table
+
+# Sequential readahead for base pages. The Bufferpool reports every base page a query asks for; once a table's
+# base pages have been asked for in increasing order `trigger` times in a row, the next `distance` base pages
+# are read from disk on a worker thread. The worker only reads: the pages (all data columns plus the metadata)
+# are staged here, and Bufferpool.bring_from_disk takes them from the stage instead of reading the files itself,
+# so the bufferpool's frames are only ever changed by the thread running the query.
+# A page is never staged while any of its frames are in the bufferpool, and writing one of its frames back
+# drops its staged copy, so a staged page always matches what is on disk.
+class Readahead:
+	def __init__(self, bufferpool: Bufferpool, distance: int = config.READAHEAD_PAGES, trigger: int = config.READAHEAD_TRIGGER) -> None:
+		self.bufferpool = bufferpool
+		self.distance = distance
+		self.trigger = trigger
+		self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bufferpool-readahead")
+		self.lock = threading.Lock()
+		self.last_page: dict[str, int] = {} # per table, the last base page asked for
+		self.streak: dict[str, int] = {} # per table, how many times in a row the next base page was asked for
+		self.staged: OrderedDict[tuple[str, int], FilePageReadResult] = OrderedDict() # oldest first
+		self.pending: set[tuple[str, int]] = set()
+		self.generation: dict[tuple[str, int], int] = {} # bumped whenever a page is written, to discard reads that raced with the write
+		self.pages_staged = 0
+		self.pages_used = 0
+
+	def record_access(self, table: Table, page_id: BasePageID) -> None:
+		last_page = self.last_page.get(table.name)
+		if last_page == page_id:
+			return # still on the same page
+		streak = self.streak.get(table.name, 0) + 1 if last_page is not None and page_id == last_page + 1 else 0
+		self.streak[table.name] = streak
+		self.last_page[table.name] = page_id
+		if streak < self.trigger:
+			return
+		last_existing_page = table.file_handler.next_base_page_id.value()
+		for next_page in range(page_id + 1, min(page_id + self.distance, last_existing_page) + 1):
+			self.schedule(table, BasePageID(next_page))
+
+	def schedule(self, table: Table, page_id: BasePageID) -> None:
+		key = (table.name, int(page_id))
+		if self.bufferpool.lookup_frame(table, page_id, 0) is not None:
+			return # (part of) the page is in the bufferpool already
+		with self.lock:
+			if key in self.staged or key in self.pending:
+				return
+			self.pending.add(key)
+			generation = self.generation.get(key, 0)
+		self.executor.submit(self.load, table, page_id, generation)
+
+	# runs on the worker thread
+	def load(self, table: Table, page_id: BasePageID, generation: int) -> None:
+		key = (table.name, int(page_id))
+		try:
+			read_res = table.file_handler.read_projected_cols_of_page(page_id)
+		finally:
+			with self.lock:
+				self.pending.discard(key)
+		with self.lock:
+			if read_res is None or self.generation.get(key, 0) != generation:
+				return # the page was written while it was being read
+			self.staged[key] = read_res
+			self.pages_staged += 1
+			while len(self.staged) > self.distance * 2:
+				self.staged.popitem(last=False)
+
+	# returns the staged copy of a page and removes it from the stage, or None if it wasn't read ahead
+	def take(self, table: Table, page_id: BasePageID) -> FilePageReadResult | None:
+		with self.lock:
+			read_res = self.staged.pop((table.name, int(page_id)), None)
+		if read_res is not None:
+			self.pages_used += 1
+		return read_res
+
+	# called when one of the page's frames is written to disk
+	def invalidate(self, table: Table, page_id: BasePageID) -> None:
+		key = (table.name, int(page_id))
+		with self.lock:
+			self.generation[key] = self.generation.get(key, 0) + 1
+			self.staged.pop(key, None)
+
+	def shutdown(self) -> None:
+		self.executor.shutdown(wait=True)
+		self.staged.clear()
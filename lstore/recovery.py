@@ -0,0 +1,111 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import time
+import typing
+from typing import NamedTuple
+
+from lstore.config import config
+from lstore.helper import helper
+from lstore.page_directory_entry import BaseMetadataPageID, BasePageID, BaseRID, BaseTailPageID, PageDirectoryEntry, TailMetadataPageID, TailPageID, TailRID
+from lstore.wal import WAL_INSERT, WalRecord, WriteAheadLog
+
+if typing.TYPE_CHECKING:
+	from lstore.bufferpool import Table
+	from lstore.db import Database
+
+class RecoveryStats(NamedTuple):
+	records: int # log records redone
+	pages: int # base and tail pages they touched
+	tables: int
+	seconds: float
+
+	@property
+	def records_per_second(self) -> float:
+		return self.records / self.seconds if self.seconds > 0 else 0.0
+
+
+# Redoes the write-ahead log after a crash, from the LSN of the last checkpoint (see wal.py and Database.checkpoint).
+# Log records are grouped by table and page. Pages don't depend on each other, so each page's records are redone in
+# LSN order on a pool of `workers` threads, with the page pinned and latched once for all of them. Every record
+# writes absolute values at a fixed offset, so redoing a change that already reached the page before the crash is harmless.
+# While grouping, the main thread rebuilds what is only kept in memory: the page directory entries, RID and TID
+# counters and insert positions of the inserts, and the primary key index.
+class Recovery:
+	def __init__(self, database: Database, workers: int = config.RECOVERY_WORKERS) -> None:
+		self.database = database
+		self.workers = workers
+
+	def run(self) -> RecoveryStats:
+		start = time.perf_counter()
+		wal = self.database.wal
+		assert wal is not None
+		tables = {table.name: table for table in self.database.tables}
+		pages: dict[tuple[str, str, int], list[WalRecord]] = {} # by table, page type and page id; BasePageID(1) == TailPageID(1)
+		last_inserts: dict[tuple[str, str], WalRecord] = {} # by table and page type, the insert furthest into the table
+		num_records = 0
+		for record in WriteAheadLog.read_records(wal.directory, WriteAheadLog.read_checkpoint(wal.directory)):
+			table = tables.get(record.table)
+			if table is None:
+				continue # the table was dropped
+			pages.setdefault((record.table, record.page_type, record.page_id), []).append(record)
+			num_records += 1
+			if record.kind == WAL_INSERT:
+				self.redo_insert_bookkeeping(table, record)
+				last = last_inserts.get((record.table, record.page_type))
+				if last is None or (record.page_id, record.offset) > (last.page_id, last.offset):
+					last_inserts[(record.table, record.page_type)] = record
+		for (table_name, page_type), record in last_inserts.items():
+			page_id: BaseTailPageID = BasePageID(record.page_id) if page_type == "base" else TailPageID(record.page_id)
+			metadata_page_id = BaseMetadataPageID(record.metadata_page_id) if page_type == "base" else TailMetadataPageID(record.metadata_page_id)
+			# RIDs and TIDs are handed out in page order, so the last insert also has the highest RID (lowest TID)
+			tables[table_name].file_handler.advance_insert_position(page_id, metadata_page_id, record.offset + config.BYTES_PER_INT, record.rid)
+
+		# the thread pool works page by page; the records of a page stay in LSN order
+		with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="recovery") as executor:
+			futures = []
+			for (table_name, page_type, page_number), records in pages.items():
+				page_id = BasePageID(page_number) if page_type == "base" else TailPageID(page_number)
+				futures.append(executor.submit(self.redo_page, tables[table_name], page_id, records))
+			for future in futures:
+				future.result() # re-raises anything that went wrong
+		return RecoveryStats(num_records, len(pages), len({table_name for table_name, _, _ in pages}), time.perf_counter() - start)
+
+	# the page directory entry of a redone insert, and its index entry if it's a base record
+	def redo_insert_bookkeeping(self, table: Table, record: WalRecord) -> None:
+		if record.page_type == "base":
+			entry = PageDirectoryEntry(BasePageID(record.page_id), BaseMetadataPageID(record.metadata_page_id), record.offset, "base")
+			rid: BaseRID | TailRID = BaseRID(record.rid)
+		else:
+			entry = PageDirectoryEntry(TailPageID(record.page_id), TailMetadataPageID(record.metadata_page_id), record.offset, "tail")
+			rid = TailRID(record.rid)
+		table.page_directory_buff.value_assign(rid, entry)
+		if record.page_type == "base":
+			key_raw_index = table.key_index.toRawIndex()
+			key = next((value for raw_idx, value in record.values if raw_idx == key_raw_index), None)
+			if key is not None:
+				located = table.index.locate(table.key_index, key)
+				if located != record.rid and not (isinstance(located, list) and record.rid in located): # the index may have it already
+					table.index.update_index(table.key_index, key, rid)
+
+	# redoes the records of one page. runs on a worker thread
+	def redo_page(self, table: Table, page_id: BaseTailPageID, records: list[WalRecord]) -> None:
+		file_handler = table.file_handler
+		if not file_handler.page_exists(page_id): # the crash came between creating the page's files
+			metadata_page_id = BaseMetadataPageID(records[0].metadata_page_id) if isinstance(page_id, BasePageID) else TailMetadataPageID(records[0].metadata_page_id)
+			if not file_handler.page_exists(metadata_page_id):
+				file_handler.initialize_metadata_file(metadata_page_id)
+			file_handler.initialize_base_tail_page(page_id, metadata_page_id)
+		bufferpool = table.db_bpool
+		with bufferpool.pinned_page(table, page_id, [1] * table.num_columns) as page:
+			if page is None:
+				raise(Exception(f"no room in the bufferpool to recover page {page_id} of table {table.name}"))
+			frames = page.metadata_buff_indices + page.data_buff_indices # indexed by raw column index
+			with bufferpool.latch_pages(frames, exclusive=True): # type: ignore[arg-type]
+				for record in records:
+					for raw_idx, value in record.values:
+						buff_idx = frames[raw_idx]
+						assert buff_idx is not None
+						entry = bufferpool[buff_idx]
+						helper.UINT64.pack_into(entry.physical_page.data, record.offset, value)
+						entry.dirty_bit = True
+						entry.page_lsn = record.lsn
@@ -0,0 +1,218 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Callable, Hashable
+
+from lstore.config import config
+
+# Replacement policies decide which bufferpool frame gets evicted when a new physical page has to be brought in.
+# The Bufferpool tells the policy whenever a frame is filled (record_load), emptied (record_removal) or used
+# (record_access). Empty frames are handed out by the Bufferpool itself, so policies only ever pick among
+# frames that currently hold a page.
+# Frames are plain ints here (the Bufferpool passes BufferpoolIndex values) and pages are identified by the
+# Bufferpool's FrameKey, which policies that remember evicted pages (LRU-K, 2Q) use as a hashable key.
+
+class ReplacementPolicy(ABC):
+	def __init__(self, num_frames: int) -> None:
+		self.num_frames = num_frames
+
+	# a frame was filled with a page read from disk. this does not count as a reference by itself
+	@abstractmethod
+	def record_load(self, buff_idx: int, page_key: Hashable) -> None:
+		pass
+
+	# a frame was emptied (evicted or the bufferpool was closed)
+	@abstractmethod
+	def record_removal(self, buff_idx: int, page_key: Hashable) -> None:
+		pass
+
+	# the frames were referenced by one request (one get_page call)
+	@abstractmethod
+	def record_access(self, buff_indices: list[int]) -> None:
+		pass
+
+	# returns the frame that should be evicted next, or None if no frame passes `can_evict`.
+	# does not modify the bufferpool; the Bufferpool will call record_removal once it actually evicts the frame
+	@abstractmethod
+	def choose_victim(self, can_evict: Callable[[int], bool]) -> int | None:
+		pass
+
+
+# CLOCK (second chance): every access sets the frame's reference bit. The hand clears reference bits as it
+# sweeps and evicts the first evictable frame whose bit is already clear.
+class ClockPolicy(ReplacementPolicy):
+	def __init__(self, num_frames: int) -> None:
+		super().__init__(num_frames)
+		self.reference_bits = bytearray(num_frames)
+		self.resident = bytearray(num_frames)
+		self.hand = 0
+
+	def record_load(self, buff_idx: int, page_key: Hashable) -> None:
+		self.resident[buff_idx] = 1
+		self.reference_bits[buff_idx] = 0
+
+	def record_removal(self, buff_idx: int, page_key: Hashable) -> None:
+		self.resident[buff_idx] = 0
+		self.reference_bits[buff_idx] = 0
+
+	def record_access(self, buff_indices: list[int]) -> None:
+		for buff_idx in buff_indices:
+			self.reference_bits[buff_idx] = 1
+
+	def choose_victim(self, can_evict: Callable[[int], bool]) -> int | None:
+		# two full sweeps: the first one may only clear reference bits
+		for _ in range(2 * self.num_frames):
+			i = self.hand
+			self.hand = (self.hand + 1) % self.num_frames
+			if not self.resident[i] or not can_evict(i):
+				continue
+			if self.reference_bits[i]:
+				self.reference_bits[i] = 0
+				continue
+			return i
+		return None
+
+
+class LRUPolicy(ReplacementPolicy):
+	def __init__(self, num_frames: int) -> None:
+		super().__init__(num_frames)
+		self.recency: OrderedDict[int, None] = OrderedDict() # least recently used first
+
+	def record_load(self, buff_idx: int, page_key: Hashable) -> None:
+		self.recency[buff_idx] = None
+		self.recency.move_to_end(buff_idx)
+
+	def record_removal(self, buff_idx: int, page_key: Hashable) -> None:
+		self.recency.pop(buff_idx, None)
+
+	def record_access(self, buff_indices: list[int]) -> None:
+		for buff_idx in buff_indices:
+			self.recency.move_to_end(buff_idx)
+
+	def choose_victim(self, can_evict: Callable[[int], bool]) -> int | None:
+		for buff_idx in self.recency:
+			if can_evict(buff_idx):
+				return buff_idx
+		return None
+
+
+# LRU-K: evicts the frame whose K-th most recent reference is the oldest. Frames referenced fewer than K times
+# have an infinite backward K-distance and are evicted first (oldest first), which is what keeps pages touched
+# by a single scan from pushing out pages that are referenced repeatedly.
+# References that happen within `correlated_period` requests of the previous one are treated as the same
+# reference (a scan touches the same page once per record), and the reference history of evicted pages is
+# retained for a while so a page that comes back quickly is recognized as hot.
+class LRUKPolicy(ReplacementPolicy):
+	def __init__(self, num_frames: int, k: int = config.LRU_K, correlated_period: int = config.LRU_K_CORRELATED_PERIOD) -> None:
+		super().__init__(num_frames)
+		self.k = k
+		self.correlated_period = correlated_period
+		self.clock = 0
+		self.frame_pages: dict[int, Hashable] = {}
+		self.resident_pages: set[Hashable] = set()
+		self.last_access: dict[int, int] = {} # clock of the last reference of each resident frame
+		self.loaded_at: dict[int, int] = {}
+		# reference history per page, most recent last. kept for evicted pages too (bounded by num_frames)
+		self.history: OrderedDict[Hashable, deque[int]] = OrderedDict()
+
+	def record_load(self, buff_idx: int, page_key: Hashable) -> None:
+		self.frame_pages[buff_idx] = page_key
+		self.resident_pages.add(page_key)
+		self.loaded_at[buff_idx] = self.clock
+		if page_key not in self.history:
+			self.history[page_key] = deque(maxlen=self.k)
+		self.history.move_to_end(page_key)
+
+	def record_removal(self, buff_idx: int, page_key: Hashable) -> None:
+		self.frame_pages.pop(buff_idx, None)
+		self.resident_pages.discard(page_key)
+		self.last_access.pop(buff_idx, None)
+		self.loaded_at.pop(buff_idx, None)
+		# forget the oldest retained history of a page that is no longer resident
+		if len(self.history) - len(self.resident_pages) > self.num_frames:
+			for old_page_key in self.history:
+				if old_page_key not in self.resident_pages:
+					del self.history[old_page_key]
+					break
+
+	def record_access(self, buff_indices: list[int]) -> None:
+		self.clock += 1
+		for buff_idx in buff_indices:
+			page_history = self.history[self.frame_pages[buff_idx]]
+			last_access = self.last_access.get(buff_idx)
+			if last_access is not None and self.clock - last_access <= self.correlated_period:
+				page_history[-1] = self.clock # correlated reference: only moves the latest reference forward
+			else:
+				page_history.append(self.clock)
+			self.last_access[buff_idx] = self.clock
+
+	def choose_victim(self, can_evict: Callable[[int], bool]) -> int | None:
+		victim: int | None = None
+		victim_rank: tuple[int, int] | None = None
+		for buff_idx, page_key in self.frame_pages.items():
+			if not can_evict(buff_idx):
+				continue
+			page_history = self.history[page_key]
+			if len(page_history) < self.k:
+				rank = (0, page_history[0] if len(page_history) > 0 else self.loaded_at[buff_idx])
+			else:
+				rank = (1, page_history[0]) # the K-th most recent reference
+			if victim_rank is None or rank < victim_rank:
+				victim, victim_rank = buff_idx, rank
+		return victim
+
+
+# 2Q: newly loaded pages enter a FIFO queue (A1in). Pages evicted from A1in are remembered in a ghost queue
+# (A1out); if such a page is loaded again it goes to the main LRU queue (Am). A page touched once by a scan
+# never makes it into Am, so scans only cycle through A1in.
+class TwoQPolicy(ReplacementPolicy):
+	def __init__(self, num_frames: int, kin_ratio: float = config.TWO_Q_KIN_RATIO, kout_ratio: float = config.TWO_Q_KOUT_RATIO) -> None:
+		super().__init__(num_frames)
+		self.kin = max(1, int(num_frames * kin_ratio))
+		self.kout = max(1, int(num_frames * kout_ratio))
+		self.a1in: OrderedDict[int, Hashable] = OrderedDict() # frame -> page, oldest first
+		self.am: OrderedDict[int, Hashable] = OrderedDict() # frame -> page, least recently used first
+		self.a1out: OrderedDict[Hashable, None] = OrderedDict() # ghost pages, oldest first
+
+	def record_load(self, buff_idx: int, page_key: Hashable) -> None:
+		if page_key in self.a1out:
+			del self.a1out[page_key]
+			self.am[buff_idx] = page_key
+		else:
+			self.a1in[buff_idx] = page_key
+
+	def record_removal(self, buff_idx: int, page_key: Hashable) -> None:
+		if buff_idx in self.a1in:
+			del self.a1in[buff_idx]
+			self.a1out[page_key] = None
+			while len(self.a1out) > self.kout:
+				self.a1out.popitem(last=False)
+		else:
+			self.am.pop(buff_idx, None)
+
+	def record_access(self, buff_indices: list[int]) -> None:
+		for buff_idx in buff_indices:
+			if buff_idx in self.am:
+				self.am.move_to_end(buff_idx)
+			# hits in A1in leave the page where it is
+
+	def choose_victim(self, can_evict: Callable[[int], bool]) -> int | None:
+		queues = [self.a1in, self.am] if len(self.a1in) > self.kin else [self.am, self.a1in]
+		for queue in queues:
+			for buff_idx in queue:
+				if can_evict(buff_idx):
+					return buff_idx
+		return None
+
+
+REPLACEMENT_POLICIES: dict[str, Callable[[int], ReplacementPolicy]] = {
+	"clock": ClockPolicy,
+	"lru": LRUPolicy,
+	"lru-k": LRUKPolicy,
+	"2q": TwoQPolicy,
+}
+
+def make_replacement_policy(name: str, num_frames: int) -> ReplacementPolicy:
+	if name not in REPLACEMENT_POLICIES:
+		raise(Exception(f"unknown replacement policy {name}; expected one of {list(REPLACEMENT_POLICIES.keys())}"))
+	return REPLACEMENT_POLICIES[name](num_frames)
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import os
+
+from lstore.config import config
+from lstore.page_directory_entry import BaseMetadataPageID, BasePageID, PageID, TailMetadataPageID, TailPageID
+
+# how a table's pages are stored, kept in the catalog (config.byte_position.catalog.STORAGE_FORMAT).
+# catalogs written before segment files existed don't have the field, and read as STORAGE_PAGE_FILES
+STORAGE_PAGE_FILES = 0 # one file per base, tail and metadata page: base_N, tail_N, base_metadata_N, tail_metadata_N
+STORAGE_SEGMENTS = 1 # one file per page range (see SegmentLayout)
+
+# the order of the page types' slots in a segment file
+SEGMENT_PAGE_TYPES: tuple[type, ...] = (BasePageID, BaseMetadataPageID, TailPageID, TailMetadataPageID)
+
+# Segment files pack the pages of a page range into one file: segment_R holds the base, tail, base metadata and tail
+# metadata pages whose ids are in range R (ids R * pages_per_segment + 1 up to (R + 1) * pages_per_segment).
+# A segment file starts with a header padded to a physical page:
+#	num_columns, pages_per_segment, then the page table: one int per slot, holding the id of the page stored in
+#	the slot, or 0 if the slot hasn't been used yet. slots are ordered by page type (SEGMENT_PAGE_TYPES), then id
+# followed by the slots of each page type in turn. A slot is laid out exactly like the per-page file of its page
+# (header, then the physical pages), so the rest of the FileHandler only has to add the slot's position.
+# Segments are created at their full size, so they are never extended, and a mapped segment (the "mmap" I/O backend)
+# never has to be remapped. Slots that haven't been used are holes in the file and take no disk space.
+class SegmentLayout:
+	def __init__(self, num_columns: int, pages_per_segment: int = config.PAGES_PER_PAGERANGE) -> None:
+		self.num_columns = num_columns
+		self.pages_per_segment = pages_per_segment
+		base_tail_size = config.byte_position.base_tail.DATA + num_columns * config.PHYSICAL_PAGE_SIZE
+		metadata_size = config.byte_position.metadata.DATA + config.NUM_METADATA_COL * config.PHYSICAL_PAGE_SIZE
+		self.page_sizes = [base_tail_size, metadata_size, base_tail_size, metadata_size] # by SEGMENT_PAGE_TYPES
+		page_table_end = config.byte_position.segment.PAGE_TABLE + len(SEGMENT_PAGE_TYPES) * pages_per_segment * config.BYTES_PER_INT
+		self.header_size = -(-page_table_end // config.PHYSICAL_PAGE_SIZE) * config.PHYSICAL_PAGE_SIZE
+		self.type_positions: list[int] = [] # where the slots of each page type start
+		position = self.header_size
+		for page_size in self.page_sizes:
+			self.type_positions.append(position)
+			position += page_size * pages_per_segment
+		self.size = position
+
+	def segment_number(self, page_id: PageID) -> int:
+		return (page_id - 1) // self.pages_per_segment
+
+	def file_name(self, page_id: PageID) -> str:
+		return f"segment_{self.segment_number(page_id)}"
+
+	# the page type's index in SEGMENT_PAGE_TYPES and the page's slot among that type's slots
+	def slot(self, page_id: PageID) -> tuple[int, int]:
+		return SEGMENT_PAGE_TYPES.index(type(page_id)), (page_id - 1) % self.pages_per_segment
+
+	# the byte position the page starts at in its segment
+	def page_position(self, page_id: PageID) -> int:
+		type_idx, slot = self.slot(page_id)
+		return self.type_positions[type_idx] + slot * self.page_sizes[type_idx]
+
+	# the byte position of the page's page table entry in its segment
+	def page_table_position(self, page_id: PageID) -> int:
+		type_idx, slot = self.slot(page_id)
+		return config.byte_position.segment.PAGE_TABLE + (type_idx * self.pages_per_segment + slot) * config.BYTES_PER_INT
+
+	# creates an empty segment file. it is written under a temporary name first, so a crash can't leave a
+	# segment without its header behind
+	def create(self, path: str) -> None:
+		temp_path = path + ".tmp"
+		with open(temp_path, "wb") as segment_file:
+			segment_file.write(self.num_columns.to_bytes(config.BYTES_PER_INT, "big"))
+			segment_file.write(self.pages_per_segment.to_bytes(config.BYTES_PER_INT, "big"))
+			segment_file.truncate(self.size) # the page table and the slots are all zeros
+		os.replace(temp_path, path)
+
+	# makes sure an existing segment file was written with this layout. pages_per_segment decides where every slot is,
+	# so a segment written with a different PAGES_PER_PAGERANGE would be read from the wrong offsets
+	def check(self, path: str) -> None:
+		with open(path, "rb") as segment_file:
+			header = segment_file.read(config.byte_position.segment.PAGE_TABLE)
+		num_columns = int.from_bytes(header[config.byte_position.segment.NUM_COLUMNS:config.byte_position.segment.PAGES_PER_SEGMENT], "big")
+		pages_per_segment = int.from_bytes(header[config.byte_position.segment.PAGES_PER_SEGMENT:config.byte_position.segment.PAGE_TABLE], "big")
+		if num_columns != self.num_columns or pages_per_segment != self.pages_per_segment:
+			raise(Exception(f"segment file {path} holds {pages_per_segment} pages of {num_columns} columns per page type, but the table expects {self.pages_per_segment} pages of {self.num_columns} columns (was PAGES_PER_PAGERANGE changed?)"))
@@ -0,0 +1,273 @@
+from __future__ import annotations
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, Literal, NamedTuple
+
+from lstore.config import config
+
+# kinds of log record
+WAL_INSERT = 1 # a new base or tail record: every column of the record at its offset
+WAL_WRITE = 2 # some columns of an existing record changed in place (indirection, schema encoding, null column, ...)
+
+FSYNC_POLICIES = ("commit", "interval", "never")
+
+class WalRecord(NamedTuple):
+	lsn: int
+	kind: int
+	table: str
+	page_type: Literal["base", "tail"]
+	page_id: int
+	metadata_page_id: int
+	offset: int
+	rid: int # the record's RID (or TID) for inserts; 0 if the writer didn't know it
+	values: list[tuple[int, int]] # (raw column index, value written)
+
+
+# A write-ahead log shared by all tables of a database. Every change to a page goes into the log before the page can
+# reach disk, so after a crash the changes can be redone from the log (physiological redo: each record names the
+# page, the offset and the column values written there).
+# Records are appended to an in-memory buffer under `lock` and written out in batches. How durable a commit is depends
+# on `fsync_policy`:
+#	"commit": Database queries wait in commit() until their records are fsynced. Queries committing at the same time
+#		share an fsync (group commit): one of them writes and syncs everything buffered so far while the others wait.
+#	"interval": a flusher thread writes and fsyncs the buffer every `fsync_interval` seconds; commit() doesn't wait,
+#		so a crash loses at most the last interval.
+#	"never": records are written to the OS when the buffer fills or a page needs them, and never fsynced.
+# Whatever the policy, flush(lsn) makes sure records up to lsn are written before a page stamped with lsn is written
+# (see Bufferpool.write_back_partition).
+# The log is a directory of segment files named after the first LSN they hold. each record is framed with its length
+# and a CRC32, so a torn write at the end of the last segment is detected and cut off when the log is opened again.
+# A checkpoint (see Database.checkpoint) records the LSN redo has to start from in the "checkpoint" file, starts a new
+# segment and deletes the segments that only hold older records.
+class WriteAheadLog:
+	HEADER = struct.Struct(">II") # payload length, crc32 of the payload
+	RECORD = struct.Struct(">QBBQQQQH") # lsn, kind, page type, page id, metadata page id, offset, rid, number of values
+	VALUE = struct.Struct(">BQ") # raw column index, value
+	NAME_LENGTH = struct.Struct(">H")
+	LSN = struct.Struct(">Q") # the start of RECORD
+
+	def __init__(self, directory: str, fsync_policy: str = config.WAL_FSYNC_POLICY, fsync_interval: float = config.WAL_FSYNC_INTERVAL, buffer_size: int = config.WAL_BUFFER_SIZE) -> None:
+		if fsync_policy not in FSYNC_POLICIES:
+			raise(Exception(f"unknown WAL fsync policy {fsync_policy}; expected one of {', '.join(FSYNC_POLICIES)}"))
+		self.directory = directory
+		self.fsync_policy = fsync_policy
+		self.fsync_interval = fsync_interval
+		self.buffer_size = buffer_size
+		os.makedirs(directory, exist_ok=True)
+		self.lock = threading.Lock()
+		self.flushed = threading.Condition(self.lock) # notified whenever a batch has been written
+		self.buffer: list[bytes] = []
+		self.buffered_bytes = 0
+		self.flushing = False # a thread is writing a batch; others wait for it instead of writing themselves
+		self.thread_state = threading.local() # the last LSN each thread logged, for commit()
+		self.fsyncs = 0
+		self.records_logged = 0
+
+		segments = WriteAheadLog.segments(directory)
+		last_lsn = 0
+		if len(segments) > 0:
+			last_path = os.path.join(directory, segments[-1])
+			end = 0
+			for payload, record_end in WriteAheadLog.read_payloads(last_path): # only the LSNs are needed, so skip decoding
+				(last_lsn,), end = WriteAheadLog.LSN.unpack_from(payload, 0), record_end
+			if last_lsn == 0:
+				last_lsn = int(segments[-1].split(".")[0]) - 1 # an empty segment starts at the next LSN
+			if end < os.path.getsize(last_path):
+				os.truncate(last_path, end) # drop a record that was only partly written when the database stopped
+			self.segment_path = last_path
+		else:
+			self.segment_path = os.path.join(directory, WriteAheadLog.segment_name(1))
+		self.next_lsn = last_lsn + 1
+		self.durable_lsn = last_lsn # every record up to here is as durable as the policy makes it
+		self.fd = os.open(self.segment_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+
+		self.stop_event = threading.Event()
+		self.flusher: threading.Thread | None = None
+		if fsync_policy == "interval":
+			self.flusher = threading.Thread(target=self.flush_periodically, name="wal-flusher", daemon=True)
+			self.flusher.start()
+
+	CHECKPOINT_FILE = "checkpoint"
+
+	@staticmethod
+	def segment_name(first_lsn: int) -> str:
+		return f"{first_lsn:020d}.wal"
+
+	# the segment file names in the directory, oldest first
+	@staticmethod
+	def segments(directory: str) -> list[str]:
+		if not os.path.isdir(directory):
+			return []
+		return sorted(name for name in os.listdir(directory) if name.endswith(".wal"))
+
+	@staticmethod
+	def encode(lsn: int, kind: int, table: str, page_type: Literal["base", "tail"], page_id: int, metadata_page_id: int, offset: int, rid: int, values: list[tuple[int, int]]) -> bytes:
+		name = table.encode()
+		payload = b"".join([
+			WriteAheadLog.RECORD.pack(lsn, kind, 0 if page_type == "base" else 1, page_id, metadata_page_id, offset, rid, len(values)),
+			WriteAheadLog.NAME_LENGTH.pack(len(name)), name,
+			*[WriteAheadLog.VALUE.pack(raw_idx, value) for raw_idx, value in values],
+		])
+		return WriteAheadLog.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+	@staticmethod
+	def decode(payload: bytes) -> WalRecord:
+		lsn, kind, page_type, page_id, metadata_page_id, offset, rid, num_values = WriteAheadLog.RECORD.unpack_from(payload, 0)
+		position = WriteAheadLog.RECORD.size
+		(name_length,) = WriteAheadLog.NAME_LENGTH.unpack_from(payload, position)
+		position += WriteAheadLog.NAME_LENGTH.size
+		table = payload[position:position + name_length].decode()
+		position += name_length
+		values = list(WriteAheadLog.VALUE.iter_unpack(memoryview(payload)[position:position + num_values * WriteAheadLog.VALUE.size]))
+		return WalRecord(lsn, kind, table, "base" if page_type == 0 else "tail", page_id, metadata_page_id, offset, rid, values)
+
+	# yields the payloads of the complete records of a segment file, with the position just past each one.
+	# stops at the first record that is cut off or doesn't match its checksum
+	@staticmethod
+	def read_payloads(path: str) -> Iterator[tuple[bytes, int]]:
+		with open(path, "rb") as segment_file:
+			data = segment_file.read()
+		position = 0
+		while position + WriteAheadLog.HEADER.size <= len(data):
+			length, crc = WriteAheadLog.HEADER.unpack_from(data, position)
+			start = position + WriteAheadLog.HEADER.size
+			payload = data[start:start + length]
+			if len(payload) < length or zlib.crc32(payload) != crc:
+				return
+			position = start + length
+			yield payload, position
+
+	# like read_payloads, with the records decoded
+	@staticmethod
+	def read_segment(path: str) -> Iterator[tuple[WalRecord, int]]:
+		for payload, position in WriteAheadLog.read_payloads(path):
+			yield WriteAheadLog.decode(payload), position
+
+	# every record in the log with an LSN of at least from_lsn, in LSN order
+	@staticmethod
+	def read_records(directory: str, from_lsn: int = 0) -> Iterator[WalRecord]:
+		for name in WriteAheadLog.segments(directory):
+			for record, _ in WriteAheadLog.read_segment(os.path.join(directory, name)):
+				if record.lsn >= from_lsn:
+					yield record
+
+	# adds a record to the log buffer and returns its LSN
+	def append(self, kind: int, table: str, page_type: Literal["base", "tail"], page_id: int, metadata_page_id: int, offset: int, rid: int, values: list[tuple[int, int]]) -> int:
+		with self.lock:
+			lsn = self.next_lsn
+			self.next_lsn += 1
+			record = WriteAheadLog.encode(lsn, kind, table, page_type, page_id, metadata_page_id, offset, rid, values)
+			self.buffer.append(record)
+			self.buffered_bytes += len(record)
+			self.records_logged += 1
+			buffer_full = self.buffered_bytes >= self.buffer_size
+		self.thread_state.last_lsn = lsn
+		if buffer_full and self.fsync_policy != "commit":
+			self.flush(lsn)
+		return lsn
+
+	# called when a query finishes: with the "commit" policy, waits until everything the thread logged is durable
+	def commit(self) -> None:
+		if self.fsync_policy == "commit":
+			self.flush(getattr(self.thread_state, "last_lsn", 0))
+
+	# makes every record up to lsn durable (only written, with the "never" policy).
+	# if another thread is already writing, waits for it: its batch may well include lsn (group commit)
+	def flush(self, lsn: int | None = None) -> None:
+		with self.lock:
+			if lsn is None:
+				lsn = self.next_lsn - 1
+			while self.durable_lsn < lsn and self.flushing:
+				self.flushed.wait()
+			if self.durable_lsn >= lsn:
+				return
+			self.flushing = True
+			batch, self.buffer, self.buffered_bytes = self.buffer, [], 0
+			batch_lsn = self.next_lsn - 1
+		written_batch = False
+		try:
+			self.write_out(batch, self.fsync_policy != "never")
+			written_batch = True
+		finally:
+			with self.lock:
+				self.flushing = False
+				if written_batch:
+					self.durable_lsn = max(self.durable_lsn, batch_lsn)
+				self.flushed.notify_all()
+
+	# writes a batch of records to the current segment. only the thread that set `flushing` calls this
+	def write_out(self, batch: list[bytes], sync: bool) -> None:
+		data = b"".join(batch)
+		written = 0
+		while written < len(data):
+			written += os.write(self.fd, data[written:])
+		if sync:
+			os.fsync(self.fd)
+			self.fsyncs += 1
+
+	# the LSN the next record will get. every record logged before this call has a smaller one
+	def current_lsn(self) -> int:
+		with self.lock:
+			return self.next_lsn
+
+	# the LSN recovery starts redoing from, as recorded by the last checkpoint (1, the start of the log, if there wasn't one)
+	@staticmethod
+	def read_checkpoint(directory: str) -> int:
+		path = os.path.join(directory, WriteAheadLog.CHECKPOINT_FILE)
+		if not os.path.isfile(path):
+			return 1
+		with open(path, "rb") as checkpoint_file:
+			return int.from_bytes(checkpoint_file.read(config.BYTES_PER_INT), "big")
+
+	# finishes a checkpoint: every change logged before redo_lsn is in the page files, so recovery can start there.
+	# the checkpoint file is replaced atomically, then the log moves to a new segment and the old ones are deleted
+	def checkpoint(self, redo_lsn: int) -> None:
+		path = os.path.join(self.directory, WriteAheadLog.CHECKPOINT_FILE)
+		with open(path + ".tmp", "wb") as checkpoint_file:
+			checkpoint_file.write(redo_lsn.to_bytes(config.BYTES_PER_INT, "big"))
+			checkpoint_file.flush()
+			os.fsync(checkpoint_file.fileno())
+		os.replace(path + ".tmp", path)
+		self.rotate()
+		segments = WriteAheadLog.segments(self.directory)
+		for name, next_name in zip(segments, segments[1:]):
+			if int(next_name.split(".")[0]) <= redo_lsn: # the next segment starts at or before redo_lsn, so this one is all older
+				os.remove(os.path.join(self.directory, name))
+
+	# writes out the buffer and continues the log in a new segment
+	def rotate(self) -> None:
+		with self.lock:
+			while self.flushing:
+				self.flushed.wait()
+			self.flushing = True
+			batch, self.buffer, self.buffered_bytes = self.buffer, [], 0
+			batch_lsn = self.next_lsn - 1
+		written_batch = False
+		try:
+			self.write_out(batch, True)
+			new_path = os.path.join(self.directory, WriteAheadLog.segment_name(batch_lsn + 1))
+			if new_path != self.segment_path:
+				new_fd = os.open(new_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+				os.close(self.fd)
+				self.fd, self.segment_path = new_fd, new_path
+			written_batch = True
+		finally:
+			with self.lock:
+				self.flushing = False
+				if written_batch:
+					self.durable_lsn = max(self.durable_lsn, batch_lsn)
+				self.flushed.notify_all()
+
+	def flush_periodically(self) -> None:
+		while not self.stop_event.wait(self.fsync_interval):
+			self.flush()
+
+	def close(self) -> None:
+		self.stop_event.set()
+		if self.flusher is not None:
+			self.flusher.join()
+			self.flusher = None
+		self.flush()
+		os.close(self.fd)
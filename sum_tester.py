@@ -0,0 +1,34 @@
+from lstore.db import Database
+from lstore.query import Query
+
+import shutil
+import tempfile
+
+# checks that sum is exact when the total doesn't fit in 64 bits. a wide range is summed by scanning the base pages
+# (sum_by_scan), a narrow one key by key; both have to agree with the exact total
+
+number_of_records = 600
+large_value = 2 ** 62
+
+path = tempfile.mkdtemp()
+db = Database()
+db.open(path)
+table = db.create_table('Large', 2, 0)
+query = Query(table)
+for key in range(number_of_records):
+    query.insert(key, large_value)
+
+total = query.sum(0, number_of_records - 1, 1)
+assert total == number_of_records * large_value, f"sum of all records was {total}"
+total = query.sum(10, 14, 1)
+assert total == 5 * large_value, f"sum of 5 records was {total}"
+
+# updated records are summed from their tail records
+for key in range(0, number_of_records, 3):
+    query.update(key, None, large_value + 1)
+total = query.sum(0, number_of_records - 1, 1)
+assert total == number_of_records * large_value + number_of_records // 3, f"sum after updates was {total}"
+print("large values passed")
+
+db.close()
+shutil.rmtree(path)